@@ -14,3 +14,9 @@ ATTACK_TYPE_DICT = {
     EMOJI_MAGIC: AttackType.MAGIC,
     EMOJI_CARRYOVER: AttackType.CARRYOVER
 }
+
+ATTACK_TYPE_NAMES = {
+    AttackType.PHYSICS: "物理",
+    AttackType.MAGIC: "魔法",
+    AttackType.CARRYOVER: "持ち越し"
+}
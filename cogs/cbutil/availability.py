@@ -0,0 +1,112 @@
+from typing import Dict, List, Tuple
+
+from cogs.cbutil.util import LIMIT_TIME_HOURS, LIMIT_TIME_START_HOUR
+
+
+def popcount(bits: int) -> int:
+    return bin(bits).count("1")
+
+
+def get_hour_index(hour: int) -> int:
+    """時刻(0-23時)から行列の列番号を取得する"""
+    return (hour - LIMIT_TIME_START_HOUR) % LIMIT_TIME_HOURS
+
+
+class AvailabilityMatrix():
+    """1日分の参戦可能時間を メンバー×時間 のビット行列として保持する
+
+    行(メンバーごとの時間ビットマスク)と列(時間ごとのメンバービットセット)の両方を保持し、
+    時間ごとの集計をビット演算だけで行えるようにする。
+    """
+
+    def __init__(self) -> None:
+        self.user_ids: List[int] = []  # 行番号 -> user_id
+        self.row_indexes: Dict[int, int] = {}  # user_id -> 行番号
+        self.rows: Dict[int, int] = {}  # user_id -> 時間ビットマスク
+        self.columns: List[int] = [0] * LIMIT_TIME_HOURS  # 列番号 -> 行ビットセット
+
+    def set(self, user_id: int, limit_time: int) -> None:
+        """メンバーの参戦可能時間を設定する。既に設定されている場合は上書きする"""
+        if user_id not in self.row_indexes:
+            self.row_indexes[user_id] = len(self.user_ids)
+            self.user_ids.append(user_id)
+        row_bit = 1 << self.row_indexes[user_id]
+        old_limit_time = self.rows.get(user_id, 0)
+        for i in range(LIMIT_TIME_HOURS):
+            if (old_limit_time ^ limit_time) >> i & 1:
+                self.columns[i] ^= row_bit
+        self.rows[user_id] = limit_time
+
+    def get(self, user_id: int) -> int:
+        return self.rows.get(user_id, 0)
+
+    def create_row_bitset(self, user_ids) -> int:
+        """user_idの集合を行ビットセットに変換する"""
+        bitset = 0
+        for user_id in user_ids:
+            if (row_index := self.row_indexes.get(user_id)) is not None:
+                bitset |= 1 << row_index
+        return bitset
+
+    def get_user_ids(self, row_bitset: int) -> List[int]:
+        return [user_id for i, user_id in enumerate(self.user_ids) if row_bitset >> i & 1]
+
+    def available_between(self, start_hour: int, end_hour: int, row_bitset: int = -1) -> int:
+        """start_hour時からend_hour時までのいずれかで参戦可能なメンバーの行ビットセットを返す
+
+        時刻は5時から29時までの通し表記で指定する。
+        """
+        bitset = 0
+        for hour in range(start_hour, end_hour):
+            bitset |= self.columns[hour - LIMIT_TIME_START_HOUR]
+        return bitset & row_bitset
+
+
+class RemainAttackAvailability():
+    """残凸数ごとの行ビットセットを使って、時間ごとの残凸数を集計する"""
+
+    def __init__(self, matrix: AvailabilityMatrix, remain_attacks: Dict[int, int]) -> None:
+        """
+        Parameters
+        ----------
+        matrix : AvailabilityMatrix
+            集計する日の参戦可能時間
+        remain_attacks : Dict[int, int]
+            user_id -> 残凸数
+        """
+        self.matrix = matrix
+        # remain_bitsets[k]: 残凸数がkのメンバーの行ビットセット
+        self.remain_bitsets: List[int] = [0, 0, 0, 0]
+        for user_id, remain_attack in remain_attacks.items():
+            if (row_index := matrix.row_indexes.get(user_id)) is not None and 0 < remain_attack <= 3:
+                self.remain_bitsets[remain_attack] |= 1 << row_index
+        self.attackers = self.remain_bitsets[1] | self.remain_bitsets[2] | self.remain_bitsets[3]
+
+    def remain_attack_count(self, hour_index: int) -> int:
+        """その時間に参戦可能なメンバーの残凸数の合計"""
+        column = self.matrix.columns[hour_index]
+        return sum(k * popcount(column & self.remain_bitsets[k]) for k in range(1, 4))
+
+    def remain_attack_counts(self) -> List[int]:
+        return [self.remain_attack_count(i) for i in range(LIMIT_TIME_HOURS)]
+
+    def attacker_count(self, hour_index: int) -> int:
+        """その時間に参戦可能な残凸のあるメンバー数"""
+        return popcount(self.matrix.columns[hour_index] & self.attackers)
+
+    def available_attackers(self, hour_index: int) -> List[int]:
+        """その時間に参戦可能な残凸のあるメンバーのuser_id"""
+        return self.matrix.get_user_ids(self.matrix.columns[hour_index] & self.attackers)
+
+    def coverage_gaps(self, from_hour_index: int = 0) -> List[Tuple[int, int]]:
+        """残凸のあるメンバーが誰も参戦できない時間帯を (開始時, 終了時) のリストで返す"""
+        gaps = []
+        start = None
+        for i in range(from_hour_index, LIMIT_TIME_HOURS + 1):
+            if i < LIMIT_TIME_HOURS and self.attackers and not self.matrix.columns[i] & self.attackers:
+                if start is None:
+                    start = i
+            elif start is not None:
+                gaps.append((start + LIMIT_TIME_START_HOUR, i + LIMIT_TIME_START_HOUR))
+                start = None
+        return gaps
@@ -3,6 +3,7 @@ from typing import List, Optional
 
 from cogs.cbutil.attack_type import AttackType
 from cogs.cbutil.clan_battle_data import ClanBattleData
+from cogs.cbutil.hp_profile import HpProfile
 from cogs.cbutil.player_data import PlayerData
 from cogs.cbutil.util import calc_carry_over_time
 from setup import JST
@@ -41,9 +42,9 @@ class AttackStatus():
 
 
 class BossStatusData():
-    def __init__(self, lap: int, boss_index: int) -> None:
+    def __init__(self, lap: int, boss_index: int, hp_profile: Optional[HpProfile] = None) -> None:
         self.lap: int = lap
-        self.max_hp: int = ClanBattleData.get_hp(lap, boss_index)
+        self.max_hp: int = (hp_profile or ClanBattleData.profile).get_hp(lap, boss_index)
         self.attack_players: List[AttackStatus] = []
         self.beated: bool = False
 
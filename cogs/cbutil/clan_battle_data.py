@@ -1,10 +1,25 @@
 import asyncio
-from datetime import datetime
-from typing import List, Tuple
+import json
+import os
+from datetime import datetime, timedelta
+from logging import getLogger
+from typing import List, Optional, Tuple
 
+from cogs.cbutil.hp_profile import HpProfile
+from cogs.cbutil.http_client import http_client
+from cogs.cbutil.rate_limit import RateLimiter
 from cogs.cbutil.util import get_from_web_api
 from setup import BASE_URL, JST
 
+logger = getLogger(__name__)
+
+CLAN_BATTLE_DATA_CACHE_PATH = "clan_battle_data.json"
+CLAN_BATTLE_DATA_CONCURRENCY = 4  # ボスのデータを同時に取得する数
+CLAN_BATTLE_DATA_RATE = 4  # 1秒あたりのリクエスト数の上限
+CLAN_BATTLE_DATA_RETRY_INTERVAL = timedelta(hours=6)  # 開催終了後に次回のデータを確認する間隔
+CLAN_BATTLE_DATA_BACKOFF_MIN = 60
+CLAN_BATTLE_DATA_BACKOFF_MAX = 3600
+
 
 class ClanBattleData:
     boss_names: List[str] = ["1ボス", "2ボス", "3ボス", "4ボス", "5ボス"]
@@ -14,38 +29,58 @@ class ClanBattleData:
         [116000, 120000, 124000, 128000, 132000],
     ]
     boudaries: List[Tuple[int]] = [(1, 6), (7, 22), (23, -1)]
-    start_time: datetime = datetime.now()
-    end_time: datetime = datetime.now()
-    next_start: datetime = datetime.now()
+    start_time: datetime = datetime.now(JST)
+    end_time: datetime = datetime.now(JST)
+    next_start: datetime = datetime.now(JST)
+    fetched: Optional[datetime] = None  # データを取得した日時
+    profile: HpProfile
 
     @staticmethod
     def get_hp(lap: int, boss_index: int) -> int:
-        for i, (lap_from, lap_to) in enumerate(ClanBattleData.boudaries):
-            if lap_from <= lap <= lap_to or (lap_from <= lap and lap_to == -1):
-                return ClanBattleData.hp[i][boss_index]
-        return ClanBattleData.hp[-1][boss_index]
+        return ClanBattleData.profile.get_hp(lap, boss_index)
+
+    @staticmethod
+    def update_profile() -> None:
+        """hpとboudariesからHPの表を作り直して差し替える"""
+        ClanBattleData.profile = HpProfile(
+            ClanBattleData.hp, ClanBattleData.boudaries, ClanBattleData.start_time.isoformat())
 
     @staticmethod
-    def set_hp(lap_group: int, boss_index: int, value: int):
-        """
-        lap_group: int, 0=1-6周, 1=7-22周, 2=23周以降
-        boss_index: int, 0-4
-        value: int, 新的hp值
-        """
-        if 0 <= lap_group < len(ClanBattleData.hp) and 0 <= boss_index < len(ClanBattleData.hp[lap_group]):
-            ClanBattleData.hp[lap_group][boss_index] = value
+    def get_day(now: datetime) -> Optional[int]:
+        """クランバトルの何日目かを取得する。開催期間外の場合はNoneを返す"""
+        if ClanBattleData.start_time <= now <= ClanBattleData.end_time:
+            return (now - ClanBattleData.start_time).days + 1
+        return None
+
+
+ClanBattleData.profile = HpProfile(ClanBattleData.hp, ClanBattleData.boudaries)
+
+
+def parse_api_datetime(txt: str) -> datetime:
+    return datetime.strptime(txt, "%Y/%m/%d %H:%M:%S").replace(tzinfo=JST)
 
 
 async def get_clan_battle_data() -> None:
     clan_battle_abstract = await get_from_web_api(BASE_URL + "clanbattles/latest")
+    semaphore = asyncio.Semaphore(CLAN_BATTLE_DATA_CONCURRENCY)
+    rate_limiter = RateLimiter(CLAN_BATTLE_DATA_RATE)
+
+    async def get_boss_data(boss_id: int) -> dict:
+        async with semaphore:
+            await rate_limiter.wait()
+            return await get_from_web_api(BASE_URL + f"enemies/{boss_id}")
+
+    boss_ids = list(dict.fromkeys(
+        boss_id for map in clan_battle_abstract["maps"] for boss_id in map["boss_ids"]))
+    boss_data_dict = dict(zip(boss_ids, await asyncio.gather(*[get_boss_data(boss_id) for boss_id in boss_ids])))
+
     hp_list = []
     boundaries = []
     icons = []
     for i, map in enumerate(clan_battle_abstract["maps"]):
         hp_list_in_level = []
         for id in map["boss_ids"]:
-            await asyncio.sleep(0.5)
-            boss_data = await get_from_web_api(BASE_URL + f"enemies/{id}")
+            boss_data = boss_data_dict[id]
             hp_list_in_level.append(int(boss_data["parameter"]["hp"] // 10000))
             if i == 0:
                 icons.append(boss_data["unit"]["icon"])
@@ -55,22 +90,90 @@ async def get_clan_battle_data() -> None:
     ClanBattleData.hp = hp_list
     ClanBattleData.boudaries = boundaries
     # ClanBattleData.icon = icons
-    ClanBattleData.start_time = datetime.strptime(
-        clan_battle_abstract["start_time"], "%Y/%m/%d %H:%M:%S"
-    ).astimezone(JST)
-    ClanBattleData.end_time = datetime.strptime(
-        clan_battle_abstract["end_time"], "%Y/%m/%d %H:%M:%S"
-    ).astimezone(JST)
-    ClanBattleData.next_start = datetime.strptime(
-        clan_battle_abstract["interval_end"], "%Y/%m/%d %H:%M:%S"
-    ).astimezone(JST)
-
-
-async def update_clanbattledata():
-    while True:
-        if (
-            datetime.now(JST).strftime("%H:%M") == "04:59"
-            or not ClanBattleData.boss_names
-        ):
-            await get_clan_battle_data()
-        await asyncio.sleep(60)
+    ClanBattleData.start_time = parse_api_datetime(clan_battle_abstract["start_time"])
+    ClanBattleData.end_time = parse_api_datetime(clan_battle_abstract["end_time"])
+    ClanBattleData.next_start = parse_api_datetime(clan_battle_abstract["interval_end"])
+    ClanBattleData.fetched = datetime.now(JST)
+    ClanBattleData.update_profile()
+    logger.info(f"clan battle data updated: http={http_client.metrics.summary()}")
+
+
+def save_clan_battle_data_cache() -> None:
+    """最後に取得できたクランバトルのデータをファイルに保存する"""
+    cache = {
+        "boss_names": ClanBattleData.boss_names,
+        "hp": ClanBattleData.hp,
+        "boudaries": ClanBattleData.boudaries,
+        "start_time": ClanBattleData.start_time.isoformat(),
+        "end_time": ClanBattleData.end_time.isoformat(),
+        "next_start": ClanBattleData.next_start.isoformat(),
+        "fetched": ClanBattleData.fetched.isoformat(),
+    }
+    tmp_path = CLAN_BATTLE_DATA_CACHE_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False)
+    os.replace(tmp_path, CLAN_BATTLE_DATA_CACHE_PATH)
+
+
+def load_clan_battle_data_cache() -> bool:
+    """保存してあるクランバトルのデータを読み込む。読み込めたかどうかを返す"""
+    try:
+        with open(CLAN_BATTLE_DATA_CACHE_PATH, encoding="utf-8") as f:
+            cache = json.load(f)
+    except FileNotFoundError:
+        return False
+    except (OSError, ValueError) as e:
+        logger.warning(f"failed to load clan battle data cache: {e}")
+        return False
+    ClanBattleData.boss_names = cache["boss_names"]
+    ClanBattleData.hp = cache["hp"]
+    ClanBattleData.boudaries = [tuple(boundary) for boundary in cache["boudaries"]]
+    ClanBattleData.start_time = datetime.fromisoformat(cache["start_time"])
+    ClanBattleData.end_time = datetime.fromisoformat(cache["end_time"])
+    ClanBattleData.next_start = datetime.fromisoformat(cache["next_start"])
+    ClanBattleData.fetched = datetime.fromisoformat(cache["fetched"])
+    ClanBattleData.update_profile()
+    return True
+
+
+class ClanBattleDataService():
+    """クランバトルのデータを必要な時だけ更新する
+
+    開催期間中はボスのデータが変わらないため取得しない。
+    開催終了後は次回のデータが取得できるまで一定間隔で取得を試みる。
+    """
+
+    def needs_refresh(self, now: datetime) -> bool:
+        if ClanBattleData.fetched is None:
+            return True
+        if now <= ClanBattleData.end_time:
+            return False
+        return now - ClanBattleData.fetched >= CLAN_BATTLE_DATA_RETRY_INTERVAL
+
+    def get_next_check(self, now: datetime) -> timedelta:
+        if now < ClanBattleData.end_time:
+            wait = ClanBattleData.end_time - now + timedelta(minutes=1)
+        elif now < ClanBattleData.next_start:
+            wait = min(CLAN_BATTLE_DATA_RETRY_INTERVAL, ClanBattleData.next_start - now + timedelta(minutes=1))
+        else:
+            wait = CLAN_BATTLE_DATA_RETRY_INTERVAL
+        return min(wait, timedelta(days=1))
+
+    async def run(self) -> None:
+        backoff = CLAN_BATTLE_DATA_BACKOFF_MIN
+        while True:
+            try:
+                now = datetime.now(JST)
+                if self.needs_refresh(now):
+                    await get_clan_battle_data()
+                    save_clan_battle_data_cache()
+                backoff = CLAN_BATTLE_DATA_BACKOFF_MIN
+                wait = self.get_next_check(datetime.now(JST))
+                logger.info(f"next clan battle data check in {wait}")
+                await asyncio.sleep(wait.total_seconds())
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(f"failed to update clan battle data. retry in {backoff}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, CLAN_BATTLE_DATA_BACKOFF_MAX)
@@ -1,8 +1,12 @@
 import datetime
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Set, Tuple
 
+from cogs.cbutil.availability import AvailabilityMatrix
 from cogs.cbutil.boss_status_data import BossStatusData
+from cogs.cbutil.clan_battle_data import ClanBattleData
+from cogs.cbutil.damage_stats import DamageStat, DamageStatKey
 from cogs.cbutil.form_data import FormData
+from cogs.cbutil.hp_profile import HpProfile
 from cogs.cbutil.player_data import PlayerData
 from cogs.cbutil.reserve_data import ReserveData
 from setup import JST
@@ -38,13 +42,50 @@ class ClanData():
 
         self.date: str = (datetime.datetime.now(JST) - datetime.timedelta(hours=5)).date()
         self.form_data = FormData()
+        self.availability: Dict[int, AvailabilityMatrix] = {}  # 何日目 -> 参戦可能時間
+        self.availability_day: int = 0  # 最後に読み込んだ日
 
         self.summary_channel_id: int = summary_channel_id
-        self.summary_message_ids: Dict[int, List[int]] = {}
+        self.summary_message_ids: Dict[int, int] = {}  # 周回数 -> まとめチャンネルのメッセージID
+        self.hp_profile: Optional[HpProfile] = None  # クラン独自に設定したHP
+        self.attack_version: int = 0  # 凸状況が変わるたびに増やす (予測のキャッシュに使う)
+        self.damage_stats: Dict[DamageStatKey, DamageStat] = {}  # 日をまたいで残すダメージの集計
+
+    def get_hp_profile(self) -> HpProfile:
+        """クラン独自のHPが今回のクランバトルのものであればそれを、そうでなければ共通のHPを返す"""
+        if self.hp_profile is not None and self.hp_profile.season == ClanBattleData.profile.season:
+            return self.hp_profile
+        return ClanBattleData.profile
+
+    def get_boss_progress(self) -> List[Tuple[int, int, Set[int]]]:
+        """ボスごとの現在の周回と残りHP、その周回で凸済みのuser_idを取得する"""
+        hp_profile = self.get_hp_profile()
+        progress = []
+        for boss_index in range(5):
+            lap = self.get_latest_lap(boss_index) if self.progress_message_ids else 1
+            boss_status_data = self.boss_status_data.get(lap, [None] * 5)[boss_index]
+            if boss_status_data is None:
+                progress.append((lap, hp_profile.get_hp(lap, boss_index), set()))
+            elif boss_status_data.beated:
+                progress.append((lap + 1, hp_profile.get_hp(lap + 1, boss_index), set()))
+            else:
+                attacked_list = [
+                    attack_status for attack_status in boss_status_data.attack_players if attack_status.attacked
+                ]
+                progress.append((
+                    lap,
+                    boss_status_data.max_hp - sum(attack_status.damage for attack_status in attacked_list),
+                    {attack_status.player_data.user_id for attack_status in attacked_list}
+                ))
+        return progress
+
+    def get_damage_stat_key(self, user_id: int, boss_index: int, lap: int) -> DamageStatKey:
+        return user_id, boss_index, self.get_hp_profile().get_tier(lap)
 
     def initialize_boss_status_data(self, lap: int):
+        hp_profile = self.get_hp_profile()
         self.boss_status_data[lap] = [
-            BossStatusData(lap, i) for i in range(5)
+            BossStatusData(lap, i, hp_profile) for i in range(5)
         ]
 
     def get_reserve_boss_index(self, message_id: int) -> Optional[int]:
@@ -0,0 +1,24 @@
+import datetime
+from typing import Dict, List, Optional, Tuple
+
+
+class DailyReport():
+    """1日分のクランバトルの結果"""
+
+    def __init__(self, category_id: int, date: datetime.date) -> None:
+        self.category_id = category_id
+        self.date = date
+        self.attack_count: int = 0  # 消化した凸数 (持ち越しを除く)
+        self.carry_over_attack_count: int = 0
+        self.boss_damages: Dict[int, Tuple[int, int]] = {}  # ボスのindex -> (凸数, 合計ダメージ)
+        self.beated_count: int = 0
+        self.first_lap: Optional[int] = None  # 討伐したボスの最初と最後の周回
+        self.last_lap: Optional[int] = None
+        self.missed_attacks: List[Tuple[int, int]] = []  # (user_id, 残凸数)
+        self.wasted_carry_overs: List[Tuple[int, int]] = []  # (user_id, 使わなかった持ち越しの数)
+
+
+def get_day_range(date: datetime.date, tz: datetime.tzinfo) -> Tuple[datetime.datetime, datetime.datetime]:
+    """日付が切り替わる5時を区切りにした1日の範囲"""
+    start = datetime.datetime.combine(date, datetime.time(5), tz)
+    return start, start + datetime.timedelta(days=1)
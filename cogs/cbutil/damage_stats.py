@@ -0,0 +1,74 @@
+import math
+from statistics import NormalDist
+from typing import Dict, Optional, Tuple
+
+DamageStatKey = Tuple[int, int, int]  # (user_id, ボスのindex, 段階)
+
+
+class DamageStat():
+    """1人の1ボス・1段階へのダメージの集計
+
+    件数・合計・二乗和を持っておくことで、平均や分散をO(1)で求められる。
+    取り消し時は件数・合計・二乗和を戻すが、最小値・最大値は戻せないためそのままにする。
+    """
+
+    def __init__(
+        self, count: int = 0, total: int = 0, total_sq: int = 0,
+        min_damage: Optional[int] = None, max_damage: Optional[int] = None
+    ) -> None:
+        self.count = count
+        self.total = total
+        self.total_sq = total_sq
+        self.min_damage = min_damage
+        self.max_damage = max_damage
+
+    def add(self, damage: int) -> None:
+        self.count += 1
+        self.total += damage
+        self.total_sq += damage * damage
+        self.min_damage = damage if self.min_damage is None else min(self.min_damage, damage)
+        self.max_damage = damage if self.max_damage is None else max(self.max_damage, damage)
+
+    def remove(self, damage: int) -> None:
+        self.count -= 1
+        self.total -= damage
+        self.total_sq -= damage * damage
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count
+
+    @property
+    def std(self) -> float:
+        variance = self.total_sq / self.count - self.mean ** 2
+        return math.sqrt(max(variance, 0))
+
+    def percentile(self, p: float) -> int:
+        """正規分布で近似したpパーセンタイルのダメージ。最小値から最大値の範囲に収める"""
+        if self.count < 2 or self.std == 0:
+            return round(self.mean)
+        value = NormalDist(self.mean, self.std).inv_cdf(p / 100)
+        return round(min(max(value, self.min_damage), self.max_damage))
+
+
+def record_damage(
+    damage_stats: Dict[DamageStatKey, DamageStat], key: DamageStatKey, damage: int
+) -> DamageStat:
+    """凸のダメージを集計に加えて、更新した集計を返す"""
+    damage_stat = damage_stats.setdefault(key, DamageStat())
+    damage_stat.add(damage)
+    return damage_stat
+
+
+def revert_damage(
+    damage_stats: Dict[DamageStatKey, DamageStat], key: DamageStatKey, damage: int
+) -> Optional[DamageStat]:
+    """取り消した凸のダメージを集計から除く。件数が0になった場合は集計を削除してNoneを返す"""
+    damage_stat = damage_stats.get(key)
+    if damage_stat is None:
+        return None
+    damage_stat.remove(damage)
+    if damage_stat.count <= 0:
+        del damage_stats[key]
+        return None
+    return damage_stat
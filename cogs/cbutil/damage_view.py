@@ -0,0 +1,79 @@
+from typing import Awaitable, Callable, Optional, Tuple
+
+import discord
+
+from cogs.cbutil.prompt import PROMPT_TIMEOUT
+from cogs.cbutil.util import get_damage
+
+DAMAGE_ENTRY_CUSTOM_ID = "clan_battle:damage_entry"
+
+DamageCallback = Callable[[discord.Interaction, int, str], Awaitable[None]]
+
+
+class DamageModal(discord.ui.Modal, title="ダメージ入力"):
+    damage = discord.ui.TextInput(label="ダメージ (万)", placeholder="例: 1200", max_length=12)
+    memo = discord.ui.TextInput(label="コメント", placeholder="例: 60s討伐", required=False, max_length=100)
+
+    def __init__(self, on_damage: DamageCallback, default_damage: Optional[int] = None) -> None:
+        super().__init__()
+        self.on_damage = on_damage
+        if default_damage is not None:
+            self.damage.default = str(default_damage)
+
+    async def on_submit(self, interaction: discord.Interaction) -> None:
+        damage_data = get_damage(self.damage.value) if self.damage.value.strip() else None
+        if damage_data is None:
+            await interaction.response.send_message("ダメージは数値で入力してください", ephemeral=True)
+            return
+        # ダメージの欄にスペース区切りで書かれたコメントもコメントとして扱う
+        memo = " ".join(txt for txt in (damage_data[1], self.memo.value.strip()) if txt)
+        await self.on_damage(interaction, damage_data[0], memo)
+
+
+class DamageEntryView(discord.ui.View):
+    """進行用のメッセージに付けるダメージ入力ボタン
+
+    再起動後も押せるように timeout なし・custom_id 固定で bot.add_view に登録する。
+    どのボス・周回のメッセージかは押されたメッセージから判断する。
+    """
+
+    def __init__(self, on_damage: Callable[[discord.Interaction, discord.Message, int, str], Awaitable[None]]) -> None:
+        super().__init__(timeout=None)
+        self.on_damage = on_damage
+
+    @discord.ui.button(label="ダメージ入力", style=discord.ButtonStyle.primary, custom_id=DAMAGE_ENTRY_CUSTOM_ID)
+    async def enter_damage(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        message = interaction.message
+
+        async def on_damage(modal_interaction: discord.Interaction, damage: int, memo: str) -> None:
+            await self.on_damage(modal_interaction, message, damage, memo)
+        await interaction.response.send_modal(DamageModal(on_damage))
+
+
+class ReserveDamageView(discord.ui.View):
+    """予約の想定ダメージを入力してもらうボタン"""
+
+    def __init__(self, user_id: int, default_damage: Optional[int] = None, timeout: float = PROMPT_TIMEOUT) -> None:
+        super().__init__(timeout=timeout)
+        self.user_id = user_id
+        self.default_damage = default_damage  # 入力欄にあらかじめ入れておくダメージ
+        self.result: Optional[Tuple[int, str]] = None  # (ダメージ, コメント)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message("他のメンバーの予約です", ephemeral=True)
+            return False
+        return True
+
+    @discord.ui.button(label="想定ダメージを入力", style=discord.ButtonStyle.primary)
+    async def enter_damage(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        await interaction.response.send_modal(DamageModal(self._on_damage, self.default_damage))
+
+    async def _on_damage(self, interaction: discord.Interaction, damage: int, memo: str) -> None:
+        # 入力中にタイムアウトした場合、予約設定はキャンセル済み
+        if self.is_finished():
+            await interaction.response.send_message("入力の期限が過ぎたため受け付けられませんでした", ephemeral=True)
+            return
+        self.result = (damage, memo)
+        await interaction.response.send_message(f"{'{:,}'.format(damage)}万 で受け付けました", ephemeral=True)
+        self.stop()
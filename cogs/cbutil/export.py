@@ -0,0 +1,248 @@
+"""クランバトルのデータのエクスポート・インポート
+
+コマンドラインからも実行できる (Botと同じディレクトリで実行する)
+    python -m cogs.cbutil.export export --category-id 123 --format csv --out export/
+    python -m cogs.cbutil.export import --category-id 456 export/AttackStatus_1.csv ...
+"""
+import argparse
+import csv
+import datetime
+import json
+import os
+import sqlite3
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from setup import DB_NAME, JST
+
+EXPORT_BATCH_SIZE = 500  # 1回に読み込む行数
+EXPORT_CHUNK_SIZE = 8 * 1024 * 1024  # 1ファイルの大きさの上限 (Discordの添付ファイルの上限)
+EXPORT_FORMATS = ["csv", "jsonl", "parquet"]
+
+# テーブル名 -> (列名, 日付で絞り込む列)
+EXPORT_TABLES: Dict[str, Tuple[List[str], Optional[str]]] = {
+    "PlayerData": (["category_id", "user_id", "physics_attack", "magic_attack", "task_kill"], None),
+    "BossStatusData": (["category_id", "boss_index", "lap", "beated"], None),
+    "AttackStatus": ([
+        "category_id", "user_id", "lap", "boss_index", "damage", "memo",
+        "attacked", "attack_type", "carry_over", "created"
+    ], "created"),
+    "CarryOver": (["category_id", "user_id", "boss_index", "attack_type", "carry_over_time", "created"], "created"),
+}
+
+
+def iter_rows(
+    con: sqlite3.Connection, table: str, category_id: int,
+    start: Optional[datetime.datetime] = None, end: Optional[datetime.datetime] = None
+) -> Iterator[Sequence[Any]]:
+    """テーブルの行をEXPORT_BATCH_SIZE行ずつ読み込んで1行ずつ返す
+
+    日付の列があるテーブルは start <= 列 < end で絞り込む。日時は保存されている文字列のまま返す。
+    """
+    columns, date_column = EXPORT_TABLES[table]
+    sql = f"select {', '.join(columns)} from {table} where category_id=?"
+    params: List[Any] = [category_id]
+    if date_column and start:
+        sql += f" and {date_column}>=?"
+        params.append(str(start))
+    if date_column and end:
+        sql += f" and {date_column}<?"
+        params.append(str(end))
+    cur = con.execute(sql, params)
+    while rows := cur.fetchmany(EXPORT_BATCH_SIZE):
+        yield from rows
+
+
+class ChunkedWriter():
+    """行を書き込み、ファイルが大きくなったら次のファイルに切り替える"""
+
+    def __init__(self, out_dir: str, table: str, columns: List[str], file_format: str) -> None:
+        self.out_dir = out_dir
+        self.table = table
+        self.columns = columns
+        self.file_format = file_format
+        self.paths: List[str] = []
+        self.file = None
+        self.csv_writer = None
+        self.parquet_writer = None
+        self.parquet_batch: List[Sequence[Any]] = []
+
+    def _open(self) -> None:
+        path = os.path.join(self.out_dir, f"{self.table}_{len(self.paths) + 1}.{self.file_format}")
+        self.paths.append(path)
+        if self.file_format == "parquet":
+            import pyarrow.parquet as pq
+            self.parquet_writer = pq.ParquetWriter(path, self._parquet_schema())
+            return
+        self.file = open(path, "w", encoding="utf-8", newline="")
+        if self.file_format == "csv":
+            self.csv_writer = csv.writer(self.file)
+            self.csv_writer.writerow(self.columns)
+
+    def _parquet_schema(self):
+        import pyarrow as pa
+        string_columns = {"memo", "attack_type", "created"}
+        return pa.schema([
+            (column, pa.string() if column in string_columns else pa.int64()) for column in self.columns
+        ])
+
+    def _size(self) -> int:
+        return os.path.getsize(self.paths[-1]) if self.file is None else self.file.tell()
+
+    def _flush_parquet(self) -> None:
+        import pyarrow as pa
+        if self.parquet_batch:
+            table = pa.Table.from_pylist(
+                [dict(zip(self.columns, row)) for row in self.parquet_batch], schema=self._parquet_schema())
+            self.parquet_writer.write_table(table)
+            self.parquet_batch = []
+
+    def write(self, row: Sequence[Any]) -> None:
+        if self.file is None and self.parquet_writer is None:
+            self._open()
+        if self.file_format == "csv":
+            self.csv_writer.writerow(row)
+        elif self.file_format == "jsonl":
+            self.file.write(json.dumps(dict(zip(self.columns, row)), ensure_ascii=False) + "\n")
+        else:
+            self.parquet_batch.append(row)
+            if len(self.parquet_batch) < EXPORT_BATCH_SIZE:
+                return
+            self._flush_parquet()
+        if self._size() >= EXPORT_CHUNK_SIZE:
+            self.close()
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.parquet_writer is not None:
+            self._flush_parquet()
+            self.parquet_writer.close()
+            self.parquet_writer = None
+
+
+def export_clan(
+    category_id: int, out_dir: str, file_format: str = "csv",
+    start: Optional[datetime.datetime] = None, end: Optional[datetime.datetime] = None
+) -> List[str]:
+    """クランのデータをテーブルごとにファイルに書き出して、作成したファイルのパスを返す"""
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"unknown format: {file_format}")
+    if file_format == "parquet":
+        import pyarrow  # noqa: F401 インストールされていない場合はここでImportErrorにする
+    os.makedirs(out_dir, exist_ok=True)
+    con = sqlite3.connect(DB_NAME)
+    paths = []
+    try:
+        for table, (columns, _) in EXPORT_TABLES.items():
+            writer = ChunkedWriter(out_dir, table, columns, file_format)
+            try:
+                for row in iter_rows(con, table, category_id, start, end):
+                    writer.write(row)
+            finally:
+                writer.close()
+            paths.extend(writer.paths)
+    finally:
+        con.close()
+    return paths
+
+
+def read_rows(path: str) -> Iterator[Dict[str, Any]]:
+    """エクスポートしたファイルを1行ずつ読み込む"""
+    if path.endswith(".csv"):
+        with open(path, encoding="utf-8", newline="") as f:
+            yield from csv.DictReader(f)
+    elif path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=EXPORT_BATCH_SIZE):
+            yield from batch.to_pylist()
+    else:
+        raise ValueError(f"unknown format: {path}")
+
+
+def get_table_name(path: str) -> str:
+    """ファイル名 (テーブル名_番号.拡張子) からテーブル名を取り出す"""
+    table = os.path.basename(path).rsplit(".", 1)[0].rsplit("_", 1)[0]
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"unknown table: {table}")
+    return table
+
+
+def import_clan(category_id: int, paths: List[str]) -> Dict[str, int]:
+    """エクスポートしたファイルを指定したカテゴリーのデータとして読み込む
+
+    読み込むテーブルにある、そのカテゴリーの既存のデータは置き換える。全て1つのトランザクションで行う。
+
+    Returns
+    -------
+    Dict[str, int]
+        テーブル名 -> 読み込んだ行数
+    """
+    paths_by_table: Dict[str, List[str]] = {}
+    for path in paths:
+        paths_by_table.setdefault(get_table_name(path), []).append(path)
+
+    counts: Dict[str, int] = {}
+    con = sqlite3.connect(DB_NAME)
+    try:
+        with con:
+            for table, table_paths in paths_by_table.items():
+                columns, _ = EXPORT_TABLES[table]
+                con.execute(f"delete from {table} where category_id=?", (category_id,))
+                sql = f"insert into {table} ({', '.join(columns)}) values ({', '.join('?' * len(columns))})"
+                counts[table] = 0
+                batch = []
+                for path in sorted(table_paths):
+                    for row in read_rows(path):
+                        row["category_id"] = category_id
+                        batch.append([row.get(column) for column in columns])
+                        if len(batch) >= EXPORT_BATCH_SIZE:
+                            con.executemany(sql, batch)
+                            counts[table] += len(batch)
+                            batch = []
+                if batch:
+                    con.executemany(sql, batch)
+                    counts[table] += len(batch)
+    finally:
+        con.close()
+    return counts
+
+
+def parse_date(txt: str) -> datetime.datetime:
+    """YYYY-MM-DD を、その日の5時 (日付が切り替わる時刻) に変換する"""
+    return datetime.datetime.combine(datetime.date.fromisoformat(txt), datetime.time(5), JST)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="クランバトルのデータのエクスポート・インポート")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export")
+    export_parser.add_argument("--category-id", type=int, required=True)
+    export_parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    export_parser.add_argument("--start", help="YYYY-MM-DD (この日の5時以降)")
+    export_parser.add_argument("--end", help="YYYY-MM-DD (この日の5時より前)")
+    export_parser.add_argument("--out", default="export")
+    import_parser = subparsers.add_parser("import")
+    import_parser.add_argument("--category-id", type=int, required=True, help="読み込み先のカテゴリーのID")
+    import_parser.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        paths = export_clan(
+            args.category_id, args.out, args.format,
+            parse_date(args.start) if args.start else None,
+            parse_date(args.end) if args.end else None
+        )
+        print("\n".join(paths))
+    else:
+        for table, count in import_clan(args.category_id, args.paths).items():
+            print(f"{table}: {count}")
+
+
+if __name__ == "__main__":
+    main()
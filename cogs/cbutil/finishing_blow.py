@@ -0,0 +1,120 @@
+from typing import List, Optional, Tuple
+
+from cogs.cbutil.util import calc_carry_over_time
+
+
+class FinishPlan():
+    def __init__(self, order: List[int], remain_hp: int, carry_over_time: int) -> None:
+        self.order: List[int] = order  # 凸する順番 (damagesのindex)。最後が〆
+        self.remain_hp: int = remain_hp  # 〆の直前のボスの残りHP
+        self.carry_over_time: int = carry_over_time
+
+    @property
+    def finisher(self) -> int:
+        return self.order[-1]
+
+
+def _reachable_sums(damages: List[int], indexes: List[int], mask: int) -> List[int]:
+    """indexesのダメージの部分和として作れる値をビット列で求める
+
+    i番目の要素は indexes[:i] の部分和の集合で、j番目のビットが立っていれば合計jが作れる
+    """
+    reachable = 1
+    stages = [reachable]
+    for i in indexes:
+        reachable = (reachable | (reachable << damages[i])) & mask
+        stages.append(reachable)
+    return stages
+
+
+def _best_total(current_hp: int, damage: int, reachable: int) -> Optional[Tuple[int, int]]:
+    """〆のダメージに対して、持ち越し時間が最も長くなる〆以外の凸の合計を求める
+
+    Parameters
+    ----------
+    reachable : int
+        〆以外の凸で作れる合計のビット列 (current_hp未満のみ)
+
+    Returns
+    -------
+    Optional[Tuple[int, int]]
+        (持ち越し時間, 合計)。〆で討伐できる合計がない場合はNone
+    """
+    # 〆で討伐できる合計 (current_hp - damage <= 合計 < current_hp) に絞る。残りHPと〆のダメージが同じでも討伐できる
+    lowest = max(0, current_hp - damage)
+    reachable >>= lowest
+    if not reachable:
+        return None
+    max_sum = lowest + reachable.bit_length() - 1
+    carry_over_time = calc_carry_over_time(current_hp - max_sum, damage)
+    # 持ち越し時間が変わらない最小の合計を二分探索で求める
+    low, high = lowest, max_sum
+    while low < high:
+        middle = (low + high) // 2
+        if calc_carry_over_time(current_hp - middle, damage) >= carry_over_time:
+            high = middle
+        else:
+            low = middle + 1
+    shifted = reachable >> (low - lowest)
+    return carry_over_time, low + (shifted & -shifted).bit_length() - 1
+
+
+def _restore_order(damages: List[int], others: List[int], stages: List[int], total: int) -> List[int]:
+    """部分和のビット列から合計がtotalになる凸を取り出し、ダメージの大きい順に並べる"""
+    order = []
+    for i in range(len(others), 0, -1):
+        if not stages[i - 1] >> total & 1:
+            order.append(others[i - 1])
+            total -= damages[others[i - 1]]
+    order.sort(key=lambda i: damages[i], reverse=True)
+    return order
+
+
+def plan_finishing_blow(current_hp: int, damages: List[int]) -> Optional[FinishPlan]:
+    """持ち越し時間が最も長くなる凸の順番を求める
+
+    〆以外の凸の合計で討伐しないようにしつつ、〆の直前の残りHPが最も小さくなる組み合わせを
+    部分和のビット列で探す。持ち越し時間が同じであれば、先に凸する人数が少ない組み合わせを優先する。
+
+    Parameters
+    ----------
+    current_hp : int
+        ボスの現在のHP
+    damages : List[int]
+        凸予定のダメージ
+
+    Returns
+    -------
+    Optional[FinishPlan]
+        全員が凸しても討伐できない場合はNone
+    """
+    if current_hp <= 0:
+        return None
+    candidates = [i for i, damage in enumerate(damages) if damage > 0]
+    mask = (1 << current_hp) - 1  # 討伐しない合計 (current_hp未満) だけを残す
+
+    best = None  # ((持ち越し時間, -合計), 〆のindex, 合計)
+    checked_damages = set()
+    for finisher in candidates:
+        damage = damages[finisher]
+        # 同じダメージの〆は結果も同じになる
+        if damage in checked_damages:
+            continue
+        checked_damages.add(damage)
+        others = [i for i in candidates if i != finisher]
+        result = _best_total(current_hp, damage, _reachable_sums(damages, others, mask)[-1])
+        if result is None:
+            continue
+        key = (result[0], -result[1])
+        if best is None or key > best[0]:
+            best = (key, finisher, result[1])
+
+    if best is None:
+        return None
+
+    _, finisher, total = best
+    others = [i for i in candidates if i != finisher]
+    order = _restore_order(damages, others, _reachable_sums(damages, others, mask), total)
+    order.append(finisher)
+    remain_hp = current_hp - sum(damages[i] for i in order[:-1])
+    return FinishPlan(order, remain_hp, calc_carry_over_time(remain_hp, damages[finisher]))
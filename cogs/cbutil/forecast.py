@@ -0,0 +1,204 @@
+import asyncio
+import random
+from typing import Dict, List, Optional, Set, Tuple
+
+from cogs.cbutil.clan_data import ClanData
+from cogs.cbutil.hp_profile import HpProfile
+from cogs.cbutil.util import calc_carry_over_time
+
+FORECAST_SIMULATIONS = 2000  # 1回の予測でシミュレーションする日数
+FORECAST_MAX_LAP_AHEAD = 1  # 最も遅れているボスから何周先まで挑戦できるか
+FORECAST_PERCENTILES = (10, 50, 90)
+
+
+class ForecastResult():
+    def __init__(self, laps: List[int], beated_counts: List[int], attack_count: int) -> None:
+        laps = sorted(laps)
+        beated_counts = sorted(beated_counts)
+        self.simulations = len(laps)
+        self.attack_count = attack_count  # シミュレーションした残りの凸数 (持ち越しを含む)
+        # パーセンタイル -> 一日の終わりの周回 (最も遅れているボスの周回)
+        self.lap_percentiles: Dict[int, int] = {
+            p: laps[min(len(laps) - 1, len(laps) * p // 100)] for p in FORECAST_PERCENTILES
+        }
+        # パーセンタイル -> 討伐数
+        self.beated_percentiles: Dict[int, int] = {
+            p: beated_counts[min(len(beated_counts) - 1, len(beated_counts) * p // 100)] for p in FORECAST_PERCENTILES
+        }
+        self.expected_lap = sum(laps) / len(laps)
+
+
+def collect_damage_samples(clan_data: ClanData) -> Dict[Tuple[int, int], List[int]]:
+    """(user_id, ボスのindex) -> 実際に与えたダメージの一覧
+
+    持ち越しでの凸は秒数によってダメージが変わるため含めない。
+    本日の凸がまだないボスはダメージの集計から作った分布を、それもない場合は予約のダメージを使う。
+    """
+    samples: Dict[Tuple[int, int], List[int]] = {}
+    for boss_status_data_list in clan_data.boss_status_data.values():
+        for boss_index, boss_status_data in enumerate(boss_status_data_list):
+            for attack_status in boss_status_data.attack_players:
+                if attack_status.attacked and not attack_status.carry_over and attack_status.damage > 0:
+                    samples.setdefault((attack_status.player_data.user_id, boss_index), []).append(
+                        attack_status.damage)
+    hp_profile = clan_data.get_hp_profile()
+    current_tiers = [hp_profile.get_tier(lap) for lap, _, _ in clan_data.get_boss_progress()]
+    for (user_id, boss_index, tier), damage_stat in clan_data.damage_stats.items():
+        if tier == current_tiers[boss_index] and (user_id, boss_index) not in samples:
+            samples[(user_id, boss_index)] = [damage_stat.percentile(p) for p in range(10, 100, 20)]
+    for boss_index, reserve_data_list in enumerate(clan_data.reserve_list):
+        for reserve_data in reserve_data_list:
+            key = (reserve_data.player_data.user_id, boss_index)
+            if reserve_data.damage > 0 and not reserve_data.carry_over and key not in samples:
+                samples[key] = [reserve_data.damage]
+    return samples
+
+
+class ForecastInput():
+    """シミュレーションに必要な値のスナップショット
+
+    シミュレーションは別スレッドで実行するため、ClanDataから必要な値を先にコピーしておく。
+    """
+
+    def __init__(self, clan_data: ClanData) -> None:
+        self.hp_profile = clan_data.get_hp_profile()
+        self.progress = clan_data.get_boss_progress()
+        samples = collect_damage_samples(clan_data)
+
+        boss_samples: Dict[int, List[int]] = {}
+        user_samples: Dict[int, List[int]] = {}
+        for (user_id, boss_index), damages in samples.items():
+            boss_samples.setdefault(boss_index, []).extend(damages)
+            user_samples.setdefault(user_id, []).extend(damages)
+
+        # user_id -> ボスごとのダメージの候補
+        self.damage_table: Dict[int, List[List[int]]] = {}
+        # (user_id, ダメージの倍率, 持ち越しかどうか) 持ち越しの倍率は秒数/90
+        self.tokens: List[Tuple[int, float, bool]] = []
+        for user_id, player_data in clan_data.player_data_dict.items():
+            table = [
+                samples.get((user_id, boss_index)) or user_samples.get(user_id) or boss_samples.get(boss_index) or []
+                for boss_index in range(5)
+            ]
+            if not any(table):
+                continue
+            self.damage_table[user_id] = table
+            self.tokens.extend([(user_id, 1.0, False)] * (3 - player_data.physics_attack - player_data.magic_attack))
+            for carry_over in player_data.carry_over_list:
+                carry_over_time = carry_over.carry_over_time if carry_over.carry_over_time > 0 else 20
+                self.tokens.append((user_id, carry_over_time / 90, True))
+
+
+def _get_open_bosses(hp_profile: HpProfile, boss_laps: List[int]) -> List[int]:
+    """挑戦できるボスのindexを遅れている順に並べる"""
+    min_lap = min(boss_laps)
+    min_tier = hp_profile.get_tier(min_lap)
+    return [
+        boss_index for boss_index in sorted(range(5), key=lambda i: (boss_laps[i], i))
+        if boss_laps[boss_index] <= min_lap + FORECAST_MAX_LAP_AHEAD
+        and hp_profile.get_tier(boss_laps[boss_index]) == min_tier
+    ]
+
+
+def _sample_attack(
+    rng: random.Random, damages: List[List[int]], open_bosses: List[int], used: List[Set[int]],
+    user_id: int, rate: float, carry_over: bool
+) -> Optional[Tuple[int, int]]:
+    """凸する人が挑戦するボスとダメージを選ぶ。凸できない場合はNone
+
+    Returns
+    -------
+    Optional[Tuple[int, int]]
+        (ボスのindex, ダメージ)
+    """
+    for boss_index in open_bosses:
+        if carry_over or user_id not in used[boss_index]:
+            break
+    else:
+        return None
+    candidates = damages[boss_index]
+    if not candidates:
+        return None
+    damage = int(rng.choice(candidates) * rate)
+    if damage <= 0:
+        return None
+    return boss_index, damage
+
+
+def simulate(
+    forecast_input: ForecastInput, simulations: int = FORECAST_SIMULATIONS, seed: Optional[int] = None
+) -> ForecastResult:
+    """残りの凸をランダムな順番・ダメージで消化した場合の一日の終わりの周回を予測する
+
+    凸する人は最も遅れている挑戦可能なボスに凸し、ダメージは本人のそのボスへの過去のダメージから選ぶ。
+    そのボスの記録がない場合は本人の他のボスの記録、それもない場合はクラン全体のそのボスへの記録を使う。
+    討伐時は持ち越し時間に比例したダメージの持ち越しが発生し、その人が次に凸する。
+    """
+    rng = random.Random(seed)
+    hp_profile = forecast_input.hp_profile
+    damage_table = forecast_input.damage_table
+
+    laps: List[int] = []
+    beated_counts: List[int] = []
+    for _ in range(simulations):
+        boss_laps = [lap for lap, _, _ in forecast_input.progress]
+        boss_hps = [hp for _, hp, _ in forecast_input.progress]
+        used = [set(user_ids) for _, _, user_ids in forecast_input.progress]
+        beated_count = 0
+        queue = forecast_input.tokens[:]
+        rng.shuffle(queue)
+        open_bosses = _get_open_bosses(hp_profile, boss_laps)
+        while queue:
+            user_id, rate, carry_over = queue.pop()
+            attack = _sample_attack(rng, damage_table[user_id], open_bosses, used, user_id, rate, carry_over)
+            if attack is None:
+                continue
+            target, damage = attack
+            if damage >= boss_hps[target]:
+                # 持ち越しで討伐した場合は持ち越しが発生しない。発生した持ち越しはすぐに使う
+                if not carry_over:
+                    queue.append((user_id, calc_carry_over_time(boss_hps[target], damage) / 90, True))
+                boss_laps[target] += 1
+                boss_hps[target] = hp_profile.get_hp(boss_laps[target], target)
+                used[target] = set()
+                beated_count += 1
+                open_bosses = _get_open_bosses(hp_profile, boss_laps)
+            else:
+                boss_hps[target] -= damage
+                if not carry_over:
+                    used[target].add(user_id)
+        laps.append(min(boss_laps))
+        beated_counts.append(beated_count)
+    return ForecastResult(laps, beated_counts, len(forecast_input.tokens))
+
+
+class LapForecaster():
+    """クランごとの予測結果をキャッシュする
+
+    予測は凸状況が変わったとき (ClanData.attack_version が増えたとき) だけ計算しなおす。
+    同じクランの計算が実行中であればその結果を待つ。
+    """
+
+    def __init__(self) -> None:
+        self.cache: Dict[int, Tuple[Tuple, ForecastResult]] = {}
+        self.in_flight: Dict[int, Tuple[Tuple, asyncio.Task]] = {}
+
+    def _get_key(self, clan_data: ClanData) -> Tuple:
+        return (clan_data.attack_version, len(clan_data.player_data_dict), id(clan_data.get_hp_profile()))
+
+    async def get(self, clan_data: ClanData) -> ForecastResult:
+        key = self._get_key(clan_data)
+        if (cached := self.cache.get(clan_data.category_id)) and cached[0] == key:
+            return cached[1]
+        if (running := self.in_flight.get(clan_data.category_id)) and running[0] == key:
+            return await asyncio.shield(running[1])
+
+        task = asyncio.create_task(asyncio.to_thread(simulate, ForecastInput(clan_data)))
+        self.in_flight[clan_data.category_id] = (key, task)
+        try:
+            result = await asyncio.shield(task)
+        finally:
+            if self.in_flight.get(clan_data.category_id, (None, None))[1] is task:
+                del self.in_flight[clan_data.category_id]
+        self.cache[clan_data.category_id] = (key, result)
+        return result
@@ -2,10 +2,15 @@ from datetime import datetime
 from typing import Optional, TypedDict
 from urllib.parse import urlencode
 
+import aiohttp
+
 from cogs.cbutil.clan_battle_data import ClanBattleData
 from cogs.cbutil.util import get_from_web_api
 from setup import CREATE_FORM_API, JST
 
+# フォームの作成はApps Scriptの実行に時間がかかるため、実行時間の上限 (6分) まで待つ
+FORM_CREATE_TIMEOUT = aiohttp.ClientTimeout(total=360, connect=10)
+
 
 class FormDataDict(TypedDict):
     form_url: str
@@ -54,5 +59,6 @@ async def create_form_data(title: str):
         "title": title,
         "start_day": start_day
     })
-    form_data: FormData = await get_from_web_api(url)
+    # フォームとスプレッドシートを作成するAPIなので、再試行すると重複して作成されてしまう
+    form_data: FormData = await get_from_web_api(url, retries=0, timeout=FORM_CREATE_TIMEOUT)
     return form_data
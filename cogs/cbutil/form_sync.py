@@ -0,0 +1,131 @@
+import asyncio
+import time
+from datetime import datetime
+from logging import getLogger
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from cogs.cbutil.availability import AvailabilityMatrix
+from cogs.cbutil.clan_battle_data import ClanBattleData
+from cogs.cbutil.clan_data import ClanData
+from cogs.cbutil.gss import SheetClient
+from cogs.cbutil.util import parse_limit_time_text
+from setup import JST
+
+logger = getLogger(__name__)
+
+FORM_SHEET_NAMES = ["フォームの回答 1", "第 1 张表单回复", "フォームの回答"]
+DISCORD_ID_COLUMN = 2  # 回答シートのDiscord Idの列 (0始まり)。その後ろに1日目から5日目の列が続く
+FORM_SYNC_INTERVAL_BATTLE = 60  # クランバトル開催中のポーリング間隔(秒)
+FORM_SYNC_INTERVAL_IDLE = 30 * 60  # 開催期間外のポーリング間隔(秒)
+FORM_SYNC_TICK = 10  # 同期が必要なクランを確認する間隔(秒)
+FORM_SYNC_MAX_CONCURRENCY = 3  # 同時に実行する同期の上限
+
+
+class FormSyncState():
+    def __init__(self, sheet_url: str) -> None:
+        self.sheet_url = sheet_url
+        self.sheet_name: Optional[str] = None
+        self.last_row: int = 1  # 処理済みの最後の行番号 (1行目は見出し)
+        self.next_sync: float = 0
+        self.running: bool = False
+        self.lock = asyncio.Lock()
+
+
+class FormResponseSync():
+    """日程調査の回答シートを差分だけ読み込んで参戦可能時間に反映する
+
+    クランごとに処理済みの行番号を覚えておき、追加された行だけを取得する。
+    同じDiscord Idの回答が複数ある場合は後の行 (最新の回答) が優先される。
+    """
+
+    def __init__(self, sheet_client: SheetClient) -> None:
+        self.sheet_client = sheet_client
+        self.states: Dict[int, FormSyncState] = {}
+        self.semaphore = asyncio.Semaphore(FORM_SYNC_MAX_CONCURRENCY)
+        self.tasks: Set[asyncio.Task] = set()
+
+    def _get_state(self, clan_data: ClanData) -> FormSyncState:
+        state = self.states.get(clan_data.category_id)
+        # フォームが作り直された場合は最初から読み込みなおす
+        if state is None or state.sheet_url != clan_data.form_data.sheet_url:
+            state = FormSyncState(clan_data.form_data.sheet_url)
+            self.states[clan_data.category_id] = state
+        return state
+
+    async def sync(self, clan_data: ClanData) -> Set[int]:
+        """追加された回答を読み込む
+
+        Returns
+        -------
+        Set[int]
+            回答が更新されたメンバーのuser_id
+        """
+        state = self._get_state(clan_data)
+        async with state.lock:
+            if state.sheet_name is None:
+                ws_titles = await self.sheet_client.get_worksheet_titles(state.sheet_url)
+                state.sheet_name = next((name for name in FORM_SHEET_NAMES if name in ws_titles), None)
+                if state.sheet_name is None:
+                    return set()
+
+            rows = await self.sheet_client.get_columns(
+                state.sheet_url,
+                state.sheet_name,
+                [DISCORD_ID_COLUMN + i for i in range(6)],
+                first_row=state.last_row + 1,
+                use_cache=False
+            )
+            updated_user_ids = set()
+            for row in rows:
+                if not row[0].isdecimal():
+                    continue
+                user_id = int(row[0])
+                for day in range(1, 6):
+                    if day not in clan_data.availability:
+                        clan_data.availability[day] = AvailabilityMatrix()
+                    clan_data.availability[day].set(user_id, parse_limit_time_text(row[day]))
+                updated_user_ids.add(user_id)
+            state.last_row += len(rows)
+            if rows:
+                logger.info(f"form responses synced: category_id={clan_data.category_id}, rows={len(rows)}")
+            return updated_user_ids
+
+    def get_interval(self, now: datetime) -> float:
+        """クランバトル開催中は短い間隔でポーリングする"""
+        if ClanBattleData.get_day(now) is not None:
+            return FORM_SYNC_INTERVAL_BATTLE
+        return FORM_SYNC_INTERVAL_IDLE
+
+    async def _sync_task(
+        self, clan_data: ClanData, on_update: Callable[[ClanData, Set[int]], Awaitable[None]]
+    ) -> None:
+        state = self._get_state(clan_data)
+        try:
+            async with self.semaphore:
+                updated_user_ids = await self.sync(clan_data)
+            if updated_user_ids:
+                await on_update(clan_data, updated_user_ids)
+        except Exception:
+            logger.exception(f"failed to sync form responses: category_id={clan_data.category_id}")
+        finally:
+            state.running = False
+            state.next_sync = time.monotonic() + self.get_interval(datetime.now(JST))
+
+    async def run(
+        self, clan_data_dict: Dict[int, Optional[ClanData]],
+        on_update: Callable[[ClanData, Set[int]], Awaitable[None]]
+    ) -> None:
+        """同期が必要なクランを定期的に確認してバックグラウンドで同期する"""
+        while True:
+            now = time.monotonic()
+            for clan_data in list(clan_data_dict.values()):
+                if clan_data is None or not clan_data.form_data.sheet_url:
+                    continue
+                state = self._get_state(clan_data)
+                if state.running or now < state.next_sync:
+                    continue
+                state.running = True
+                task = asyncio.create_task(self._sync_task(clan_data, on_update))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+            await asyncio.sleep(FORM_SYNC_TICK)
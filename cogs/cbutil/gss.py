@@ -1,9 +1,14 @@
-from typing import List
+import asyncio
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
 
 import gspread_asyncio
 from oauth2client.service_account import ServiceAccountCredentials
 from setup import GOOGLE_JSON_PATH
 
+SHEET_CACHE_TTL = 120  # 読み込んだ値を再利用する秒数
+
 
 def get_creds():
     return ServiceAccountCredentials.from_json_keyfile_name(
@@ -14,25 +19,180 @@ def get_creds():
     )
 
 
-agcm = gspread_asyncio.AsyncioGspreadClientManager(get_creds)
+def column_letter(column_index: int) -> str:
+    """0始まりの列番号をA1表記の列名に変換する"""
+    letter = ""
+    column_index += 1
+    while column_index:
+        column_index, remainder = divmod(column_index - 1, 26)
+        letter = chr(ord("A") + remainder) + letter
+    return letter
+
+
+def column_index(letter: str) -> int:
+    """A1表記の列名を0始まりの列番号に変換する"""
+    index = 0
+    for c in letter:
+        index = index * 26 + ord(c) - ord("A") + 1
+    return index - 1
 
 
-async def get_sheet_values(sheeturl: str, sheet_name: str):
+class GspreadBackend():
+    """gspread_asyncioを使ってスプレッドシートにアクセスする
+
+    認証済みのクライアントとスプレッドシート、ワークシートのハンドルを使いまわす。
     """
-    スプレッドシートに書いてある内容を取り出す
+
+    def __init__(self, client_manager: gspread_asyncio.AsyncioGspreadClientManager) -> None:
+        self.client_manager = client_manager
+        self.spreadsheets: Dict[str, gspread_asyncio.AsyncioGspreadSpreadsheet] = {}
+        self.worksheets: Dict[Tuple[str, str], gspread_asyncio.AsyncioGspreadWorksheet] = {}
+
+    async def _open(self, sheet_url: str) -> gspread_asyncio.AsyncioGspreadSpreadsheet:
+        # authorize()はクライアントをキャッシュしており、期限切れの場合のみ再認証する
+        agc = await self.client_manager.authorize()
+        if sheet_url not in self.spreadsheets:
+            self.spreadsheets[sheet_url] = await agc.open_by_url(sheet_url)
+        return self.spreadsheets[sheet_url]
+
+    async def _worksheet(self, sheet_url: str, sheet_name: str) -> gspread_asyncio.AsyncioGspreadWorksheet:
+        key = (sheet_url, sheet_name)
+        if key not in self.worksheets:
+            sh = await self._open(sheet_url)
+            self.worksheets[key] = await sh.worksheet(sheet_name)
+        return self.worksheets[key]
+
+    async def get_worksheet_titles(self, sheet_url: str) -> List[str]:
+        sh = await self._open(sheet_url)
+        worksheets = await sh.worksheets()
+        return [worksheet.title for worksheet in worksheets]
+
+    async def batch_get(self, sheet_url: str, sheet_name: str, ranges: List[str]) -> List[List[List[str]]]:
+        """複数の範囲を1回のリクエストで取得する"""
+        worksheet = await self._worksheet(sheet_url, sheet_name)
+        return [list(value_range) for value_range in await worksheet.batch_get(ranges)]
+
+    def forget(self, sheet_url: str) -> None:
+        self.spreadsheets.pop(sheet_url, None)
+        for key in [key for key in self.worksheets if key[0] == sheet_url]:
+            del self.worksheets[key]
+
+
+class LocalSheetBackend():
+    """メモリ上のスプレッドシートを使うGspreadBackendの代わり (動作確認用)
+
+    sheets[sheet_url][sheet_name] に行のリストとして値を保持する。
     """
-    
-    agc = await agcm.authorize()
-    sh = await agc.open_by_url(sheeturl)
-    worksheet = await sh.worksheet(sheet_name)
-    list_of_lists = await worksheet.get_all_values()
-    return list_of_lists
 
+    def __init__(self) -> None:
+        self.sheets: Dict[str, Dict[str, List[List[str]]]] = {}
+        self.request_count = 0
+
+    def append_row(self, sheet_url: str, sheet_name: str, row: List[str]) -> None:
+        self.sheets.setdefault(sheet_url, {}).setdefault(sheet_name, []).append(row)
 
-async def get_worksheet_list(sheeturl: str) -> List[str]:
-    """ワークシートの一覧を取得"""
-    agc = await agcm.authorize()
-    sh = await agc.open_by_url(sheeturl)
-    worksheets = await sh.worksheets()
+    async def get_worksheet_titles(self, sheet_url: str) -> List[str]:
+        self.request_count += 1
+        return list(self.sheets.get(sheet_url, {}).keys())
 
-    return [worksheet.title for worksheet in worksheets]
+    async def batch_get(self, sheet_url: str, sheet_name: str, ranges: List[str]) -> List[List[List[str]]]:
+        self.request_count += 1
+        rows = self.sheets[sheet_url][sheet_name]
+        value_ranges = []
+        for a1_range in ranges:
+            start_column, start_row, end_column, end_row = re.fullmatch(
+                r"([A-Z]+)(\d*):([A-Z]+)(\d*)", a1_range).groups()
+            row_from = int(start_row or 1) - 1
+            row_to = int(end_row) if end_row else len(rows)
+            value_range = [
+                row[column_index(start_column):column_index(end_column) + 1] for row in rows[row_from:row_to]
+            ]
+            # APIと同様に末尾の空行は返さない
+            while value_range and not any(value_range[-1]):
+                value_range.pop()
+            value_ranges.append(value_range)
+        return value_ranges
+
+    def forget(self, sheet_url: str) -> None:
+        pass
+
+
+class SheetClient():
+    """スプレッドシートの読み込み結果をTTL付きでキャッシュする"""
+
+    def __init__(self, backend, ttl: float = SHEET_CACHE_TTL) -> None:
+        self.backend = backend
+        self.ttl = ttl
+        self.cache: Dict[Tuple, Tuple[float, Any]] = {}
+        self.in_flight: Dict[Tuple, asyncio.Future] = {}
+
+    async def _cached(self, key: Tuple, fetch, use_cache: bool):
+        now = time.monotonic()
+        if use_cache and (cached := self.cache.get(key)) and cached[0] > now:
+            return cached[1]
+        # 同じ内容の読み込みが実行中であればその結果を待つ
+        if (future := self.in_flight.get(key)) is not None:
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            value = await fetch()
+        except BaseException as e:
+            if isinstance(e, Exception):
+                future.set_exception(e)
+                future.exception()  # 待っているものがいない場合に警告を出さない
+            else:
+                future.cancel()
+            raise
+        finally:
+            del self.in_flight[key]
+        if use_cache:
+            self.cache[key] = (time.monotonic() + self.ttl, value)
+        future.set_result(value)
+        return value
+
+    async def get_worksheet_titles(self, sheet_url: str) -> List[str]:
+        """ワークシートの一覧を取得"""
+        return await self._cached(
+            ("titles", sheet_url), lambda: self.backend.get_worksheet_titles(sheet_url), True)
+
+    async def get_columns(
+        self, sheet_url: str, sheet_name: str, column_indexes: List[int], first_row: int = 2, use_cache: bool = True
+    ) -> List[List[str]]:
+        """指定した列の値をまとめて取得する
+
+        Returns
+        -------
+        List[List[str]]
+            first_row行目以降の行ごとの値。各行はcolumn_indexesの順に並び、空欄は空文字で埋める
+        """
+        ranges = [
+            f"{column_letter(i)}{first_row}:{column_letter(i)}" for i in column_indexes
+        ]
+
+        async def fetch():
+            value_ranges = await self.backend.batch_get(sheet_url, sheet_name, ranges)
+            row_count = max((len(value_range) for value_range in value_ranges), default=0)
+            return [
+                [
+                    value_range[row][0] if row < len(value_range) and value_range[row] else ""
+                    for value_range in value_ranges
+                ]
+                for row in range(row_count)
+            ]
+
+        return await self._cached(
+            ("columns", sheet_url, sheet_name, tuple(ranges)), fetch, use_cache)
+
+    def invalidate(self, sheet_url: Optional[str] = None) -> None:
+        """キャッシュを破棄する。sheet_urlを指定しない場合は全て破棄する"""
+        if sheet_url is None:
+            self.cache = {}
+            return
+        for key in [key for key in self.cache if key[1] == sheet_url]:
+            del self.cache[key]
+        self.backend.forget(sheet_url)
+
+
+agcm = gspread_asyncio.AsyncioGspreadClientManager(get_creds)
+sheet_client = SheetClient(GspreadBackend(agcm))
@@ -0,0 +1,70 @@
+import json
+from typing import List, Optional, Sequence, Tuple
+
+
+class HpProfile():
+    """周回数とボスからHPを引くための表
+
+    生成後は変更しない。HPを変更する場合はwith_hp()で新しいプロファイルを作って差し替える。
+    上限のない最後の段階より前の周回は周回数で引ける1次元の配列にしておき、
+    それ以降の周回は最後の段階のHPを返す。
+    """
+
+    def __init__(
+        self, hp: Sequence[Sequence[int]], boudaries: Sequence[Tuple[int, int]], season: Optional[str] = None
+    ) -> None:
+        """
+        Parameters
+        ----------
+        hp : Sequence[Sequence[int]]
+            段階ごとの5ボスのHP
+        boudaries : Sequence[Tuple[int, int]]
+            段階ごとの(開始周, 終了周)。終了周が-1の場合は上限なし
+        season : Optional[str]
+            プロファイルの元になったクランバトルの開始日時
+        """
+        self.hp: Tuple[Tuple[int, ...], ...] = tuple(tuple(hp_in_level) for hp_in_level in hp)
+        self.boudaries: Tuple[Tuple[int, int], ...] = tuple(
+            (lap_from, lap_to) for lap_from, lap_to in boudaries)
+        self.season = season
+
+        # 上限のある段階の最後の周回まで、(lap - 1) * 5 + boss_index の位置にHPを並べる
+        self.max_lap = max((lap_to for _, lap_to in self.boudaries), default=0)
+        self.tail: Tuple[int, ...] = self.hp[-1]
+        for i, (lap_from, lap_to) in enumerate(self.boudaries):
+            if lap_to == -1:
+                self.tail = self.hp[i]
+        table: List[int] = list(self.tail) * self.max_lap
+        # 段階が重なっている場合は先に書いてある段階を優先する
+        for i, (lap_from, lap_to) in reversed(list(enumerate(self.boudaries))):
+            if lap_to == -1:
+                continue
+            for lap in range(lap_from, lap_to + 1):
+                table[(lap - 1) * 5:lap * 5] = self.hp[i]
+        self.table: Tuple[int, ...] = tuple(table)
+
+    def get_hp(self, lap: int, boss_index: int) -> int:
+        if 1 <= lap <= self.max_lap:
+            return self.table[(lap - 1) * 5 + boss_index]
+        return self.tail[boss_index]
+
+    def get_tier(self, lap: int) -> int:
+        """周回数が何段階目かを取得する"""
+        for i, (lap_from, lap_to) in enumerate(self.boudaries):
+            if lap_from <= lap <= lap_to or (lap_from <= lap and lap_to == -1):
+                return i
+        return len(self.boudaries) - 1
+
+    def with_hp(self, lap_group: int, boss_index: int, value: int) -> "HpProfile":
+        """指定した段階・ボスのHPだけを変更したプロファイルを返す"""
+        hp = [list(hp_in_level) for hp_in_level in self.hp]
+        hp[lap_group][boss_index] = value
+        return HpProfile(hp, self.boudaries, self.season)
+
+    def to_json(self) -> str:
+        return json.dumps({"hp": self.hp, "boudaries": self.boudaries, "season": self.season})
+
+    @staticmethod
+    def from_json(txt: str) -> "HpProfile":
+        data = json.loads(txt)
+        return HpProfile(data["hp"], data["boudaries"], data.get("season"))
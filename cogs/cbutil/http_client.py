@@ -0,0 +1,121 @@
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict, deque
+from logging import getLogger
+from typing import Any, DefaultDict, Deque, Dict, Optional
+
+import aiohttp
+from yarl import URL
+
+logger = getLogger(__name__)
+
+HTTP_LIMIT = 20  # 全体の同時接続数の上限
+HTTP_LIMIT_PER_HOST = 4  # ホストごとの同時接続数の上限
+HTTP_KEEPALIVE_TIMEOUT = 60
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=30, connect=10, sock_read=20)
+HTTP_MAX_RETRIES = 3
+HTTP_BACKOFF_BASE = 0.5  # 再試行の待ち時間の基準(秒)
+HTTP_BACKOFF_MAX = 8.0
+JSON_OFFLOAD_SIZE = 64 * 1024  # これより大きいレスポンスは別スレッドでデコードする
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HttpMetrics():
+    """ホストごとのリクエスト数とレイテンシを記録する"""
+
+    def __init__(self, sample_size: int = 200) -> None:
+        self.requests: DefaultDict[str, int] = defaultdict(int)
+        self.errors: DefaultDict[str, int] = defaultdict(int)
+        self.retries: DefaultDict[str, int] = defaultdict(int)
+        self.latencies: DefaultDict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=sample_size))
+
+    def record(self, host: str, latency: float) -> None:
+        self.requests[host] += 1
+        self.latencies[host].append(latency)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        result = {}
+        for host, latencies in self.latencies.items():
+            sorted_latencies = sorted(latencies)
+            result[host] = {
+                "requests": self.requests[host],
+                "errors": self.errors[host],
+                "retries": self.retries[host],
+                "p50_ms": round(sorted_latencies[len(sorted_latencies) // 2] * 1000),
+                "p95_ms": round(sorted_latencies[int(len(sorted_latencies) * 0.95)] * 1000),
+            }
+        return result
+
+
+class HttpClient():
+    """外部APIにアクセスするためのHTTPクライアント
+
+    Botの起動時にstart()、終了時にclose()を呼び出す。
+    コネクションはkeep-aliveで使いまわし、失敗した場合はジッター付きの指数バックオフで再試行する。
+    """
+
+    def __init__(self) -> None:
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.metrics = HttpMetrics()
+
+    async def start(self) -> None:
+        if self.session is not None and not self.session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_LIMIT,
+            limit_per_host=HTTP_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=300
+        )
+        self.session = aiohttp.ClientSession(connector=connector, timeout=HTTP_TIMEOUT)
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def get_json(self, url: str, retries: int = HTTP_MAX_RETRIES, timeout: Optional[aiohttp.ClientTimeout] = None) -> Any:
+        """URLからJSONを取得する
+
+        Parameters
+        ----------
+        url : str
+            取得するURL
+        retries : int
+            失敗した場合に再試行する回数。呼び出すたびに何かを作成するような冪等でないAPIでは0にする
+        timeout : Optional[aiohttp.ClientTimeout]
+            タイムアウト。指定しない場合はHTTP_TIMEOUT
+        """
+        if self.session is None or self.session.closed:
+            await self.start()
+        host = URL(url).host or ""
+        for attempt in range(retries + 1):
+            started = time.perf_counter()
+            try:
+                async with self.session.get(url, timeout=timeout or HTTP_TIMEOUT) as r:
+                    if r.status in RETRY_STATUSES and attempt < retries:
+                        raise aiohttp.ClientResponseError(
+                            r.request_info, r.history, status=r.status, message=r.reason or "")
+                    r.raise_for_status()
+                    body = await r.read()
+                self.metrics.record(host, time.perf_counter() - started)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.metrics.errors[host] += 1
+                if attempt >= retries or (
+                    isinstance(e, aiohttp.ClientResponseError) and e.status not in RETRY_STATUSES
+                ):
+                    raise
+                self.metrics.retries[host] += 1
+                delay = random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+                logger.warning(f"retry {attempt+1}/{retries} after {delay:.2f}s: {url} ({type(e).__name__}: {e})")
+                await asyncio.sleep(delay)
+                continue
+
+            if len(body) > JSON_OFFLOAD_SIZE:
+                return await asyncio.get_running_loop().run_in_executor(None, json.loads, body)
+            return json.loads(body)
+
+
+http_client = HttpClient()
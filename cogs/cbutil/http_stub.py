@@ -0,0 +1,60 @@
+"""外部APIの代わりにJSONを返すローカルサーバー (動作確認用)
+
+使い方:
+    server = LocalStubServer({"/clanbattles/latest": {...}})
+    base_url = await server.start()
+    ...
+    await server.close()
+"""
+import asyncio
+import socket
+from typing import Any, Dict
+
+from aiohttp import web
+
+
+class LocalStubServer():
+    def __init__(self, routes: Dict[str, Any], fail_count: int = 0, delay: float = 0) -> None:
+        """
+        Parameters
+        ----------
+        routes : Dict[str, Any]
+            パス -> 返すJSON
+        fail_count : int
+            最初のfail_count回のリクエストに503を返す (再試行の確認用)
+        delay : float
+            レスポンスを返すまでの秒数
+        """
+        self.routes = routes
+        self.fail_count = fail_count
+        self.delay = delay
+        self.request_count = 0
+        self.runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.request_count += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.request_count <= self.fail_count:
+            return web.Response(status=503)
+        if request.path not in self.routes:
+            return web.Response(status=404)
+        return web.json_response(self.routes[request.path])
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """サーバーを起動してベースURLを返す"""
+        app = web.Application()
+        app.router.add_get("/{tail:.*}", self._handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        # ポートを調べられるように自分でソケットを作成する
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind((host, port))
+        site = web.SockSite(self.runner, sock)
+        await site.start()
+        port = sock.getsockname()[1]
+        return f"http://{host}:{port}/"
+
+    async def close(self) -> None:
+        if self.runner is not None:
+            await self.runner.cleanup()
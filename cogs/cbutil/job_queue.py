@@ -0,0 +1,107 @@
+import asyncio
+import itertools
+from collections import deque
+from datetime import datetime
+from logging import getLogger
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+from setup import JST
+
+logger = getLogger(__name__)
+
+JOB_WORKERS = 3  # 同時に実行するジョブの数
+JOB_MAX_PENDING = 30  # 実行待ちにできるジョブの数の上限 (全てのサーバーの合計)
+
+
+class Job():
+    def __init__(self, job_id: int, guild_id: int, name: str, user_name: str, func: Callable[[], Awaitable[None]]) -> None:
+        self.job_id = job_id
+        self.guild_id = guild_id
+        self.name = name
+        self.user_name = user_name
+        self.func = func
+        self.created: datetime = datetime.now(JST)
+        self.started: Optional[datetime] = None
+
+
+class JobQueue():
+    """時間のかかるコマンドの処理を順番に実行する
+
+    サーバーごとに実行待ちの列を持ち、サーバーを順番に回して1件ずつ取り出すため、
+    1つのサーバーがまとめて登録しても他のサーバーのジョブが待たされ続けることはない。
+    同じサーバーのジョブは同時に1件だけ実行する。
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_pending: int = JOB_MAX_PENDING) -> None:
+        self.worker_count = workers
+        self.max_pending = max_pending
+        self.pending: Dict[int, Deque[Job]] = {}  # guild_id -> 実行待ちのジョブ
+        self.guild_order: Deque[int] = deque()  # 次にジョブを取り出すサーバーの順番
+        self.running: Dict[int, Job] = {}  # job_id -> 実行中のジョブ
+        self.condition = asyncio.Condition()
+        self.workers: List[asyncio.Task] = []
+        self.job_ids = itertools.count(1)
+
+    @property
+    def pending_count(self) -> int:
+        return sum(len(jobs) for jobs in self.pending.values())
+
+    async def submit(
+        self, guild_id: int, name: str, user_name: str, func: Callable[[], Awaitable[None]]
+    ) -> Optional[Job]:
+        """ジョブを登録する。実行待ちが上限に達している場合はNoneを返す"""
+        if not self.workers:
+            self.workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+        async with self.condition:
+            if self.pending_count >= self.max_pending:
+                return None
+            job = Job(next(self.job_ids), guild_id, name, user_name, func)
+            if guild_id not in self.pending:
+                self.pending[guild_id] = deque()
+                self.guild_order.append(guild_id)
+            self.pending[guild_id].append(job)
+            self.condition.notify()
+            return job
+
+    def get_jobs(self, guild_id: int) -> List[Job]:
+        """サーバーの実行中・実行待ちのジョブ"""
+        running = [job for job in self.running.values() if job.guild_id == guild_id]
+        return running + list(self.pending.get(guild_id, []))
+
+    def _next_job(self) -> Optional[Job]:
+        running_guild_ids = {job.guild_id for job in self.running.values()}
+        for _ in range(len(self.guild_order)):
+            guild_id = self.guild_order.popleft()
+            if guild_id in running_guild_ids:
+                self.guild_order.append(guild_id)
+                continue
+            jobs = self.pending[guild_id]
+            job = jobs.popleft()
+            if jobs:
+                self.guild_order.append(guild_id)
+            else:
+                del self.pending[guild_id]
+            return job
+        return None
+
+    async def _worker(self) -> None:
+        while True:
+            async with self.condition:
+                while (job := self._next_job()) is None:
+                    await self.condition.wait()
+                self.running[job.job_id] = job
+            job.started = datetime.now(JST)
+            try:
+                await job.func()
+            except Exception:
+                logger.exception(f"job failed: {job.name}, guild_id={job.guild_id}")
+            finally:
+                async with self.condition:
+                    del self.running[job.job_id]
+                    # 同じサーバーの次のジョブを実行できるようになったため、待っているワーカーを起こす
+                    self.condition.notify_all()
+
+    def close(self) -> None:
+        for worker in self.workers:
+            worker.cancel()
+        self.workers = []
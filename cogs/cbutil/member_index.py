@@ -0,0 +1,80 @@
+import re
+from bisect import bisect_left
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import jaconv
+
+from cogs.cbutil.clan_data import ClanData
+from cogs.cbutil.name_cache import NameCache
+
+AUTOCOMPLETE_LIMIT = 25  # Discordが表示できる候補の数の上限
+
+MENTION_PATTERN = re.compile(r"<@!?(\d+)>")
+
+
+def normalize_name(name: str) -> str:
+    """表記ゆれを吸収した検索用の名前
+
+    半角カナは全角に、ひらがなはカタカナに、全角英数字は半角にそろえて小文字にする
+    """
+    name = jaconv.h2z(name, kana=True, ascii=False, digit=False)
+    name = jaconv.hira2kata(name)
+    return jaconv.z2h(name, kana=False, ascii=True, digit=True).lower().strip()
+
+
+class MemberIndex():
+    """クランのメンバーを表示名の前方一致で探すための索引
+
+    正規化した表示名でソートしておき、二分探索で前方一致する範囲だけを取り出す。
+    """
+
+    def __init__(self, user_ids: FrozenSet[int], names: Dict[int, str]) -> None:
+        self.user_ids = user_ids
+        self.names = names  # user_id -> 表示名
+        self.entries: List[Tuple[str, int]] = sorted((normalize_name(name), user_id) for user_id, name in names.items())
+        self.keys = [key for key, _ in self.entries]
+
+    def search(self, text: str, limit: int = AUTOCOMPLETE_LIMIT) -> List[Tuple[int, str]]:
+        """前方一致するメンバーの (user_id, 表示名) を表示名の順に返す"""
+        prefix = normalize_name(text)
+        result = []
+        for key, user_id in self.entries[bisect_left(self.keys, prefix):]:
+            if not key.startswith(prefix) or len(result) >= limit:
+                break
+            result.append((user_id, self.names[user_id]))
+        return result
+
+    def find(self, text: str) -> Optional[int]:
+        """オートコンプリートで選ばれたID・メンション・表示名からメンバーのuser_idを探す"""
+        text = text.strip()
+        if match := MENTION_PATTERN.fullmatch(text):
+            text = match.group(1)
+        if text.isdecimal() and int(text) in self.user_ids:
+            return int(text)
+        candidates = self.search(text)
+        exact = [user_id for user_id, name in candidates if normalize_name(name) == normalize_name(text)]
+        if len(exact) == 1:
+            return exact[0]
+        if len(candidates) == 1:
+            return candidates[0][0]
+        return None
+
+
+class MemberIndexCache():
+    """クランごとの索引を保持し、メンバーや表示名が変わったときだけ作りなおす"""
+
+    def __init__(self, name_cache: NameCache) -> None:
+        self.name_cache = name_cache
+        self.indexes: Dict[int, Tuple[int, MemberIndex]] = {}  # category_id -> (表示名キャッシュのバージョン, 索引)
+
+    def get(self, clan_data: ClanData) -> MemberIndex:
+        cached = self.indexes.get(clan_data.category_id)
+        if cached and cached[0] == self.name_cache.version and cached[1].user_ids == clan_data.player_data_dict.keys():
+            return cached[1]
+        names = {
+            user_id: self.name_cache.get(clan_data.guild_id, user_id) or str(user_id)
+            for user_id in clan_data.player_data_dict
+        }
+        index = MemberIndex(frozenset(names), names)
+        self.indexes[clan_data.category_id] = (self.name_cache.version, index)
+        return index
@@ -0,0 +1,60 @@
+from logging import getLogger
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+import discord
+
+from cogs.cbutil.sqlite_util import SQLiteUtil
+
+logger = getLogger(__name__)
+
+
+class NameCache():
+    """凸管理対象メンバーの表示名を保持するキャッシュ
+
+    membersインテントでギルドの全メンバーを取得する代わりに、
+    インタラクションやリアクションで受け取ったメンバー情報と個別に取得した情報だけを保持する。
+    """
+
+    def __init__(self) -> None:
+        self.display_names: Dict[Tuple[int, int], str] = {}
+        # 個別取得に失敗したメンバー (退出済みなど)。何度もAPIを叩かないように記録しておく
+        self.missing: Set[Tuple[int, int]] = set()
+        self.version: int = 0  # 表示名が変わるたびに増やす (検索用の索引の作りなおしに使う)
+
+    def load(self) -> None:
+        """SQLiteに保存してある表示名を読み込む"""
+        self.display_names = SQLiteUtil.load_display_names()
+        self.version += 1
+
+    def get(self, guild_id: int, user_id: int) -> Optional[str]:
+        return self.display_names.get((guild_id, user_id))
+
+    def update(self, member: discord.abc.User) -> None:
+        """メンバー情報から表示名を更新する。変化があった場合のみ保存する"""
+        if not isinstance(member, discord.Member):
+            return
+        key = (member.guild.id, member.id)
+        self.missing.discard(key)
+        if self.display_names.get(key) == member.display_name:
+            return
+        self.display_names[key] = member.display_name
+        self.version += 1
+        SQLiteUtil.register_display_name(member.guild.id, member.id, member.display_name)
+
+    async def resolve(self, guild: discord.Guild, user_ids: Iterable[int]) -> None:
+        """キャッシュにない表示名だけを個別に取得する"""
+        for user_id in user_ids:
+            key = (guild.id, user_id)
+            if key in self.display_names or key in self.missing:
+                continue
+            member = guild.get_member(user_id)
+            if member is None:
+                try:
+                    member = await guild.fetch_member(user_id)
+                except (discord.NotFound, discord.Forbidden):
+                    self.missing.add(key)
+                    continue
+                except discord.HTTPException as e:
+                    logger.warning(f"failed to fetch member: user_id={user_id}, {e}")
+                    continue
+            self.update(member)
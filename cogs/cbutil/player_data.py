@@ -1,6 +1,6 @@
 import copy
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 
 from cogs.cbutil.attack_type import AttackType
 from cogs.cbutil.clan_battle_data import ClanBattleData
@@ -30,7 +30,8 @@ class PlayerData():
         self.magic_attack: int = 0
         self.log: List[LogData] = []
         self.carry_over_list: List[CarryOver] = []
-        self.raw_limit_time_text: str = ""
+        self.limit_time: int = 0  # 参戦可能時間のビットマスク
+        self.limit_time_text_cache: Optional[Tuple[int, str]] = None  # (時, 表示用テキスト)
         self.task_kill: bool = False
 
     def initialize_attack(self) -> None:
@@ -39,16 +40,31 @@ class PlayerData():
         self.magic_attack = 0
         self.carry_over_list = []
         self.task_kill = False
-        self.raw_limit_time_text = ""
+        self.set_limit_time(0)
         self.log = []
 
+    def set_limit_time(self, limit_time: int) -> None:
+        """参戦可能時間を設定し、表示用テキストのキャッシュを破棄する"""
+        self.limit_time = limit_time
+        self.limit_time_text_cache = None
+
+    def get_limit_time_text(self) -> str:
+        """参戦可能時間の表示用テキストを取得する
+
+        表示内容は時が変わるまで変化しないため、時ごとにキャッシュする
+        """
+        now_hour = datetime.now(JST).hour
+        if self.limit_time_text_cache is None or self.limit_time_text_cache[0] != now_hour:
+            self.limit_time_text_cache = (now_hour, create_limit_time_text(self.limit_time, now_hour))
+        return self.limit_time_text_cache[1]
+
     def create_txt(self, display_name: str) -> str:
         """残凸表示時のメッセージを作成する"""
         txt = f"{display_name}\t{EMOJI_PHYSICS}{self.physics_attack} {EMOJI_MAGIC}{self.magic_attack}"
         if self.task_kill:
             txt += f" {EMOJI_TASK_KILL}"
-        if self.raw_limit_time_text:
-            txt += " " + create_limit_time_text(self.raw_limit_time_text)
+        if self.limit_time:
+            txt += " " + self.get_limit_time_text()
         if self.carry_over_list:
             txt += "\n　　- " + '\n　　- '.join([str(carry_over) for carry_over in self.carry_over_list])
         return txt
@@ -58,8 +74,8 @@ class PlayerData():
         txt = f"\n　　- {display_name} "\
             + f"({self.physics_attack+self.magic_attack}/3"\
             + f" 物{self.physics_attack}魔{self.magic_attack})" + self.task_kill * f" {EMOJI_TASK_KILL}"
-        if self.raw_limit_time_text:
-            txt += " " + create_limit_time_text(self.raw_limit_time_text)
+        if self.limit_time:
+            txt += " " + self.get_limit_time_text()
         return txt
 
     def from_dict(self, dict) -> None:
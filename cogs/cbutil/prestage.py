@@ -0,0 +1,82 @@
+import asyncio
+from logging import getLogger
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+import discord
+
+from cogs.cbutil.boss_status_data import BossStatusData
+from setup import PRESTAGE_HP_RATE
+
+logger = getLogger(__name__)
+
+StageKey = Tuple[int, int, int]  # (カテゴリーのID, 周回数, ボスのindex)
+
+
+def should_prestage(boss_status_data: BossStatusData) -> bool:
+    """次の周回の進行用メッセージを前もって準備するかどうか
+
+    残りHPが少ない場合か、凸宣言のダメージの合計が残りHPを超えている場合に準備する
+    """
+    if boss_status_data.beated:
+        return False
+    current_hp = boss_status_data.max_hp
+    declared_damage = 0
+    for attack_status in boss_status_data.attack_players:
+        if attack_status.attacked:
+            current_hp -= attack_status.damage
+        else:
+            declared_damage += attack_status.damage
+    return current_hp <= boss_status_data.max_hp * PRESTAGE_HP_RATE or declared_damage >= current_hp
+
+
+class ProgressStager():
+    """討伐前に送信しておく次の周回の進行用メッセージを管理する
+
+    準備したメッセージは討伐時に編集して使う。討伐されずに条件を満たさなくなった場合は削除する。
+    準備したメッセージはメモリ上でのみ管理するため、再起動時に残っていたものはそのままになる。
+    """
+
+    def __init__(self) -> None:
+        self.tasks: Dict[StageKey, asyncio.Task] = {}
+        self.discard_tasks: Set[asyncio.Task] = set()
+
+    def is_staged(self, key: StageKey) -> bool:
+        return key in self.tasks
+
+    def stage(self, key: StageKey, send: Callable[[], Awaitable[discord.Message]]) -> None:
+        """メッセージをバックグラウンドで送信する"""
+        if key not in self.tasks:
+            self.tasks[key] = asyncio.create_task(send())
+
+    async def take(self, key: StageKey) -> Optional[discord.Message]:
+        """準備したメッセージを取り出す。送信中であれば完了を待つ"""
+        task = self.tasks.pop(key, None)
+        if task is None:
+            return None
+        try:
+            return await task
+        except Exception:
+            logger.exception(f"failed to prestage progress message: key={key}")
+            return None
+
+    def discard(self, key: StageKey) -> None:
+        """準備したメッセージを削除する"""
+        task = self.tasks.pop(key, None)
+        if task is None:
+            return
+        discard_task = asyncio.create_task(self._delete(task))
+        self.discard_tasks.add(discard_task)
+        discard_task.add_done_callback(self.discard_tasks.discard)
+
+    def discard_clan(self, category_id: int) -> None:
+        for key in [key for key in self.tasks if key[0] == category_id]:
+            self.discard(key)
+
+    async def _delete(self, task: asyncio.Task) -> None:
+        try:
+            message: discord.Message = await task
+            await message.delete()
+        except (discord.NotFound, discord.Forbidden):
+            pass
+        except Exception:
+            logger.exception("failed to delete prestaged progress message")
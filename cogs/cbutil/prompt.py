@@ -0,0 +1,116 @@
+import asyncio
+import heapq
+import itertools
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import discord
+
+PROMPT_TIMEOUT = 60.0  # 応答を待つ秒数
+
+PromptKey = Tuple[str, int, int]  # ("message", user_id, channel_id) または ("reaction", user_id, message_id)
+
+
+class Prompt():
+    def __init__(self, future: asyncio.Future, check: Optional[Callable]) -> None:
+        self.future = future
+        self.check = check
+
+
+class PromptRegistry():
+    """ユーザーからの応答を待っているプロンプトを管理する
+
+    bot.wait_for はイベントごとに待っている全てのcheckを実行するため、
+    (ユーザー, チャンネルまたはメッセージ) をキーにした辞書で該当するプロンプトだけを探す。
+    タイムアウトは期限の近い順に並べたヒープと1つのタイマーでまとめて処理する。
+    """
+
+    def __init__(self) -> None:
+        self.prompts: Dict[PromptKey, Prompt] = {}
+        self.deadlines: List[Tuple[float, int, Prompt]] = []
+        self.counter = itertools.count()
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+    def wait_message(
+        self, user_id: int, channel_id: int,
+        check: Optional[Callable[[discord.Message], bool]] = None, timeout: float = PROMPT_TIMEOUT
+    ) -> "asyncio.Future[discord.Message]":
+        """チャンネルへのユーザーのメッセージを待つ。タイムアウト時は asyncio.TimeoutError になる"""
+        return self._register(("message", user_id, channel_id), check, timeout)
+
+    def wait_reaction(
+        self, user_id: int, message_id: int, emojis: Sequence[str], timeout: float = PROMPT_TIMEOUT
+    ) -> "asyncio.Future[str]":
+        """メッセージへのユーザーのリアクションを待ち、付けられた絵文字を返す
+
+        呼び出した時点で登録されるため、リアクションを付け終わる前に押された場合も受け付けられる
+        """
+        return self._register(("reaction", user_id, message_id), lambda emoji: emoji in emojis, timeout)
+
+    def dispatch_message(self, message: discord.Message) -> bool:
+        """待っているプロンプトがあればメッセージを渡す。渡した場合はTrueを返す"""
+        return self._dispatch(("message", message.author.id, message.channel.id), message)
+
+    def dispatch_reaction(self, payload: discord.RawReactionActionEvent) -> bool:
+        """待っているプロンプトがあればリアクションを渡す。渡した場合はTrueを返す"""
+        return self._dispatch(("reaction", payload.user_id, payload.message_id), str(payload.emoji))
+
+    def _register(self, key: PromptKey, check: Optional[Callable], timeout: float) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        # 同じユーザーが同じ場所で待っている古いプロンプトは打ち切る
+        if old_prompt := self.prompts.pop(key, None):
+            self._expire_prompt(old_prompt)
+
+        prompt = Prompt(loop.create_future(), check)
+        self.prompts[key] = prompt
+
+        def remove(_):
+            if self.prompts.get(key) is prompt:
+                del self.prompts[key]
+        prompt.future.add_done_callback(remove)
+
+        heapq.heappush(self.deadlines, (loop.time() + timeout, next(self.counter), prompt))
+        self._schedule(loop)
+        return prompt.future
+
+    def _dispatch(self, key: PromptKey, value) -> bool:
+        prompt = self.prompts.get(key)
+        if prompt is None or prompt.future.done():
+            return False
+        if prompt.check is not None and not prompt.check(value):
+            return False
+        prompt.future.set_result(value)
+        return True
+
+    def _expire_prompt(self, prompt: Prompt) -> None:
+        if not prompt.future.done():
+            prompt.future.set_exception(asyncio.TimeoutError())
+
+    def _schedule(self, loop: asyncio.AbstractEventLoop) -> None:
+        """最も期限の近いプロンプトに合わせてタイマーを設定しなおす"""
+        if not self.deadlines:
+            return
+        deadline = self.deadlines[0][0]
+        if self.timer is not None:
+            if self.timer.when() <= deadline:
+                return
+            self.timer.cancel()
+        self.timer = loop.call_at(deadline, self._expire)
+
+    def _expire(self) -> None:
+        self.timer = None
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        # 応答済みのプロンプトも期限まではヒープに残っているため、ここでまとめて取り除く
+        while self.deadlines and self.deadlines[0][0] <= now:
+            _, _, prompt = heapq.heappop(self.deadlines)
+            self._expire_prompt(prompt)
+        self._schedule(loop)
+
+    def close(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        for prompt in list(self.prompts.values()):
+            prompt.future.cancel()
+        self.prompts = {}
+        self.deadlines = []
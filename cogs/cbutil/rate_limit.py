@@ -0,0 +1,90 @@
+import asyncio
+import time
+from typing import Dict, Hashable, Set, Tuple
+
+BUCKET_PRUNE_SIZE = 1000  # バケットの数がこれを超えたら使われていないものを取り除く
+
+
+class RateLimiter():
+    """一定の間隔以上を空けて処理を開始させる"""
+
+    def __init__(self, rate: float) -> None:
+        """
+        Parameters
+        ----------
+        rate : float
+            1秒あたりに開始できる処理の数
+        """
+        self.interval = 1 / rate
+        self.next_time = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self.lock:
+            now = time.monotonic()
+            if self.next_time > now:
+                await asyncio.sleep(self.next_time - now)
+                now = self.next_time
+            self.next_time = now + self.interval
+
+
+class TokenBucket():
+    """キーごとのトークンバケットで、短時間に集中した処理を捨てる
+
+    RateLimiter と違い待たずにその場で可否を返す。
+    """
+
+    def __init__(self, rate: float, capacity: int) -> None:
+        """
+        Parameters
+        ----------
+        rate : float
+            1秒あたりに補充されるトークンの数
+        capacity : int
+            バケットに貯められるトークンの数 (連続して受け付けられる数)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.buckets: Dict[Hashable, Tuple[float, float]] = {}  # key -> (トークンの数, 最後に補充した時刻)
+        self.suppressed = 0
+
+    def acquire(self, key: Hashable) -> bool:
+        """トークンを1つ消費する。トークンがなければFalseを返す"""
+        now = time.monotonic()
+        tokens, last = self.buckets.get(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - last) * self.rate)
+        if tokens < 1:
+            self.buckets[key] = (tokens, now)
+            self.suppressed += 1
+            return False
+        self.buckets[key] = (tokens - 1, now)
+        if len(self.buckets) > BUCKET_PRUNE_SIZE:
+            self._prune(now)
+        return True
+
+    def _prune(self, now: float) -> None:
+        """満タンまで回復したバケットは新しく作ったものと同じなので取り除く"""
+        full_time = self.capacity / self.rate
+        self.buckets = {key: value for key, value in self.buckets.items() if now - value[1] < full_time}
+
+
+class DedupeCache():
+    """処理中のイベントと同じイベントを重複として捨てる
+
+    処理が終わったらdone()を呼び出す。処理が終わった後に同じイベントが届いた場合は受け付ける。
+    """
+
+    def __init__(self) -> None:
+        self.in_flight: Set[Hashable] = set()
+        self.suppressed = 0
+
+    def check(self, key: Hashable) -> bool:
+        """処理中のキーでなければTrueを返して処理中にする。処理中のキーならFalseを返す"""
+        if key in self.in_flight:
+            self.suppressed += 1
+            return False
+        self.in_flight.add(key)
+        return True
+
+    def done(self, key: Hashable) -> None:
+        self.in_flight.discard(key)
@@ -0,0 +1,76 @@
+import asyncio
+import time
+from datetime import date, datetime, timedelta
+from logging import getLogger
+from typing import Awaitable, Callable, Dict, Optional
+
+from cogs.cbutil.clan_data import ClanData
+from setup import JST
+
+logger = getLogger(__name__)
+
+ROLLOVER_HOUR = 5  # 日付が切り替わる時刻
+ROLLOVER_DELAY = 5  # 切り替わりから実行するまでの秒数 (時計のずれを吸収する)
+ROLLOVER_STAGGER = 2  # クランごとに開始をずらす秒数
+ROLLOVER_MAX_CONCURRENCY = 3  # 同時に日付更新を行うクランの数
+
+
+def get_today(now: datetime) -> date:
+    """5時を区切りにした今日の日付"""
+    return (now - timedelta(hours=ROLLOVER_HOUR)).date()
+
+
+def get_next_rollover(now: datetime) -> datetime:
+    """次に日付が切り替わる日時"""
+    rollover = now.replace(hour=ROLLOVER_HOUR, minute=0, second=0, microsecond=0) + timedelta(seconds=ROLLOVER_DELAY)
+    if rollover <= now:
+        rollover += timedelta(days=1)
+    return rollover
+
+
+class DailyRolloverScheduler():
+    """毎日5時に全てのクランの日付更新を実行する
+
+    起動時にも日付が古いままのクランを更新する。
+    更新そのもの (rollover) は呼び出し側で日付を確認してから行うため、
+    凸のリアクションなどから先に更新されていた場合は何もしない。
+    """
+
+    def __init__(self) -> None:
+        self.semaphore = asyncio.Semaphore(ROLLOVER_MAX_CONCURRENCY)
+
+    async def _rollover_task(
+        self, clan_data: ClanData, delay: float, rollover: Callable[[ClanData], Awaitable[None]]
+    ) -> None:
+        await asyncio.sleep(delay)
+        async with self.semaphore:
+            try:
+                await rollover(clan_data)
+            except Exception:
+                logger.exception(f"failed to roll over: category_id={clan_data.category_id}")
+
+    async def rollover_all(
+        self, clan_data_dict: Dict[int, Optional[ClanData]], rollover: Callable[[ClanData], Awaitable[None]]
+    ) -> None:
+        """全てのクランを少しずつずらして更新する"""
+        started = time.perf_counter()
+        today = get_today(datetime.now(JST))
+        clan_data_list = [
+            clan_data for clan_data in list(clan_data_dict.values())
+            if clan_data is not None and clan_data.date != today
+        ]
+        if not clan_data_list:
+            return
+        await asyncio.gather(*[
+            self._rollover_task(clan_data, i * ROLLOVER_STAGGER, rollover)
+            for i, clan_data in enumerate(clan_data_list)
+        ])
+        logger.info(f"rollover finished: clans={len(clan_data_list)}, {time.perf_counter() - started:.1f}s")
+
+    async def run(
+        self, clan_data_dict: Dict[int, Optional[ClanData]], rollover: Callable[[ClanData], Awaitable[None]]
+    ) -> None:
+        while True:
+            await self.rollover_all(clan_data_dict, rollover)
+            wait = get_next_rollover(datetime.now(JST)) - datetime.now(JST)
+            await asyncio.sleep(max(wait.total_seconds(), 0))
@@ -0,0 +1,265 @@
+from typing import Dict, List, Optional, Set, Tuple
+
+from cogs.cbutil.clan_data import ClanData
+from cogs.cbutil.finishing_blow import plan_finishing_blow
+from cogs.cbutil.player_data import PlayerData
+
+ROUTE_MAX_ROUNDS = 30  # 計画する周回の上限
+MAX_LAP_AHEAD = 1  # 最も遅れているボスから何周先まで挑戦できるか
+CARRY_OVER_UNKNOWN_TIME = 20  # 秒数が入力されていない持ち越しの見積もり
+
+
+class MinCostFlow():
+    """最短路を繰り返し求める最小費用流
+
+    費用が負の辺を扱えるようにBellman-Ford (SPFA) で最短路を求め、
+    費用が負の経路がなくなった時点で止める (流量ではなく費用を最小化する)。
+    """
+
+    def __init__(self, node_count: int) -> None:
+        self.graph: List[List[List[int]]] = [[] for _ in range(node_count)]  # [行き先, 容量, 費用, 逆辺のindex]
+
+    def add_edge(self, frm: int, to: int, capacity: int, cost: int) -> Tuple[int, int]:
+        """辺を追加して、流量を調べるための (frm, index) を返す"""
+        self.graph[frm].append([to, capacity, cost, len(self.graph[to])])
+        self.graph[to].append([frm, 0, -cost, len(self.graph[frm]) - 1])
+        return frm, len(self.graph[frm]) - 1
+
+    def get_flow(self, edge: Tuple[int, int]) -> int:
+        frm, index = edge
+        to, _, _, rev = self.graph[frm][index]
+        return self.graph[to][rev][1]
+
+    def flow(self, source: int, sink: int) -> int:
+        total_cost = 0
+        node_count = len(self.graph)
+        while True:
+            dist = [None] * node_count
+            prev: List[Optional[Tuple[int, int]]] = [None] * node_count
+            in_queue = [False] * node_count
+            dist[source] = 0
+            queue = [source]
+            in_queue[source] = True
+            while queue:
+                node = queue.pop()
+                in_queue[node] = False
+                for i, (to, capacity, cost, _) in enumerate(self.graph[node]):
+                    if capacity > 0 and (dist[to] is None or dist[node] + cost < dist[to]):
+                        dist[to] = dist[node] + cost
+                        prev[to] = (node, i)
+                        if not in_queue[to]:
+                            queue.append(to)
+                            in_queue[to] = True
+            if dist[sink] is None or dist[sink] >= 0:
+                return total_cost
+
+            amount = None
+            node = sink
+            while node != source:
+                frm, i = prev[node]
+                capacity = self.graph[frm][i][1]
+                amount = capacity if amount is None else min(amount, capacity)
+                node = frm
+            node = sink
+            while node != source:
+                frm, i = prev[node]
+                edge = self.graph[frm][i]
+                edge[1] -= amount
+                self.graph[node][edge[3]][1] += amount
+                node = frm
+            total_cost += amount * dist[sink]
+
+
+class RouteAttacker():
+    def __init__(self, player_data: PlayerData, damages: Dict[int, int], count: int, carry_over: bool) -> None:
+        self.player_data = player_data
+        self.damages = damages  # ボスのindex -> 見込みダメージ
+        self.count = count  # 残りの凸数
+        self.carry_over = carry_over
+
+
+class RouteStep():
+    def __init__(self, lap: int, boss_index: int, hp: int) -> None:
+        self.lap = lap
+        self.boss_index = boss_index
+        self.hp = hp  # 凸を始める時点の残りHP
+        self.attacks: List[Tuple[RouteAttacker, int]] = []  # (凸する人, ダメージ) を凸する順に並べる
+        self.beated = False
+        self.carry_over_time = 0
+
+
+def _create_attackers(clan_data: ClanData) -> List[RouteAttacker]:
+    """予約のダメージから凸する人ごとの見込みダメージを集める"""
+    damages: Dict[int, Dict[int, int]] = {}
+    carry_over_damages: Dict[int, Dict[int, int]] = {}
+    for boss_index, reserve_data_list in enumerate(clan_data.reserve_list):
+        for reserve_data in reserve_data_list:
+            if reserve_data.damage <= 0:
+                continue
+            target = carry_over_damages if reserve_data.carry_over else damages
+            user_damages = target.setdefault(reserve_data.player_data.user_id, {})
+            user_damages[boss_index] = max(user_damages.get(boss_index, 0), reserve_data.damage)
+
+    attackers = []
+    for user_id, player_data in clan_data.player_data_dict.items():
+        remain_attack = 3 - player_data.physics_attack - player_data.magic_attack
+        if remain_attack > 0 and user_id in damages:
+            attackers.append(RouteAttacker(player_data, damages[user_id], remain_attack, False))
+        for carry_over in player_data.carry_over_list:
+            carry_over_damage = carry_over_damages.get(user_id)
+            if carry_over_damage is None and user_id in damages:
+                carry_over_time = carry_over.carry_over_time
+                if carry_over_time <= 0:
+                    carry_over_time = CARRY_OVER_UNKNOWN_TIME
+                carry_over_damage = {
+                    boss_index: damage * carry_over_time // 90 for boss_index, damage in damages[user_id].items()
+                }
+            if carry_over_damage:
+                attackers.append(RouteAttacker(player_data, carry_over_damage, 1, True))
+    return attackers
+
+
+def _required_attack_count(hp: int, damages: List[int]) -> int:
+    """ダメージの大きい順に凸した場合に討伐に必要な人数。足りない場合は全員"""
+    total = 0
+    for i, damage in enumerate(sorted(damages, reverse=True)):
+        total += damage
+        if total >= hp:
+            return i + 1
+    return len(damages)
+
+
+def _assign_attacks(
+    active: List[RouteAttacker], open_bosses: List[int], boss_hps: List[int], used: List[Set[int]]
+) -> Dict[int, List[RouteAttacker]]:
+    """凸できる人から挑戦できるボスへの最小費用流で、この周に凸を割り当てる"""
+    source, sink = 0, 1
+    boss_node = {boss_index: 2 + i for i, boss_index in enumerate(open_bosses)}
+    attacker_node_start = 2 + len(open_bosses)
+    mcf = MinCostFlow(attacker_node_start + len(active))
+    assign_edges: Dict[int, List[Tuple[RouteAttacker, Tuple[int, int]]]] = {
+        boss_index: [] for boss_index in open_bosses
+    }
+    for i, attacker in enumerate(active):
+        node = attacker_node_start + i
+        mcf.add_edge(source, node, attacker.count, 0)
+        for boss_index in open_bosses:
+            damage = attacker.damages.get(boss_index, 0)
+            if damage <= 0 or (not attacker.carry_over and attacker.player_data.user_id in used[boss_index]):
+                continue
+            edge = mcf.add_edge(node, boss_node[boss_index], 1, -min(damage, boss_hps[boss_index]))
+            assign_edges[boss_index].append((attacker, edge))
+    for boss_index in open_bosses:
+        # 討伐に必要な人数より1人多い分まで受け入れ、誰で討伐するかは後で絞り込む
+        required = _required_attack_count(
+            boss_hps[boss_index], [attacker.damages[boss_index] for attacker, _ in assign_edges[boss_index]])
+        mcf.add_edge(boss_node[boss_index], sink, required + 1, 0)
+    mcf.flow(source, sink)
+
+    return {
+        boss_index: [attacker for attacker, edge in assign_edges[boss_index] if mcf.get_flow(edge)]
+        for boss_index in open_bosses
+    }
+
+
+def _create_partial_step(lap: int, boss_index: int, hp: int, attacker_list: List[RouteAttacker]) -> RouteStep:
+    """討伐しないボスに、割り当てた凸をダメージの大きい順に並べる"""
+    step = RouteStep(lap, boss_index, hp)
+    for attacker in sorted(attacker_list, key=lambda x: x.damages[boss_index], reverse=True):
+        step.attacks.append((attacker, attacker.damages[boss_index]))
+        attacker.count -= 1
+    return step
+
+
+def _create_finish_step(
+    lap: int, boss_index: int, hp: int, attacker_list: List[RouteAttacker]
+) -> Tuple[RouteStep, Optional[RouteAttacker]]:
+    """討伐できるボスに、持ち越しが最大になるよう凸する人と順番を決める
+
+    Returns
+    -------
+    Tuple[RouteStep, Optional[RouteAttacker]]
+        討伐までの計画と、〆で発生する持ち越し (持ち越しで討伐した場合はNone)
+    """
+    finish_plan = plan_finishing_blow(hp, [attacker.damages[boss_index] for attacker in attacker_list])
+    step = RouteStep(lap, boss_index, hp)
+    for i in finish_plan.order:
+        attacker = attacker_list[i]
+        step.attacks.append((attacker, attacker.damages[boss_index]))
+        attacker.count -= 1
+    step.beated = True
+    finisher = attacker_list[finish_plan.finisher]
+    # 持ち越しで討伐した場合は持ち越しが発生しない
+    if finisher.carry_over:
+        return step, None
+    step.carry_over_time = finish_plan.carry_over_time
+    carry_over = RouteAttacker(
+        finisher.player_data,
+        {
+            i: damage * finish_plan.carry_over_time // 90
+            for i, damage in finisher.damages.items()
+        },
+        1,
+        True
+    )
+    return step, carry_over
+
+
+def solve_route(clan_data: ClanData) -> Tuple[List[RouteStep], List[RouteAttacker]]:
+    """残りの凸をどのボス・周回に割り当てると最も先まで進めるかを求める
+
+    1周ごとに、凸できる人から挑戦できるボスへの最小費用流で凸を割り当てる。
+    同じ周の同じボスには1人1回まで (持ち越しは別扱い) で、
+    費用は与えるダメージ (残りHPが上限) の符号を反転したもの。
+    討伐できるボスは持ち越しが最大になるよう凸する人を絞り込み、余った凸は次の周に回す。
+    どのボスも討伐できなくなったら、残りの凸で削れるだけ削って終了する。
+
+    Returns
+    -------
+    Tuple[List[RouteStep], List[RouteAttacker]]
+        凸する順の計画と、割り当てられなかった凸
+    """
+    hp_profile = clan_data.get_hp_profile()
+    attackers = _create_attackers(clan_data)
+
+    boss_laps, boss_hps, used = map(list, zip(*clan_data.get_boss_progress()))
+
+    steps: List[RouteStep] = []
+    for _ in range(ROUTE_MAX_ROUNDS):
+        active = [attacker for attacker in attackers if attacker.count > 0]
+        if not active:
+            break
+        min_lap = min(boss_laps)
+        min_tier = hp_profile.get_tier(min_lap)
+        # 段階が変わる周回には、全てのボスが前の段階を終えるまで進めない
+        open_bosses = [
+            boss_index for boss_index in range(5)
+            if boss_laps[boss_index] <= min_lap + MAX_LAP_AHEAD
+            and hp_profile.get_tier(boss_laps[boss_index]) == min_tier
+        ]
+
+        assigned = _assign_attacks(active, open_bosses, boss_hps, used)
+        beated_bosses = [
+            boss_index for boss_index in open_bosses
+            if sum(attacker.damages[boss_index] for attacker in assigned[boss_index]) >= boss_hps[boss_index]
+        ]
+        if not beated_bosses:
+            # 討伐できるボスがないので、割り当てた凸で削って終わる
+            steps.extend(
+                _create_partial_step(boss_laps[boss_index], boss_index, boss_hps[boss_index], assigned[boss_index])
+                for boss_index in open_bosses if assigned[boss_index]
+            )
+            break
+
+        for boss_index in beated_bosses:
+            step, carry_over = _create_finish_step(
+                boss_laps[boss_index], boss_index, boss_hps[boss_index], assigned[boss_index])
+            if carry_over is not None:
+                attackers.append(carry_over)
+            steps.append(step)
+            boss_laps[boss_index] += 1
+            boss_hps[boss_index] = hp_profile.get_hp(boss_laps[boss_index], boss_index)
+            used[boss_index] = set()
+        # 討伐しないボスに割り当てた凸は使わずに次の周に回す
+
+    return steps, [attacker for attacker in attackers if attacker.count > 0]
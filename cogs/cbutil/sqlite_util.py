@@ -1,10 +1,14 @@
 import sqlite3
 from collections import defaultdict
-from typing import DefaultDict, List, Optional
+from datetime import date, datetime
+from typing import DefaultDict, Dict, List, Optional, Tuple
 
 from cogs.cbutil.attack_type import ATTACK_TYPE_DICT
 from cogs.cbutil.boss_status_data import AttackStatus, BossStatusData
 from cogs.cbutil.clan_data import ClanData
+from cogs.cbutil.daily_report import DailyReport, get_day_range
+from cogs.cbutil.damage_stats import DamageStat, DamageStatKey
+from cogs.cbutil.hp_profile import HpProfile
 from cogs.cbutil.player_data import CarryOver, PlayerData
 from cogs.cbutil.reserve_data import ReserveData
 from setup import DB_NAME, JST
@@ -201,22 +205,28 @@ REGISTER_SUMMARY_MESSAGEID_DATA = """
 insert into SummaryMessageIdData values (
     :category_id,
     :lap,
-    :boss1,
-    :boss2,
-    :boss3,
-    :boss4,
-    :boss5
+    :message_id
 )"""
 UPDATE_SUMMARY_MESSAGE_DATA = """
 update SummaryMessageIdData
     set
-        boss1=?,
-        boss2=?,
-        boss3=?,
-        boss4=?,
-        boss5=?
+        message_id=?
     where
         category_id=? and lap=?"""
+# ボスごとに5つあったまとめのメッセージIDを1つにする。1体目のメッセージを5体分のメッセージとして使う
+MIGRATE_SUMMARY_MESSAGE_DATA = """
+begin;
+create table SummaryMessageIdDataNew (
+    category_id int,
+    lap int,
+    message_id int
+);
+insert into SummaryMessageIdDataNew select category_id, lap, boss1 from SummaryMessageIdData;
+drop table SummaryMessageIdData;
+alter table SummaryMessageIdDataNew rename to SummaryMessageIdData;
+commit;
+"""
+SELECT_OLD_SUMMARY_MESSAGE_IDS_SQL = """select category_id, boss2, boss3, boss4, boss5 from SummaryMessageIdData"""
 DELETE_OLD_SUMMARY_MESSAGE_DATA = """DELETE FROM SummaryMessageIdData
 where
     category_id=? and lap<?"""
@@ -229,10 +239,101 @@ where
 DELETE_OLD_BOSS_STATUS_DATA = """DELETE FROM BossStatusData
 where
     category_id=? and lap<?"""
+REGISTER_DISPLAY_NAME_DATA_SQL = """insert or replace into DisplayNameData values (
+    :guild_id,
+    :user_id,
+    :display_name,
+    :updated
+)"""
+REGISTER_HP_PROFILE_DATA_SQL = """insert or replace into HpProfileData values (
+    :category_id,
+    :profile,
+    :updated
+)"""
+DELETE_HP_PROFILE_DATA_SQL = """delete from HpProfileData where category_id=?"""
+REGISTER_DAMAGE_STATS_SQL = """insert or replace into DamageStats values (
+    :category_id,
+    :user_id,
+    :boss_index,
+    :tier,
+    :count,
+    :total,
+    :total_sq,
+    :min_damage,
+    :max_damage
+)"""
+DELETE_DAMAGE_STATS_SQL = """delete from DamageStats
+where
+    category_id=? and user_id=? and boss_index=? and tier=?"""
+DAILY_REPORT_BOSS_DAMAGE_SQL = """select boss_index, count(*), sum(damage), sum(carry_over)
+from AttackStatus
+where
+    category_id=? and attacked=1 and created>=? and created<?
+group by boss_index"""
+DAILY_REPORT_BEATED_SQL = """select count(*), min(b.lap), max(b.lap)
+from BossStatusData b
+where
+    b.category_id=? and b.beated=1 and exists (
+        select 1 from AttackStatus a
+        where
+            a.category_id=b.category_id and a.lap=b.lap and a.boss_index=b.boss_index
+            and a.attacked=1 and a.created>=? and a.created<?
+    )"""
+DAILY_REPORT_MISSED_ATTACK_SQL = """select user_id, 3 - physics_attack - magic_attack
+from PlayerData
+where
+    category_id=? and physics_attack + magic_attack < 3"""
+DAILY_REPORT_WASTED_CARRYOVER_SQL = """select user_id, count(*)
+from CarryOver
+where
+    category_id=?
+group by user_id"""
+SETUP_SQL_PATH = "setup.sql"
 
 class SQLiteUtil():
     con = sqlite3.connect(DB_NAME, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
 
+    @staticmethod
+    def setup_database() -> List[Tuple[int, int]]:
+        """setup.sqlを実行して不足しているテーブルを作成する
+
+        Returns
+        -------
+        List[Tuple[int, int]]
+            変換で不要になったまとめ用のメッセージの (category_id, message_id)
+        """
+        con = sqlite3.connect(DB_NAME, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+        try:
+            with open(SETUP_SQL_PATH, encoding="utf-8") as f:
+                con.executescript(f.read())
+            con.commit()
+            return SQLiteUtil.migrate_database(con)
+        finally:
+            con.close()
+
+    @staticmethod
+    def migrate_database(con: sqlite3.Connection) -> List[Tuple[int, int]]:
+        """以前の形式のテーブルを現在の形式に変換する
+
+        変換は1つのトランザクションで行い、途中で失敗した場合は変換前に戻す。
+        まとめ用のメッセージは周回ごとに1つになったため、2～5ボスのメッセージのIDを返す
+        """
+        columns = [row[1] for row in con.execute("pragma table_info(SummaryMessageIdData)")]
+        if "boss1" not in columns:
+            return []
+        old_message_ids = [
+            (row[0], message_id)
+            for row in con.execute(SELECT_OLD_SUMMARY_MESSAGE_IDS_SQL)
+            for message_id in row[1:] if message_id
+        ]
+        try:
+            con.executescript(MIGRATE_SUMMARY_MESSAGE_DATA)
+        except sqlite3.Error:
+            if con.in_transaction:
+                con.rollback()
+            raise
+        return old_message_ids
+
     @staticmethod
     def register_clandata(clan_data: ClanData):
         con = sqlite3.connect(DB_NAME, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
@@ -296,6 +397,26 @@ class SQLiteUtil():
         con.commit()
         con.close()
 
+    @staticmethod
+    def sync_playerdata(clan_data: ClanData, added_list: List[PlayerData], removed_user_ids: List[int]):
+        """メンバーの追加・削除をまとめて1つのトランザクションで反映する"""
+        con = sqlite3.connect(DB_NAME, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+        cur = con.cursor()
+        cur.executemany(REGISTER_PLAYERDATA_SQL, [
+            (clan_data.category_id, player_data.user_id) for player_data in added_list
+        ])
+        removed_records = [(clan_data.category_id, user_id) for user_id in removed_user_ids]
+        # 全てのテーブルから削除するメンバーに関するものを削除する。
+        for sql in (
+            DELETE_PLAYERDATA_SQL,
+            DELETE_PLAYERDATA_FROM_CARRYOVER_SQL,
+            DELETE_PLAYERDATA_FROM_ATTACKSTATUS_SQL,
+            DELETE_PLAYERDATA_FROM_RESERVEDATA_SQL
+        ):
+            cur.executemany(sql, removed_records)
+        con.commit()
+        con.close()
+
     @staticmethod
     def update_playerdata(clan_data: ClanData, player_data: PlayerData):
         con = sqlite3.connect(DB_NAME, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
@@ -659,15 +780,10 @@ class SQLiteUtil():
     def register_summary_message_id(clan_data: ClanData, lap: int):
         con = sqlite3.connect(DB_NAME, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
         cur = con.cursor()
-        ids_list = clan_data.summary_message_ids[lap]
         cur.execute(REGISTER_SUMMARY_MESSAGEID_DATA, (
             clan_data.category_id,
             lap,
-            ids_list[0],
-            ids_list[1],
-            ids_list[2],
-            ids_list[3],
-            ids_list[4],
+            clan_data.summary_message_ids[lap],
         ))
         con.commit()
         con.close()
@@ -676,13 +792,8 @@ class SQLiteUtil():
     def update_summary_message_id(clan_data: ClanData, lap: int):
         con = sqlite3.connect(DB_NAME, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
         cur = con.cursor()
-        ids_list = clan_data.summary_message_ids[lap]
         cur.execute(UPDATE_SUMMARY_MESSAGE_DATA, (
-            ids_list[0],
-            ids_list[1],
-            ids_list[2],
-            ids_list[3],
-            ids_list[4],
+            clan_data.summary_message_ids[lap],
             clan_data.category_id,
             lap,
         ))
@@ -713,6 +824,92 @@ class SQLiteUtil():
         con.commit()
         con.close()
 
+    @staticmethod
+    def register_display_name(guild_id: int, user_id: int, display_name: str):
+        con = sqlite3.connect(DB_NAME, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+        cur = con.cursor()
+        cur.execute(REGISTER_DISPLAY_NAME_DATA_SQL, (
+            guild_id,
+            user_id,
+            display_name,
+            datetime.now(JST),
+        ))
+        con.commit()
+        con.close()
+
+    @staticmethod
+    def load_display_names() -> Dict[Tuple[int, int], str]:
+        con = sqlite3.connect(DB_NAME, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+        cur = con.cursor()
+        display_names = {
+            (row[0], row[1]): row[2]
+            for row in cur.execute("select guild_id, user_id, display_name from DisplayNameData")
+        }
+        con.close()
+        return display_names
+
+    @staticmethod
+    def register_hp_profile(clan_data: ClanData):
+        con = sqlite3.connect(DB_NAME, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+        cur = con.cursor()
+        cur.execute(REGISTER_HP_PROFILE_DATA_SQL, (
+            clan_data.category_id,
+            clan_data.hp_profile.to_json(),
+            datetime.now(JST),
+        ))
+        con.commit()
+        con.close()
+
+    @staticmethod
+    def delete_hp_profile(clan_data: ClanData):
+        con = sqlite3.connect(DB_NAME, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+        cur = con.cursor()
+        cur.execute(DELETE_HP_PROFILE_DATA_SQL, (
+            clan_data.category_id,
+        ))
+        con.commit()
+        con.close()
+
+    @staticmethod
+    def update_damage_stat(clan_data: ClanData, key: DamageStatKey, damage_stat: Optional[DamageStat]):
+        """ダメージの集計を保存する。damage_statがNoneの場合は削除する"""
+        con = sqlite3.connect(DB_NAME, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+        cur = con.cursor()
+        if damage_stat is None:
+            cur.execute(DELETE_DAMAGE_STATS_SQL, (clan_data.category_id, *key))
+        else:
+            cur.execute(REGISTER_DAMAGE_STATS_SQL, (
+                clan_data.category_id,
+                *key,
+                damage_stat.count,
+                damage_stat.total,
+                damage_stat.total_sq,
+                damage_stat.min_damage,
+                damage_stat.max_damage,
+            ))
+        con.commit()
+        con.close()
+
+    @staticmethod
+    def load_daily_report(clan_data: ClanData, day: date) -> DailyReport:
+        """日付が切り替わる前に、その日の結果を集計する"""
+        report = DailyReport(clan_data.category_id, day)
+        start, end = get_day_range(day, JST)
+        con = sqlite3.connect(DB_NAME, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+        cur = con.cursor()
+        for boss_index, count, total_damage, carry_over_count in cur.execute(
+            DAILY_REPORT_BOSS_DAMAGE_SQL, (clan_data.category_id, start, end)
+        ):
+            report.boss_damages[boss_index] = (count, total_damage or 0)
+            report.attack_count += count - carry_over_count
+            report.carry_over_attack_count += carry_over_count
+        report.beated_count, report.first_lap, report.last_lap = cur.execute(
+            DAILY_REPORT_BEATED_SQL, (clan_data.category_id, start, end)).fetchone()
+        report.missed_attacks = cur.execute(DAILY_REPORT_MISSED_ATTACK_SQL, (clan_data.category_id,)).fetchall()
+        report.wasted_carry_overs = cur.execute(DAILY_REPORT_WASTED_CARRYOVER_SQL, (clan_data.category_id,)).fetchall()
+        con.close()
+        return report
+
     @staticmethod
     def load_clandata_dict() -> DefaultDict[int, ClanData]:
         clan_data_dict: DefaultDict[int, Optional[ClanData]] = defaultdict(lambda: None)
@@ -755,11 +952,16 @@ class SQLiteUtil():
             reserve_data.set_reserve_info((row[4], row[5], row[6]))
             clan_data.reserve_list[row[1]].append(reserve_data)
 
+        for row in cur.execute("select category_id, profile from HpProfileData"):
+            if (clan_data := clan_data_dict[row[0]]) is None:
+                continue
+            clan_data.hp_profile = HpProfile.from_json(row[1])
+
         for row in cur.execute("select * from BossStatusData"):
             clan_data = clan_data_dict[row[0]]
             if not clan_data:
                 continue
-            boss_status_data = BossStatusData(row[2], row[1])
+            boss_status_data = BossStatusData(row[2], row[1], clan_data.get_hp_profile())
             boss_status_data.beated = row[3]
             if boss_status_data.lap not in clan_data.boss_status_data.keys():
                 clan_data.initialize_boss_status_data(boss_status_data.lap)
@@ -806,6 +1008,11 @@ class SQLiteUtil():
             clan_data.form_data.discord_id_entry = row[4]
             clan_data.form_data.created = row[5].astimezone(JST)
 
+        for row in cur.execute("select * from DamageStats"):
+            if (clan_data := clan_data_dict[row[0]]) is None:
+                continue
+            clan_data.damage_stats[(row[1], row[2], row[3])] = DamageStat(*row[4:9])
+
         for row in cur.execute("select * from ProgressMessageIdData"):
             if (clan_data := clan_data_dict[row[0]]) is None:
                 continue
@@ -814,7 +1021,7 @@ class SQLiteUtil():
         for row in cur.execute("select * from SummaryMessageIdData"):
             if (clan_data := clan_data_dict[row[0]]) is None:
                 continue
-            clan_data.summary_message_ids[row[1]] = list(row[2:7])
+            clan_data.summary_message_ids[row[1]] = row[2]
         
         con.close()
         return clan_data_dict
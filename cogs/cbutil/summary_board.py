@@ -0,0 +1,68 @@
+import asyncio
+from logging import getLogger
+from typing import Awaitable, Callable, Dict, Hashable, List
+
+import discord
+
+logger = getLogger(__name__)
+
+SUMMARY_EDIT_DELAY = 1.0  # 更新要求を受けてから編集するまでの秒数 (この間の要求は1回の編集にまとめる)
+EMBED_TOTAL_LIMIT = 6000  # 1メッセージに含められる埋め込みの文字数の合計の上限
+EMBED_DESCRIPTION_SUFFIX = "\n..."
+
+
+def fit_embeds(embeds: List[discord.Embed], limit: int = EMBED_TOTAL_LIMIT) -> List[discord.Embed]:
+    """埋め込みの文字数の合計が上限に収まるように削る
+
+    まずフィールドを削除し、それでも収まらない場合は説明文の末尾を均等に削る。
+    """
+    if sum(len(embed) for embed in embeds) <= limit:
+        return embeds
+    for embed in embeds:
+        embed.clear_fields()
+    total = sum(len(embed) for embed in embeds)
+    if total <= limit:
+        return embeds
+    # 1つあたりの説明文の長さの上限を、タイトルなど説明文以外の文字数を除いて求める
+    other = total - sum(len(embed.description or "") for embed in embeds)
+    max_description = max((limit - other) // len(embeds) - len(EMBED_DESCRIPTION_SUFFIX), 0)
+    for embed in embeds:
+        if embed.description and len(embed.description) > max_description:
+            embed.description = embed.description[:max_description] + EMBED_DESCRIPTION_SUFFIX
+    return embeds
+
+
+class CoalescedUpdater():
+    """同じキーへの更新要求をまとめて1回の更新にする
+
+    要求を受けてから delay 秒待って更新し、待っている間や更新中に来た要求は次の1回にまとめる。
+    更新する内容は実行する時点の状態から作るため、最後の要求の状態が必ず反映される。
+    """
+
+    def __init__(self, delay: float = SUMMARY_EDIT_DELAY) -> None:
+        self.delay = delay
+        self.updates: Dict[Hashable, Callable[[], Awaitable[None]]] = {}
+        self.tasks: Dict[Hashable, asyncio.Task] = {}
+
+    def request(self, key: Hashable, update: Callable[[], Awaitable[None]]) -> None:
+        self.updates[key] = update
+        if key not in self.tasks:
+            self.tasks[key] = asyncio.create_task(self._run(key))
+
+    async def _run(self, key: Hashable) -> None:
+        try:
+            while True:
+                await asyncio.sleep(self.delay)
+                update = self.updates.pop(key, None)
+                if update is None:
+                    return
+                try:
+                    await update()
+                except Exception:
+                    logger.exception(f"failed to update: key={key}")
+        finally:
+            del self.tasks[key]
+
+    def close(self) -> None:
+        for task in list(self.tasks.values()):
+            task.cancel()
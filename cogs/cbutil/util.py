@@ -1,12 +1,17 @@
+import asyncio
 import math
-from datetime import datetime
 from typing import List, Optional, Tuple
 
 import aiohttp
 import discord
 import jaconv
 
-from setup import JST
+from cogs.cbutil.http_client import HTTP_MAX_RETRIES, http_client
+from cogs.cbutil.prompt import PromptRegistry
+
+# 参戦可能時間は5時から翌5時(29時)までの24時間を1時間ごとに管理する
+LIMIT_TIME_START_HOUR = 5
+LIMIT_TIME_HOURS = 24
 
 
 def get_damage(damage_message_txt: str) -> Optional[Tuple[int, str]]:
@@ -29,7 +34,7 @@ def get_damage(damage_message_txt: str) -> Optional[Tuple[int, str]]:
 
 
 async def select_from_list(
-    bot: discord.ext.commands.Bot,
+    prompts: PromptRegistry,
     channel: discord.TextChannel,
     user: discord.User,
     contents: List,  # 文字列化可能object
@@ -48,40 +53,82 @@ async def select_from_list(
     # select_message_content += ""
 
     select_message = await channel.send(select_message_content, delete_after=60)
+    selected = prompts.wait_reaction(user.id, select_message.id, reaction_number[:len(contents)])
     for i in range(len(contents)):
         await select_message.add_reaction(reaction_number[i])
     try:
-        reaction, _ = await bot.wait_for(
-            'reaction_add', timeout=60.0,
-            check=lambda reaction, reaction_user: reaction_user == user
-            and str(reaction.emoji) in reaction_number and reaction_number.index(str(reaction.emoji)) < len(contents)
-        )
-        return reaction_number.index(str(reaction.emoji))
-    except TimeoutError:
+        emoji = await selected
+        return reaction_number.index(emoji)
+    except asyncio.TimeoutError:
         return None
 
 
-async def get_from_web_api(url: str):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as r:
-            return await r.json()
+async def add_reactions(message: discord.Message, emojis: List[str]) -> None:
+    """メッセージにリアクションを順番に付ける
+
+    同じメッセージへのリアクションは同時に付けると並び順が崩れるため1つずつ付ける。
+    別のメッセージへのリアクションは呼び出し側でまとめて並行に実行する
+    """
+    for emoji in emojis:
+        await message.add_reaction(emoji)
+
+
+async def purge_channel(channel: discord.TextChannel, limit: int = 100) -> None:
+    """チャンネルのメッセージを削除する
+
+    14日以内のメッセージは一括削除し、それより古いメッセージは1件ずつ削除する
+    """
+    try:
+        await channel.purge(limit=limit)
+    except (discord.Forbidden, discord.HTTPException):
+        # 一括削除に失敗した場合は1件ずつ削除する
+        async for old_message in channel.history(limit=limit):
+            try:
+                await old_message.delete()
+            except (discord.NotFound, discord.Forbidden):
+                pass
 
 
-def create_limit_time_text(raw_limit_time_text: str) -> str:
-    spans = [tuple(map(int, span.replace("時", "").split("～"))) for span in raw_limit_time_text.split(", ")]
-    fix_spans = []
-    min_hour, max_hour = spans[0]
-    for span in spans[1:]:
-        if max_hour == span[0]:
-            max_hour = span[1]
-        else:
-            fix_spans.append((min_hour, max_hour))
-            min_hour, max_hour = span
+async def get_from_web_api(url: str, retries: int = HTTP_MAX_RETRIES, timeout: Optional[aiohttp.ClientTimeout] = None):
+    return await http_client.get_json(url, retries, timeout)
 
-    fix_spans.append((min_hour, max_hour))
 
-    now_hour = datetime.now(JST).hour
-    if now_hour < 5:
+def parse_limit_time_text(raw_limit_time_text: str) -> int:
+    """アンケートの回答 (例: `5～6時, 6～7時`) を参戦可能時間のビットマスクに変換する
+
+    i番目のビットが `LIMIT_TIME_START_HOUR+i` 時から1時間参戦可能であることを表す
+    """
+    limit_time = 0
+    for span in raw_limit_time_text.split(","):
+        hours = span.strip().replace("時", "").replace("~", "～").split("～")
+        if len(hours) != 2 or not hours[0].isdecimal() or not hours[1].isdecimal():
+            continue
+        for hour in range(int(hours[0]), int(hours[1])):
+            if LIMIT_TIME_START_HOUR <= hour < LIMIT_TIME_START_HOUR + LIMIT_TIME_HOURS:
+                limit_time |= 1 << (hour - LIMIT_TIME_START_HOUR)
+    return limit_time
+
+
+def get_limit_time_spans(limit_time: int) -> List[Tuple[int, int]]:
+    """ビットマスクから連続した参戦可能時間の区間を取り出す"""
+    spans = []
+    min_hour = None
+    for i in range(LIMIT_TIME_HOURS + 1):
+        if limit_time >> i & 1:
+            if min_hour is None:
+                min_hour = LIMIT_TIME_START_HOUR + i
+        elif min_hour is not None:
+            spans.append((min_hour, LIMIT_TIME_START_HOUR + i))
+            min_hour = None
+    return spans
+
+
+def create_limit_time_text(limit_time: int, now_hour: int) -> str:
+    fix_spans = get_limit_time_spans(limit_time)
+    if not fix_spans:
+        return ""
+
+    if now_hour < LIMIT_TIME_START_HOUR:
         now_hour += 24
     time_text_list = []
 
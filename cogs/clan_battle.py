@@ -1,9 +1,12 @@
 import asyncio
-from collections import defaultdict
+import os
+import tempfile
+import time
+from collections import defaultdict, deque
 from datetime import datetime, timedelta
 from functools import reduce
 from logging import getLogger
-from typing import List, Optional, Tuple
+from typing import Any, Awaitable, Callable, Deque, List, Optional, Set, Tuple
 from operator import sub
 
 import discord
@@ -13,38 +16,219 @@ from discord.errors import Forbidden, HTTPException
 from discord.ext import commands
 from discord import app_commands
 
-from cogs.cbutil.attack_type import ATTACK_TYPE_DICT, AttackType
+from cogs.cbutil.attack_type import (ATTACK_TYPE_DICT, ATTACK_TYPE_NAMES,
+                                     AttackType)
+from cogs.cbutil.availability import (AvailabilityMatrix,
+                                      RemainAttackAvailability, get_hour_index)
 from cogs.cbutil.boss_status_data import AttackStatus
-from cogs.cbutil.clan_battle_data import ClanBattleData, update_clanbattledata
+from cogs.cbutil.clan_battle_data import (ClanBattleData,
+                                          ClanBattleDataService,
+                                          load_clan_battle_data_cache)
 from cogs.cbutil.clan_data import ClanData
+from cogs.cbutil.daily_report import DailyReport
+from cogs.cbutil.damage_stats import record_damage, revert_damage
+from cogs.cbutil.damage_view import DamageEntryView, ReserveDamageView
+from cogs.cbutil.export import (EXPORT_CHUNK_SIZE, EXPORT_FORMATS, export_clan,
+                                parse_date)
+from cogs.cbutil.finishing_blow import plan_finishing_blow
+from cogs.cbutil.forecast import FORECAST_PERCENTILES, LapForecaster
 from cogs.cbutil.form_data import create_form_data
-from cogs.cbutil.gss import get_sheet_values, get_worksheet_list
+from cogs.cbutil.form_sync import FormResponseSync
+from cogs.cbutil.gss import sheet_client
+from cogs.cbutil.job_queue import JobQueue
 from cogs.cbutil.log_data import LogData
+from cogs.cbutil.member_index import (AUTOCOMPLETE_LIMIT, MemberIndexCache,
+                                      normalize_name)
+from cogs.cbutil.name_cache import NameCache
 from cogs.cbutil.operation_type import (OPERATION_TYPE_DESCRIPTION_DICT,
                                         OperationType)
 from cogs.cbutil.player_data import CarryOver, PlayerData
+from cogs.cbutil.prestage import ProgressStager, should_prestage
+from cogs.cbutil.prompt import PromptRegistry
+from cogs.cbutil.rate_limit import DedupeCache, RateLimiter, TokenBucket
 from cogs.cbutil.reserve_data import ReserveData
+from cogs.cbutil.rollover import DailyRolloverScheduler, get_today
+from cogs.cbutil.route_solver import RouteAttacker, RouteStep, solve_route
 from cogs.cbutil.sqlite_util import SQLiteUtil
-from cogs.cbutil.util import calc_carry_over_time, get_damage, select_from_list
+from cogs.cbutil.summary_board import CoalescedUpdater, fit_embeds
+from cogs.cbutil.util import (LIMIT_TIME_START_HOUR, add_reactions,
+                              calc_carry_over_time, get_damage, purge_channel,
+                              select_from_list)
 from setup import (BOSS_COLOURS, EMOJI_ATTACK, EMOJI_CANCEL, EMOJI_CARRYOVER,
                      EMOJI_LAST_ATTACK, EMOJI_MAGIC, EMOJI_NO, EMOJI_PHYSICS,
                      EMOJI_REVERSE, EMOJI_SETTING, EMOJI_TASK_KILL, EMOJI_YES,
-                     GUILD_IDS, JST, TREASURE_CHEST)
+                     GUILD_IDS, JST, LEGACY_DAMAGE_MESSAGE, MEMBERS_INTENT,
+                     TREASURE_CHEST)
 
 logger = getLogger(__name__)
+MEMBER_FETCH_CONCURRENCY = 5  # /sync_role でメンバーを個別に取得するときの同時実行数
+REACTION_RATE = 1.0  # メンバーごとに1秒あたりに受け付けるリアクションの数
+REACTION_BURST = 5  # メンバーごとに連続して受け付けるリアクションの数
+REACTION_REMOVE_RATE = 1.0  # 連打で無視したリアクションを外す、1秒あたりの数 (全体)
+# membersインテントを使わない場合、ロールのメンバーはBotのキャッシュにいるメンバーしか分からない
+ROLE_MEMBERS_NOTE = "" if MEMBERS_INTENT else (
+    "\n※ロールのメンバーのうち、Botが最近見かけたメンバーのみ追加しています。"
+    "全員を追加するには setup.py の MEMBERS_INTENT を有効にしてください")
+PENDING_EVENT_LIMIT = 1000  # 起動中に届いたイベントを保持しておく数の上限
+# 進行用のメッセージに付けるリアクション
+PROGRESS_REACTIONS = [EMOJI_PHYSICS, EMOJI_MAGIC, EMOJI_CARRYOVER, EMOJI_ATTACK, EMOJI_LAST_ATTACK, EMOJI_REVERSE]
 
 class ClanBattle(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.ready = False
+        self.name_cache = NameCache()
+        self.member_indexes = MemberIndexCache(self.name_cache)
+        self.created = time.perf_counter()
+        self.form_sync = FormResponseSync(sheet_client)
+        self.form_sync_task: Optional[asyncio.Task] = None
+        self.clan_battle_data_service = ClanBattleDataService()
+        self.forecaster = LapForecaster()
+        self.background_tasks: Set[asyncio.Task] = set()
+        self.rollover_scheduler = DailyRolloverScheduler()
+        self.rollover_task: Optional[asyncio.Task] = None
+        self.rollover_locks: defaultdict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self.summary_updater = CoalescedUpdater()
+        self.summary_updates_while_sending: Set[Tuple[int, int]] = set()  # (category_id, 周回数)
+        self.progress_stager = ProgressStager()
+        self.job_queue = JobQueue()
+        self.prompts = PromptRegistry()
+        self.reaction_limiter = TokenBucket(REACTION_RATE, REACTION_BURST)
+        self.reaction_dedupe = DedupeCache()
+        self.reaction_remove_limiter = RateLimiter(REACTION_REMOVE_RATE)
+        self.pending_reaction_removals: Set[Tuple[int, int, str]] = set()
+        self.damage_entry_view = DamageEntryView(self._on_damage_entered)
+        self.clan_battle_data_task: Optional[asyncio.Task] = None
+        # 起動の準備が終わる前に届いたイベント (リスナー, 引数)
+        self.pending_events: Deque[Tuple[Callable[..., Awaitable[None]], Tuple[Any, ...]]] = deque()
+        self.dropped_event_count = 0
+        self.stale_summary_message_ids: List[Tuple[int, int]] = []  # 削除が必要なまとめ用のメッセージ (category_id, message_id)
+
+    async def cog_load(self) -> None:
+        """データベースなどからデータを読み込む
+
+        setup_hook の中で1度だけ呼ばれるため、再接続でon_readyが呼ばれても読み込みなおさない。
+        読み込みはイベントループを止めないように別のスレッドで行う。
+        """
+        logger.info("loading ClanBattle data...")
+        self.clan_data: defaultdict[int, Optional[ClanData]] = await asyncio.to_thread(self._load_data)
+        self.clan_battle_data = ClanBattleData()
+        # 再起動前に送信した進行用メッセージのボタンも押せるように登録する
+        self.bot.add_view(self.damage_entry_view)
+        logger.info(f"ClanBattle data loaded ({time.perf_counter() - self.created:.1f}s)")
+
+    def _load_data(self) -> defaultdict:
+        self.stale_summary_message_ids = SQLiteUtil.setup_database()
+        # 前回取得したボスのデータがあれば、APIに繋がらなくてもそれを使って起動する
+        if not load_clan_battle_data_cache():
+            logger.info("clan battle data cache not found")
+        self.name_cache.load()
+        return SQLiteUtil.load_clandata_dict()
+
+    async def cog_unload(self) -> None:
+        if self.form_sync_task is not None:
+            self.form_sync_task.cancel()
+        if self.clan_battle_data_task is not None:
+            self.clan_battle_data_task.cancel()
+        if self.rollover_task is not None:
+            self.rollover_task.cancel()
+        self.summary_updater.close()
+        self.job_queue.close()
+        self.prompts.close()
 
     @commands.Cog.listener()
     async def on_ready(self):
-        logger.info("loading ClanBattle data...")
-        self.clan_data: defaultdict[int, Optional[ClanData]] = SQLiteUtil.load_clandata_dict()
-        self.clan_battle_data = ClanBattleData()
+        if self.ready:
+            return  # 再接続時にも呼ばれるが、データは読み込み済み
+        if self.form_sync_task is None:
+            self.form_sync_task = asyncio.create_task(self.form_sync.run(self.clan_data, self._on_form_synced))
+        if self.clan_battle_data_task is None:
+            self.clan_battle_data_task = asyncio.create_task(self.clan_battle_data_service.run())
+        if self.rollover_task is None:
+            self.rollover_task = asyncio.create_task(
+                self.rollover_scheduler.run(self.clan_data, self._check_date_update))
+        if self.stale_summary_message_ids:
+            self._run_in_background(self._delete_stale_summary_messages())
+        replayed_count = await self._replay_pending_events()
         self.ready = True
-        logger.info("ClanBattle Management Ready!")
+        logger.info(
+            f"ClanBattle Management Ready! ({time.perf_counter() - self.created:.1f}s, "
+            f"cached members={sum(len(guild.members) for guild in self.bot.guilds)}, "
+            f"cached display names={len(self.name_cache.display_names)}, "
+            f"replayed events={replayed_count}, dropped events={self.dropped_event_count})"
+        )
+
+    async def _delete_stale_summary_messages(self) -> None:
+        """データベースの変換で使われなくなったまとめ用のメッセージを削除する"""
+        for category_id, message_id in self.stale_summary_message_ids:
+            clan_data = self.clan_data[category_id]
+            if clan_data is None or (channel := self.bot.get_channel(clan_data.summary_channel_id)) is None:
+                continue
+            try:
+                await channel.get_partial_message(message_id).delete()
+            except (discord.NotFound, discord.Forbidden):
+                pass
+        logger.info(f"stale summary messages deleted: {len(self.stale_summary_message_ids)}")
+        self.stale_summary_message_ids = []
+
+    def _defer_until_ready(self, listener: Callable[..., Awaitable[None]], *args: Any) -> bool:
+        """準備が終わる前に届いたイベントを保持する。保持した場合はTrueを返す
+
+        チャンネルのキャッシュがそろうon_readyまでは処理できないため、準備ができてから届いた順に処理する
+        """
+        if self.ready:
+            return False
+        if len(self.pending_events) >= PENDING_EVENT_LIMIT:
+            self.dropped_event_count += 1
+            logger.warning(f"pending event dropped: {listener.__name__}")
+            return True
+        self.pending_events.append((listener, args))
+        return True
+
+    async def _replay_pending_events(self) -> int:
+        """保持していたイベントを届いた順に処理する。処理したイベントの数を返す
+
+        処理中に届いたイベントも保持されるため、空になるまで続けてから準備完了にする。
+        処理するイベントは replay=True で呼び出して、もう一度保持されないようにする
+        """
+        count = 0
+        while self.pending_events:
+            listener, args = self.pending_events.popleft()
+            try:
+                await listener(*args, replay=True)
+            except Exception:
+                logger.exception(f"failed to replay pending event: {listener.__name__}")
+            count += 1
+        return count
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        """コマンド実行者の表示名をキャッシュする"""
+        if clan_data := self.clan_data[getattr(interaction.channel, "category_id", None)]:
+            self._remember_member(clan_data, interaction.user)
+        return True
+
+    def _remember_member(self, clan_data: ClanData, member: Optional[discord.abc.User]) -> None:
+        """凸管理対象のメンバーであれば表示名をキャッシュする"""
+        if member is not None and member.id in clan_data.player_data_dict:
+            self.name_cache.update(member)
+
+    def _get_display_name(self, guild: discord.Guild, user_id: int) -> Optional[str]:
+        if display_name := self.name_cache.get(guild.id, user_id):
+            return display_name
+        if member := guild.get_member(user_id):
+            return member.display_name
+        return None
+
+    def _get_member_label(self, guild: discord.Guild, user_id: int) -> str:
+        """メッセージに表示するメンバーの名前。表示名が分からない場合はメンションにする"""
+        return self._get_display_name(guild, user_id) or f"<@{user_id}>"
+
+    async def _resolve_display_names(self, clan_data: ClanData) -> None:
+        """表示に必要なメンバーの表示名をそろえる"""
+        guild = self.bot.get_guild(clan_data.guild_id)
+        if guild is None:
+            return
+        await self.name_cache.resolve(guild, list(clan_data.player_data_dict.keys()))
 
     @app_commands.command(
         name="add",
@@ -59,24 +243,20 @@ class ClanBattle(commands.Cog):
         if clan_data is None:
             await interaction.response.send_message("凸管理を行うカテゴリーチャンネル内で実行してください")
             return
-        player_data_list: List[PlayerData] = []
+        members: List[discord.abc.User] = []
         if role is None and member is None:
-            player_data = PlayerData(interaction.user.id)
-            clan_data.player_data_dict[interaction.user.id] = player_data
-            player_data_list.append(player_data)
+            members.append(interaction.user)
         if member is not None:
-            player_data = PlayerData(member.id)
-            clan_data.player_data_dict[member.id] = player_data
-            player_data_list.append(player_data)
+            members.append(member)
         if role is not None:
-            for m in role.members:
-                player_data = PlayerData(m.id)
-                clan_data.player_data_dict[m.id] = PlayerData(m.id)
-                player_data_list.append(player_data)
-        await interaction.response.send_message(f"{len(player_data_list)}名追加します。")
-        await self._update_remain_attack_message(clan_data)
-        if player_data_list:
-            SQLiteUtil.register_playerdata(clan_data, player_data_list)
+            # membersインテントを使わない設定では、role.membersにはキャッシュ済みのメンバーのみが含まれる
+            members.extend(role.members)
+        for m in members:
+            self.name_cache.update(m)
+        # 既に登録済みのメンバーは凸状況を消さないようにそのままにする
+        await interaction.response.send_message(f"{len(members)}名を確認して、未登録のメンバーを追加します。")
+        added_count, _ = await self._sync_members(clan_data, [m.id for m in members], [])
+        await interaction.followup.send(f"{added_count}名追加しました。" + (ROLE_MEMBERS_NOTE if role is not None else ""))
 
     @app_commands.command(
         name="remove",
@@ -109,16 +289,96 @@ class ClanBattle(commands.Cog):
             player_data_list += list(clan_data.player_data_dict.values())
 
         await interaction.response.send_message(f"{len(player_data_list)}名のデータを削除します。")
-        for player_data in player_data_list:
-            for i in range(5):
-                clan_data.reserve_list[i] = [
-                    reserve_data for reserve_data in clan_data.reserve_list[i]
-                    if reserve_data.player_data.user_id != player_data.user_id]
-            SQLiteUtil.delete_playerdata(clan_data, player_data)
-            del clan_data.player_data_dict[player_data.user_id]
-        await self._update_remain_attack_message(clan_data)
+        await self._sync_members(clan_data, [], [player_data.user_id for player_data in player_data_list])
         await interaction.channel.send("削除が完了しました。")
 
+    @app_commands.command(
+        name="sync_role",
+        description="凸管理するメンバーをロールに合わせます。ロールのないメンバーは削除されます。"
+    )
+    @app_commands.describe(
+        role="凸管理するメンバーのロール"
+    )
+    async def sync_role(self, interaction: discord.Interaction, role: discord.Role):
+        clan_data = self.clan_data[interaction.channel.category_id]
+        if clan_data is None:
+            await interaction.response.send_message("凸管理を行うカテゴリーチャンネル内で実行してください")
+            return
+        await interaction.response.defer()
+        await self._submit_job(interaction, "sync_role", lambda: self._sync_role_job(interaction, clan_data, role))
+
+    async def _sync_role_job(self, interaction: discord.Interaction, clan_data: ClanData, role: discord.Role) -> None:
+        """ロールのメンバーと凸管理のメンバーの差分だけを追加・削除する
+
+        membersインテントを使わない設定では、ロールのメンバーの一覧 (role.members) には
+        キャッシュ済みのメンバーしか含まれない。そのため追加はキャッシュ済みのメンバーから行い、
+        削除は登録済みのメンバーを個別に取得してロールを確認する。
+        """
+        for member in role.members:
+            self.name_cache.update(member)
+        semaphore = asyncio.Semaphore(MEMBER_FETCH_CONCURRENCY)
+
+        async def has_role(user_id: int) -> bool:
+            if (member := interaction.guild.get_member(user_id)) is None:
+                async with semaphore:
+                    try:
+                        member = await interaction.guild.fetch_member(user_id)
+                    except discord.NotFound:
+                        return False  # サーバーから退出している
+            self.name_cache.update(member)
+            return member.get_role(role.id) is not None
+
+        user_ids = list(clan_data.player_data_dict.keys())
+        role_flags = await asyncio.gather(*[has_role(user_id) for user_id in user_ids])
+        removed_user_ids = [user_id for user_id, flag in zip(user_ids, role_flags) if not flag]
+        added_count, removed_count = await self._sync_members(
+            clan_data, [member.id for member in role.members], removed_user_ids)
+        await interaction.followup.send(
+            f"{role.name} に合わせて{added_count}名追加、{removed_count}名削除しました。" + ROLE_MEMBERS_NOTE)
+
+    async def _sync_members(
+        self, clan_data: ClanData, added_user_ids: List[int], removed_user_ids: List[int]
+    ) -> Tuple[int, int]:
+        """凸管理のメンバーを追加・削除する
+
+        登録済みのメンバーの追加と未登録のメンバーの削除は無視する。
+        データベースへの反映は1つのトランザクションで行い、表示の更新は最後に1回だけ行う。
+
+        Returns
+        -------
+        Tuple[int, int]
+            (追加した人数, 削除した人数)
+        """
+        added_list = [
+            PlayerData(user_id) for user_id in dict.fromkeys(added_user_ids)
+            if user_id not in clan_data.player_data_dict
+        ]
+        removed_user_id_set = {user_id for user_id in removed_user_ids if user_id in clan_data.player_data_dict}
+        if not added_list and not removed_user_id_set:
+            return 0, 0
+
+        availability = clan_data.availability.get(clan_data.availability_day)
+        for player_data in added_list:
+            if availability:
+                player_data.set_limit_time(availability.get(player_data.user_id))
+            clan_data.player_data_dict[player_data.user_id] = player_data
+        for user_id in removed_user_id_set:
+            del clan_data.player_data_dict[user_id]
+        updated_reserve_indexes = []
+        for i in range(5):
+            reserve_list = [
+                reserve_data for reserve_data in clan_data.reserve_list[i]
+                if reserve_data.player_data.user_id not in removed_user_id_set]
+            if len(reserve_list) != len(clan_data.reserve_list[i]):
+                clan_data.reserve_list[i] = reserve_list
+                updated_reserve_indexes.append(i)
+        SQLiteUtil.sync_playerdata(clan_data, added_list, list(removed_user_id_set))
+
+        await self._update_remain_attack_message(clan_data)
+        for i in updated_reserve_indexes:
+            await self._update_reserve_message(clan_data, i)
+        return len(added_list), len(removed_user_id_set)
+
     @app_commands.command(
         name="setup",
         description="凸管理のセットアップを実施します。"
@@ -128,25 +388,29 @@ class ClanBattle(commands.Cog):
     )
     async def setup(self, interaction: discord.Interaction, category_channel_name: str = ""):
         """凸管理用チャンネルを作成するセットアップを実施する"""
-        await interaction.response.send_message("チャンネルのセットアップを実施します")
+        await interaction.response.defer()
         if not category_channel_name:
             category_channel_name = "凸管理"
+        await self._submit_job(interaction, "setup", lambda: self._setup_job(interaction, category_channel_name))
+
+    async def _setup_job(self, interaction: discord.Interaction, category_channel_name: str) -> None:
+        """チャンネルの作成・各メッセージの送信は並行して行う。並び順はpositionで指定する"""
+        started = time.perf_counter()
+        channel_names = ["まとめ"] + [f"ボス{i+1}" for i in range(5)] + ["残凸把握板", "凸ルート共有板", "コマンド入力板"]
         try:
             category = await interaction.guild.create_category(category_channel_name)
-            summary_channel = await category.create_text_channel("まとめ")
-            boss_channels: List[TextChannel] = []
-            for i in range(5):
-                boss_channel = await category.create_text_channel(f"ボス{i+1}")
-                boss_channels.append(boss_channel)
-            remain_attack_channel = await category.create_text_channel("残凸把握板")
-            reserve_channel = await category.create_text_channel("凸ルート共有板")
-            command_channel = await category.create_text_channel("コマンド入力板")
+            channels: List[TextChannel] = await asyncio.gather(*[
+                category.create_text_channel(name, position=position) for position, name in enumerate(channel_names)
+            ])
         except Forbidden:
-            await interaction.response.send_message("チャンネル作成の権限を付与してください。")
+            await interaction.followup.send("チャンネル作成の権限を付与してください。")
             return
         except HTTPException as e:
-            await interaction.response.send_message(f"チャンネルの作成に失敗しました\n```\n{e.response}\n```")
+            await interaction.followup.send(f"チャンネルの作成に失敗しました\n```\n{e.response}\n```")
             return
+        summary_channel = channels[0]
+        boss_channels = channels[1:6]
+        remain_attack_channel, reserve_channel, command_channel = channels[6:]
         clan_data = ClanData(
             interaction.guild_id,
             category.id,
@@ -158,11 +422,15 @@ class ClanBattle(commands.Cog):
         )
         logger.info(f"New ClanData is created: guild={interaction.guild.name}")
         self.clan_data[category.id] = clan_data
-        await self._initialize_progress_messages(clan_data, 1)
-        await self._initialize_reserve_message(clan_data)
-        await self._initialize_remain_attack_message(clan_data)
+        await asyncio.gather(
+            self._initialize_progress_messages(clan_data, 1),
+            self._initialize_reserve_message(clan_data),
+            self._initialize_remain_attack_message(clan_data)
+        )
         SQLiteUtil.register_clandata(clan_data)
-        await interaction.response.send_message("セットアップが完了しました")
+        elapsed = time.perf_counter() - started
+        logger.info(f"setup finished: guild={interaction.guild.name}, category_id={category.id}, {elapsed:.1f}s")
+        await interaction.followup.send("セットアップが完了しました")
 
     @app_commands.command(
         name="lap",
@@ -177,24 +445,39 @@ class ClanBattle(commands.Cog):
         if clan_data is None:
             await interaction.response.send_message("凸管理を行うカテゴリーチャンネル内で実行してください")
             return
-        await interaction.response.send_message(content=f"周回数を{lap}に設定します")
+        await interaction.response.defer()
+        await self._submit_job(interaction, "lap", lambda: self._lap_job(interaction, clan_data, lap))
+
+    async def _lap_job(self, interaction: discord.Interaction, clan_data: ClanData, lap: int) -> None:
+        self.progress_stager.discard_clan(clan_data.category_id)
         clan_data.initialize_progress_data()
         SQLiteUtil.delete_old_data(clan_data, 999)
         await self._initialize_progress_messages(clan_data, lap)
         await self._update_remain_attack_message(clan_data)
         SQLiteUtil.update_clandata(clan_data)
+        await interaction.followup.send(f"周回数を{lap}に設定しました")
 
     @app_commands.command(
         name="attack_declare",
         description="ボスに凸宣言した時の処理を実施します"
     )
     @app_commands.describe(
-        member="処理対象のメンバー(メンションで指定)",
+        member="処理対象のメンバー",
         attack_type="凸方法を指定します。",
         lap="周回数 (指定がない場合は今現在のボスが指定されます)",
         boss_number="ボス番号 (各ボスの進行用チャンネルで実行する場合は指定する必要がありません)"
     )
-    async def attack_declare(self, interaction: discord.Interaction, member: discord.User, attack_type: str, lap: Optional[int] = None, boss_number: Optional[int] = None):
+    @app_commands.choices(attack_type=[
+        app_commands.Choice(name=f"{attack_type.value} {name}", value=attack_type.value)
+        for attack_type, name in ATTACK_TYPE_NAMES.items()
+    ])
+    async def attack_declare(
+        self, interaction: discord.Interaction,
+        member: str,
+        attack_type: str,
+        lap: Optional[int] = None,
+        boss_number: Optional[int] = None
+    ):
         """コマンドで凸宣言を実施した時の処理を行う"""
         checked = await self.check_command_arguments(interaction, member, lap, boss_number)
         if not checked:
@@ -202,9 +485,12 @@ class ClanBattle(commands.Cog):
         clan_data, player_data, lap, boss_index = checked
 
         attack_type_v = ATTACK_TYPE_DICT.get(attack_type)
+        if attack_type_v is None:
+            return await interaction.response.send_message("凸方法を候補から選択してください")
         if attack_type_v is AttackType.CARRYOVER and not player_data.carry_over_list:
             return await interaction.response.send_message("持ち越しを所持していません。凸宣言をキャンセルします。")
-        await interaction.response.send_message(content=f"{member.display_name}の凸を{attack_type_v.value}で{lap}周目{boss_index+1}ボスに宣言します")
+        member_name = self._get_member_label(interaction.guild, player_data.user_id)
+        await interaction.response.send_message(content=f"{member_name}の凸を{attack_type_v.value}で{lap}周目{boss_index+1}ボスに宣言します")
         await self._attack_declare(clan_data, player_data, attack_type_v, lap, boss_index)
 
     @app_commands.command(
@@ -212,14 +498,14 @@ class ClanBattle(commands.Cog):
         description="ボスに凸した時の処理を実施します。"
     )
     @app_commands.describe(
-        member="処理対象のメンバー(メンションで指定)",
+        member="処理対象のメンバー",
         lap="周回数 (指定がない場合は今現在のボスが指定されます)",
         boss_number="ボス番号 (各ボスの進行用チャンネルで実行する場合は指定する必要がありません)",
         damage="与えたダメージ"
     )
     async def attack_fin(
         self, interaction: discord.Interaction,
-        member: discord.User,
+        member: str,
         lap: Optional[int] = None,
         boss_number: Optional[int] = None,
         damage: Optional[int] = None
@@ -230,7 +516,8 @@ class ClanBattle(commands.Cog):
             return
         clan_data, player_data, lap, boss_index = cheked
 
-        await interaction.response.send_message(content=f"{member.display_name}の凸を{lap}周目{boss_index+1}ボスに消化します")
+        member_name = self._get_member_label(interaction.guild, player_data.user_id)
+        await interaction.response.send_message(content=f"{member_name}の凸を{lap}周目{boss_index+1}ボスに消化します")
 
         boss_status_data = clan_data.boss_status_data[lap][boss_index]
         attack_status_index = boss_status_data.get_attack_status_index(player_data, False)
@@ -246,13 +533,13 @@ class ClanBattle(commands.Cog):
         description="ボスを討伐した時の処理を実施します。"
     )
     @app_commands.describe(
-        member="処理対象のメンバー(メンションで指定)",
+        member="処理対象のメンバー",
         lap="周回数 (指定がない場合は今現在のボスが指定されます)",
         boss_number="ボス番号 (各ボスの進行用チャンネルで実行する場合は指定する必要がありません)"
     )
     async def defeat_boss(
         self, interaction: discord.Interaction,
-        member: discord.User,
+        member: str,
         lap: Optional[int] = None,
         boss_number: Optional[int] = None
     ):
@@ -261,7 +548,8 @@ class ClanBattle(commands.Cog):
         if not checked:
             return
         clan_data, player_data, lap, boss_index = checked
-        await interaction.response.send_message(content=f"{member.display_name}の凸で{boss_index+1}ボスを討伐します")
+        member_name = self._get_member_label(interaction.guild, player_data.user_id)
+        await interaction.response.send_message(content=f"{member_name}の凸で{boss_index+1}ボスを討伐します")
 
         boss_status_data = clan_data.boss_status_data[lap][boss_index]
         attack_status_index = boss_status_data.get_attack_status_index(player_data, False)
@@ -282,17 +570,19 @@ class ClanBattle(commands.Cog):
         description="元に戻す処理を実施します。"
     )
     @app_commands.describe(
-        member="処理対象のメンバー(メンションで指定)"
+        member="処理対象のメンバー"
     )
-    async def undo(self, interaction: discord.Interaction, member: discord.User):
+    async def undo(self, interaction: discord.Interaction, member: str):
         """コマンドでもとに戻すときの処理を実施する"""
         clan_data = self.clan_data[interaction.channel.category_id]
         if clan_data is None:
             await interaction.response.send_message("凸管理を行うカテゴリーチャンネル内で実行してください")
             return
-        player_data = clan_data.player_data_dict.get(member.id)
-        if not player_data:
-            await interaction.response.send_message(f"{member.display_name}さんは凸管理のメンバーに指定されていません。")
+        user_id = self.member_indexes.get(clan_data).find(member)
+        if user_id is None:
+            await interaction.response.send_message(f"{member}さんは凸管理のメンバーに指定されていません。")
+            return
+        player_data = clan_data.player_data_dict[user_id]
 
         if not player_data.log:
             await interaction.response.send_message("元に戻す内容がありませんでした")
@@ -300,7 +590,7 @@ class ClanBattle(commands.Cog):
         log_data = player_data.log[-1]
 
         await interaction.response.send_message(
-            f"{member.display_name}の{log_data.boss_index+1}ボスに対する"
+            f"{self._get_member_label(interaction.guild, user_id)}の{log_data.boss_index+1}ボスに対する"
             f"`{OPERATION_TYPE_DESCRIPTION_DICT[log_data.operation_type]}`を元に戻します。")
         await self._undo(clan_data, player_data, log_data)
 
@@ -327,6 +617,45 @@ class ClanBattle(commands.Cog):
         await self._delete_progress_message(clan_data, lap, boss_index)
         await self._send_new_progress_message(clan_data, lap, boss_index)
 
+    @attack_declare.autocomplete("member")
+    @attack_fin.autocomplete("member")
+    @defeat_boss.autocomplete("member")
+    @undo.autocomplete("member")
+    async def member_autocomplete(self, interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
+        """凸管理対象のメンバーだけを候補に出す"""
+        clan_data = self.clan_data[interaction.channel.category_id]
+        if clan_data is None:
+            return []
+        return [
+            app_commands.Choice(name=display_name, value=str(user_id))
+            for user_id, display_name in self.member_indexes.get(clan_data).search(current)
+        ]
+
+    @attack_declare.autocomplete("boss_number")
+    @attack_fin.autocomplete("boss_number")
+    @defeat_boss.autocomplete("boss_number")
+    @resend_progress_message.autocomplete("boss_number")
+    async def boss_number_autocomplete(self, interaction: discord.Interaction, current: str) -> List[app_commands.Choice[int]]:
+        return [
+            app_commands.Choice(name=f"{i+1}: {boss_name}", value=i + 1)
+            for i, boss_name in enumerate(ClanBattleData.boss_names)
+            if str(i + 1).startswith(current) or normalize_name(current) in normalize_name(boss_name)
+        ]
+
+    @attack_declare.autocomplete("lap")
+    @attack_fin.autocomplete("lap")
+    @defeat_boss.autocomplete("lap")
+    @resend_progress_message.autocomplete("lap")
+    async def lap_autocomplete(self, interaction: discord.Interaction, current: str) -> List[app_commands.Choice[int]]:
+        """進行中の周回を新しい順に候補に出す"""
+        clan_data = self.clan_data[interaction.channel.category_id]
+        if clan_data is None:
+            return []
+        laps = sorted(clan_data.progress_message_ids.keys(), reverse=True)
+        return [
+            app_commands.Choice(name=f"{lap}周目", value=lap) for lap in laps if str(lap).startswith(current)
+        ][:AUTOCOMPLETE_LIMIT]
+
     @app_commands.command(
         name="set_cot",
         description="持越時間を登録します。"
@@ -347,7 +676,7 @@ class ClanBattle(commands.Cog):
             await interaction.response.send_message(f"持ち越し時間{time}秒を設定します。")
             if len(player_data.carry_over_list) > 1:
                 co_index = await select_from_list(
-                    self.bot, interaction.channel, interaction.user, player_data.carry_over_list,
+                    self.prompts, interaction.channel, interaction.user, player_data.carry_over_list,
                     f"{interaction.user.mention} 持ち越しが二つ以上発生しています。以下から持ち越し時間を登録したい持ち越しを選択してください")
 
             player_data.carry_over_list[co_index].carry_over_time = time
@@ -367,22 +696,28 @@ class ClanBattle(commands.Cog):
             return
         
         if clan_data.form_data.check_update():
-            await interaction.response.send_message(content="アンケートフォームを新規作成しています。")
-            new_flag = True if len(clan_data.form_data.form_url) == 0 else False
-            async with interaction.channel.typing():
-                title = f"{datetime.now(JST).month}月 " + interaction.guild.name + " 日程調査"
-                form_data_dict = await create_form_data(title)
-                clan_data.form_data.set_from_form_data_dict(form_data_dict)
-            form_url = clan_data.form_data.create_form_url(interaction.user.display_name, interaction.user.id)
-            await interaction.response.send_message(f"{interaction.user.display_name} さん専用のURLです。\n{form_url}")
-            if new_flag:
-                SQLiteUtil.register_form_data(clan_data)
-            else:
-                SQLiteUtil.update_form_data(clan_data)
+            # フォームの作成には時間がかかるため、応答を保留してジョブとして実行する
+            await interaction.response.defer()
+            await self._submit_job(interaction, "form", lambda: self._form_job(interaction, clan_data))
         else:
             form_url = clan_data.form_data.create_form_url(interaction.user.display_name, interaction.user.id)
             await interaction.response.send_message(f"{interaction.user.display_name} さん専用のURLです。\n{form_url}")
 
+    async def _form_job(self, interaction: discord.Interaction, clan_data: ClanData) -> None:
+        """アンケートフォームを新規作成する"""
+        new_flag = True if len(clan_data.form_data.form_url) == 0 else False
+        title = f"{datetime.now(JST).month}月 " + interaction.guild.name + " 日程調査"
+        form_data_dict = await create_form_data(title)
+        clan_data.form_data.set_from_form_data_dict(form_data_dict)
+        clan_data.availability = {}
+        form_url = clan_data.form_data.create_form_url(interaction.user.display_name, interaction.user.id)
+        await interaction.followup.send(
+            f"アンケートフォームを新規作成しました。\n{interaction.user.display_name} さん専用のURLです。\n{form_url}")
+        if new_flag:
+            SQLiteUtil.register_form_data(clan_data)
+        else:
+            SQLiteUtil.update_form_data(clan_data)
+
     @app_commands.command(
         name="load_time",
         description="参戦時間を読み込みます。(手動更新用)"
@@ -401,9 +736,12 @@ class ClanBattle(commands.Cog):
         if day < 1 or day > 5:
             await interaction.response.send_message(content="1から5までの数字を指定してください")
             return
-        await interaction.response.send_message(f"{day}日目の参戦時間を読み込みます")
-        await self._load_gss_data(clan_data, day)
-        await interaction.response.send_message("読み込みが完了しました")
+        await interaction.response.defer()
+
+        async def load_time_job():
+            await self._load_gss_data(clan_data, day)
+            await interaction.followup.send(f"{day}日目の参戦時間の読み込みが完了しました")
+        await self._submit_job(interaction, "load_time", load_time_job)
 
     @app_commands.command(
         name="form_sheet",
@@ -421,7 +759,7 @@ class ClanBattle(commands.Cog):
 
     @app_commands.command(
         name="set_boss_hp",
-        description="指定した周回グループ・ボスのHPを変更します (管理者専用)"
+        description="このクランで使う指定した周回グループ・ボスのHPを変更します (管理者専用)"
     )
     @app_commands.describe(
         lap_group="周回グループ (0=1-6周, 1=7-22周, 2=23周以降)",
@@ -432,13 +770,321 @@ class ClanBattle(commands.Cog):
         if not interaction.user.guild_permissions.administrator:
             await interaction.response.send_message("このコマンドは管理者のみ使用できます。", ephemeral=True)
             return
-        if not (0 <= lap_group <= 2 and 0 <= boss_index <= 4 and value > 0):
-            await interaction.response.send_message("パラメータが不正です。lap_group: 0-2, boss_index: 0-4, value: 正の整数", ephemeral=True)
+        clan_data = self.clan_data[interaction.channel.category_id]
+        if clan_data is None:
+            await interaction.response.send_message("凸管理を行うカテゴリーチャンネル内で実行してください", ephemeral=True)
+            return
+        hp_profile = clan_data.get_hp_profile()
+        if not (0 <= lap_group < len(hp_profile.hp) and 0 <= boss_index <= 4 and value > 0):
+            await interaction.response.send_message(
+                f"パラメータが不正です。lap_group: 0-{len(hp_profile.hp) - 1}, boss_index: 0-4, value: 正の整数",
+                ephemeral=True)
             return
-        from cogs.cbutil.clan_battle_data import ClanBattleData
-        ClanBattleData.set_hp(lap_group, boss_index, value)
+        clan_data.hp_profile = hp_profile.with_hp(lap_group, boss_index, value)
+        SQLiteUtil.register_hp_profile(clan_data)
+        self._apply_hp_profile(clan_data)
         await interaction.response.send_message(f"{lap_group}グループの{boss_index+1}ボスのHPを{value}に設定しました。", ephemeral=True)
 
+    @app_commands.command(
+        name="reset_boss_hp",
+        description="このクランで変更したボスのHPを元に戻します (管理者専用)"
+    )
+    async def reset_boss_hp(self, interaction: discord.Interaction):
+        if not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message("このコマンドは管理者のみ使用できます。", ephemeral=True)
+            return
+        clan_data = self.clan_data[interaction.channel.category_id]
+        if clan_data is None:
+            await interaction.response.send_message("凸管理を行うカテゴリーチャンネル内で実行してください", ephemeral=True)
+            return
+        clan_data.hp_profile = None
+        SQLiteUtil.delete_hp_profile(clan_data)
+        self._apply_hp_profile(clan_data)
+        await interaction.response.send_message("ボスのHPを元に戻しました。", ephemeral=True)
+
+    def _apply_hp_profile(self, clan_data: ClanData) -> None:
+        """進行中の周回のボスの最大HPを現在のHPの表に合わせる"""
+        hp_profile = clan_data.get_hp_profile()
+        for lap, boss_status_data_list in clan_data.boss_status_data.items():
+            for boss_index, boss_status_data in enumerate(boss_status_data_list):
+                boss_status_data.max_hp = hp_profile.get_hp(lap, boss_index)
+
+    @app_commands.command(
+        name="route",
+        description="予約と残凸から、最も先まで進める凸の割り当てを表示します。"
+    )
+    async def route(self, interaction: discord.Interaction):
+        clan_data = self.clan_data[interaction.channel.category_id]
+        if clan_data is None:
+            await interaction.response.send_message("凸管理を行うカテゴリーチャンネル内で実行してください")
+            return
+        await interaction.response.defer()
+        await self._resolve_display_names(clan_data)
+        steps, unassigned = solve_route(clan_data)
+        await interaction.followup.send(embed=self._create_route_message(clan_data, interaction.guild, steps, unassigned))
+
+    def _create_route_message(
+        self, clan_data: ClanData, guild: discord.Guild, steps: List[RouteStep], unassigned: List[RouteAttacker]
+    ) -> discord.Embed:
+        """凸の割り当てを表示するメッセージを作成する"""
+        def attacker_txt(attacker: RouteAttacker, damage: int) -> str:
+            display_name = self._get_display_name(guild, attacker.player_data.user_id) or "???"
+            return f"{display_name}{'(持ち越し)' * attacker.carry_over} {'{:,}'.format(damage)}万"
+
+        route_txts = []
+        for step in steps:
+            txt = f"[{step.lap}周目] {ClanBattleData.boss_names[step.boss_index]} {'{:,}'.format(step.hp)}万: "
+            attack_txts = [attacker_txt(attacker, damage) for attacker, damage in step.attacks]
+            if step.beated:
+                attack_txts[-1] = "〆 " + attack_txts[-1]
+                if step.carry_over_time:
+                    attack_txts[-1] += f" 持ち越し{step.carry_over_time}秒"
+            else:
+                attack_txts[-1] += f" (残り{'{:,}'.format(step.hp - sum(damage for _, damage in step.attacks))}万)"
+            route_txts.append(txt + " → ".join(attack_txts))
+        if not route_txts:
+            route_txts.append("ダメージが入力された予約がありません。")
+
+        route_description = ""
+        for txt in route_txts:
+            if len(route_description) + len(txt) + 1 > 4000:  # 説明文の文字数の上限
+                route_description += "..."
+                break
+            route_description += txt + "\n"
+
+        route_embed = discord.Embed(
+            title="凸の割り当て",
+            description=route_description,
+            colour=colour.Colour.orange()
+        )
+        unassigned_count = defaultdict(int)
+        for attacker in unassigned:
+            unassigned_count[attacker.player_data.user_id] += attacker.count
+        if unassigned_count:
+            unassigned_txt = ", ".join(
+                f"{self._get_display_name(guild, user_id) or '???'}×{count}"
+                for user_id, count in unassigned_count.items()
+            )
+            route_embed.add_field(name="割り当てなし", value=unassigned_txt[:1024], inline=False)
+        return route_embed
+
+    @app_commands.command(
+        name="forecast",
+        description="残りの凸で一日の終わりに何周目まで進めるかを予測します。"
+    )
+    async def forecast(self, interaction: discord.Interaction):
+        clan_data = self.clan_data[interaction.channel.category_id]
+        if clan_data is None:
+            await interaction.response.send_message("凸管理を行うカテゴリーチャンネル内で実行してください")
+            return
+        await interaction.response.defer()
+        result = await self.forecaster.get(clan_data)
+        forecast_embed = discord.Embed(
+            title="本日の進行予測",
+            description=f"残り{result.attack_count}凸 (持ち越しを含む) を{result.simulations}回シミュレーションした結果です。\n"
+            f"平均: {result.expected_lap:.1f}周目",
+            colour=colour.Colour.orange()
+        )
+        forecast_embed.add_field(
+            name="一日の終わりの周回",
+            value="\n".join(f"{p}%: {result.lap_percentiles[p]}周目" for p in FORECAST_PERCENTILES),
+            inline=True
+        )
+        forecast_embed.add_field(
+            name="討伐数",
+            value="\n".join(f"{p}%: {result.beated_percentiles[p]}体" for p in FORECAST_PERCENTILES),
+            inline=True
+        )
+        await interaction.followup.send(embed=forecast_embed)
+
+    @app_commands.command(
+        name="stats",
+        description="メンバーのボスごとのダメージの記録を表示します。"
+    )
+    @app_commands.describe(
+        member="表示するメンバー (指定がない場合は自分)"
+    )
+    async def stats(self, interaction: discord.Interaction, member: Optional[discord.User] = None):
+        clan_data = self.clan_data[interaction.channel.category_id]
+        if clan_data is None:
+            await interaction.response.send_message("凸管理を行うカテゴリーチャンネル内で実行してください")
+            return
+        member = member or interaction.user
+        damage_stats = sorted(
+            (key, damage_stat) for key, damage_stat in clan_data.damage_stats.items() if key[0] == member.id
+        )
+        stats_embed = discord.Embed(
+            title=f"{member.display_name} のダメージの記録",
+            colour=colour.Colour.orange()
+        )
+        if not damage_stats:
+            stats_embed.description = "記録がありません。"
+        for (_, boss_index, tier), damage_stat in damage_stats[:25]:  # フィールド数の上限
+            stats_embed.add_field(
+                name=f"{ClanBattleData.boss_names[boss_index]} ({tier + 1}段階目)",
+                value=f"{damage_stat.count}回 平均{'{:,}'.format(round(damage_stat.mean))}万"
+                f" (±{'{:,}'.format(round(damage_stat.std))}万)\n"
+                f"最小{'{:,}'.format(damage_stat.min_damage)}万 最大{'{:,}'.format(damage_stat.max_damage)}万"
+                f" 80%の確率で{'{:,}'.format(damage_stat.percentile(20))}万以上",
+                inline=False
+            )
+        await interaction.response.send_message(embed=stats_embed)
+
+    @app_commands.command(
+        name="export",
+        description="このクランの凸のデータをファイルに出力します (管理者専用)"
+    )
+    @app_commands.describe(
+        file_format="ファイルの形式",
+        start="この日の5時以降のデータを出力します (YYYY-MM-DD)",
+        end="この日の5時より前のデータを出力します (YYYY-MM-DD)"
+    )
+    @app_commands.choices(file_format=[
+        app_commands.Choice(name=file_format, value=file_format) for file_format in EXPORT_FORMATS
+    ])
+    async def export(
+        self, interaction: discord.Interaction,
+        file_format: str = "csv", start: Optional[str] = None, end: Optional[str] = None
+    ):
+        if not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message("このコマンドは管理者のみ使用できます。", ephemeral=True)
+            return
+        clan_data = self.clan_data[interaction.channel.category_id]
+        if clan_data is None:
+            await interaction.response.send_message("凸管理を行うカテゴリーチャンネル内で実行してください", ephemeral=True)
+            return
+        try:
+            start_time = parse_date(start) if start else None
+            end_time = parse_date(end) if end else None
+        except ValueError:
+            await interaction.response.send_message("日付は YYYY-MM-DD の形式で指定してください", ephemeral=True)
+            return
+        await interaction.response.defer()
+        await self._submit_job(
+            interaction, "export", lambda: self._export_job(interaction, clan_data, file_format, start_time, end_time))
+
+    async def _export_job(
+        self, interaction: discord.Interaction, clan_data: ClanData, file_format: str,
+        start_time: Optional[datetime], end_time: Optional[datetime]
+    ) -> None:
+        with tempfile.TemporaryDirectory() as out_dir:
+            try:
+                paths = await asyncio.to_thread(
+                    export_clan, clan_data.category_id, out_dir, file_format, start_time, end_time)
+            except ImportError:
+                await interaction.followup.send("parquet形式で出力するにはpyarrowをインストールしてください")
+                return
+            if not paths:
+                await interaction.followup.send("出力するデータがありません")
+                return
+            # 1つのメッセージに添付できるのは10ファイルまでで、合計の大きさにも上限がある
+            batches: List[List[str]] = [[]]
+            batch_size = 0
+            for path in paths:
+                size = os.path.getsize(path)
+                if len(batches[-1]) >= 10 or (batches[-1] and batch_size + size > EXPORT_CHUNK_SIZE):
+                    batches.append([])
+                    batch_size = 0
+                batches[-1].append(path)
+                batch_size += size
+            for batch in batches:
+                await interaction.followup.send(
+                    files=[discord.File(path, filename=os.path.basename(path)) for path in batch])
+
+    @app_commands.command(
+        name="jobs",
+        description="このサーバーで実行中・実行待ちの処理を表示します。"
+    )
+    async def jobs(self, interaction: discord.Interaction):
+        jobs = self.job_queue.get_jobs(interaction.guild_id)
+        now = datetime.now(JST)
+        job_txts = []
+        for job in jobs:
+            if job.started:
+                job_txts.append(f"実行中 `/{job.name}` {job.user_name} ({(now - job.started).seconds}秒経過)")
+            else:
+                job_txts.append(f"実行待ち `/{job.name}` {job.user_name} ({(now - job.created).seconds}秒待機)")
+        jobs_embed = discord.Embed(
+            title="実行中の処理",
+            description="\n".join(job_txts) or "実行中の処理はありません。",
+            colour=colour.Colour.orange()
+        )
+        jobs_embed.set_footer(
+            text=f"全体: 実行中 {len(self.job_queue.running)}件 / 実行待ち {self.job_queue.pending_count}件\n"
+            f"無視したリアクション: 連打 {self.reaction_limiter.suppressed}件 / 重複 {self.reaction_dedupe.suppressed}件")
+        await interaction.response.send_message(embed=jobs_embed, ephemeral=True)
+
+    async def _submit_job(
+        self, interaction: discord.Interaction, name: str, func: Callable[[], Awaitable[None]]
+    ) -> None:
+        """時間のかかる処理をジョブキューに登録する
+
+        呼び出す前に応答を保留 (defer) しておき、結果はジョブの中でfollowupとして送信する
+        """
+        async def run():
+            try:
+                await func()
+            except Exception:
+                logger.exception(f"job failed: {name}, guild_id={interaction.guild_id}")
+                await interaction.followup.send(f"`/{name}` の実行に失敗しました")
+        if await self.job_queue.submit(interaction.guild_id, name, interaction.user.display_name, run) is None:
+            await interaction.followup.send(
+                "実行待ちの処理が多いため実行できませんでした。しばらくしてから再度実行してください")
+
+    @app_commands.command(
+        name="heatmap",
+        description="時間ごとの残凸数を表示します。"
+    )
+    async def heatmap(self, interaction: discord.Interaction):
+        clan_data = self.clan_data[interaction.channel.category_id]
+        if clan_data is None:
+            await interaction.response.send_message("凸管理を行うカテゴリーチャンネル内で実行してください")
+            return
+        availability = clan_data.availability.get(clan_data.availability_day)
+        if availability is None:
+            await interaction.response.send_message("参戦時間が読み込まれていません。`/load_time` で読み込んでください。")
+            return
+        await interaction.response.send_message(embed=self._create_heatmap_message(clan_data, availability))
+
+    def _create_heatmap_message(self, clan_data: ClanData, availability: AvailabilityMatrix) -> discord.Embed:
+        """時間ごとの残凸数を表示するメッセージを作成する"""
+        remain_attacks = {
+            player_data.user_id: 3 - player_data.physics_attack - player_data.magic_attack
+            for player_data in clan_data.player_data_dict.values()
+        }
+        remain_availability = RemainAttackAvailability(availability, remain_attacks)
+        remain_attack_counts = remain_availability.remain_attack_counts()
+        max_count = max(remain_attack_counts) or 1
+        now_index = get_hour_index(datetime.now(JST).hour)
+
+        lines = []
+        for i, count in enumerate(remain_attack_counts):
+            bar = "█" * round(count / max_count * 15)
+            cursor = ">" if i == now_index else " "
+            lines.append(
+                f"{cursor}{LIMIT_TIME_START_HOUR+i:>2}時 {bar:<15} {count:>2}凸"
+                f" ({remain_availability.attacker_count(i)}人)"
+            )
+        embed = discord.Embed(
+            title=f"{clan_data.availability_day}日目 時間ごとの残凸数",
+            description="```\n" + "\n".join(lines) + "\n```",
+            colour=colour.Colour.orange()
+        )
+
+        guild = self.bot.get_guild(clan_data.guild_id)
+        attackers = [
+            display_name for user_id in remain_availability.available_attackers(now_index)
+            if (display_name := self._get_display_name(guild, user_id))
+        ]
+        embed.add_field(name="今参戦可能なメンバー", value=", ".join(attackers) or "なし", inline=False)
+        gaps = remain_availability.coverage_gaps(now_index)
+        embed.add_field(
+            name="残凸のあるメンバーが参戦できない時間帯",
+            value=", ".join(f"{start}～{end}時" for start, end in gaps) or "なし",
+            inline=False
+        )
+        return embed
+
     async def _undo(self, clan_data: ClanData, player_data: PlayerData, log_data: LogData):
         """元に戻す処理を実施する。"""
         boss_index = log_data.boss_index
@@ -458,6 +1104,8 @@ class ClanBattle(commands.Cog):
                 attack_status = boss_status_data.attack_players[attack_index]
                 player_data.from_dict(log_data.player_data)
                 attack_status.attacked = False
+                clan_data.attack_version += 1
+                self._revert_damage_stat(clan_data, attack_status, log_data.lap, boss_index)
                 SQLiteUtil.reverse_attackstatus(clan_data, log_data.lap, boss_index, attack_status)
                 if log_type is OperationType.LAST_ATTACK:
                     boss_status_data.beated = log_data.beated
@@ -468,6 +1116,24 @@ class ClanBattle(commands.Cog):
                 SQLiteUtil.update_playerdata(clan_data, player_data)
                 SQLiteUtil.reregister_carryover_data(clan_data, player_data)
 
+    def _record_damage_stat(self, clan_data: ClanData, attack_status: AttackStatus, lap: int, boss_index: int) -> None:
+        """凸のダメージを集計する。持ち越しとダメージ未入力の凸は集計しない"""
+        if attack_status.carry_over or attack_status.damage <= 0:
+            return
+        key = clan_data.get_damage_stat_key(attack_status.player_data.user_id, boss_index, lap)
+        damage_stat = record_damage(clan_data.damage_stats, key, attack_status.damage)
+        SQLiteUtil.update_damage_stat(clan_data, key, damage_stat)
+
+    def _revert_damage_stat(self, clan_data: ClanData, attack_status: AttackStatus, lap: int, boss_index: int) -> None:
+        """取り消した凸のダメージを集計から除く"""
+        if attack_status.carry_over or attack_status.damage <= 0:
+            return
+        key = clan_data.get_damage_stat_key(attack_status.player_data.user_id, boss_index, lap)
+        if key not in clan_data.damage_stats:
+            return
+        damage_stat = revert_damage(clan_data.damage_stats, key, attack_status.damage)
+        SQLiteUtil.update_damage_stat(clan_data, key, damage_stat)
+
     async def _delete_reserve_by_attack(self, clan_data: ClanData, attack_status: AttackStatus, boss_idx: int):
         """ボス攻撃時に予約の削除を行う"""
         reserve_idx = -1
@@ -512,20 +1178,22 @@ class ClanBattle(commands.Cog):
         current_hp: int = boss_status_data.max_hp
         for attack_status in boss_status_data.attack_players:
             if attack_status.attacked:
-                user = guild.get_member(attack_status.player_data.user_id)
-                if user is None:
+                display_name = self._get_display_name(guild, attack_status.player_data.user_id)
+                if display_name is None:
                     continue
                 attacked_list.append(
-                    f"({attack_status.attack_type.value}済み) {'{:,}'.format(attack_status.damage)}万 {user.display_name}"
+                    f"({attack_status.attack_type.value}済み) {'{:,}'.format(attack_status.damage)}万 {display_name}"
                 )
                 current_hp -= attack_status.damage
+        pending_list: List[Tuple[AttackStatus, str]] = []
         for attack_status in boss_status_data.attack_players:
             if not attack_status.attacked:
-                user = guild.get_member(attack_status.player_data.user_id)
-                if user is None:
+                display_name = self._get_display_name(guild, attack_status.player_data.user_id)
+                if display_name is None:
                     continue
-                attack_list.append(attack_status.create_attack_status_txt(user.display_name, current_hp))
+                attack_list.append(attack_status.create_attack_status_txt(display_name, current_hp))
                 total_damage += attack_status.damage
+                pending_list.append((attack_status, display_name))
         progress_title = f"[{lap}周目] {ClanBattleData.boss_names[boss_index]}"
         if boss_status_data.beated:
             progress_title += " **討伐済み**"
@@ -541,8 +1209,27 @@ class ClanBattle(commands.Cog):
         )
         if boss_status_data.beated:
             pr_embed.set_thumbnail(url=TREASURE_CHEST)
+        elif finish_txt := self._create_finish_plan_txt(current_hp, pending_list):
+            pr_embed.add_field(name="持ち越しが最大になる凸順", value=finish_txt, inline=False)
         return pr_embed
 
+    def _create_finish_plan_txt(self, current_hp: int, pending_list: List[Tuple[AttackStatus, str]]) -> Optional[str]:
+        """持ち越しが最大になる凸順の表示を作成する。討伐できない場合はNone"""
+        finish_plan = plan_finishing_blow(current_hp, [attack_status.damage for attack_status, _ in pending_list])
+        if finish_plan is None:
+            return None
+        finish_txt = "\n".join(
+            f"{i+1}. {'{:,}'.format(pending_list[j][0].damage)}万 {pending_list[j][1]}"
+            for i, j in enumerate(finish_plan.order[:-1])
+        )
+        finisher, finisher_name = pending_list[finish_plan.finisher]
+        finish_txt += f"\n〆 {'{:,}'.format(finisher.damage)}万 {finisher_name}"\
+            f" (残り{'{:,}'.format(finish_plan.remain_hp)}万 持ち越し{finish_plan.carry_over_time}秒)"
+        finish_txt = finish_txt.strip()
+        if len(finish_txt) > 1024:  # フィールドの文字数の上限
+            finish_txt = "..." + finish_txt[-1021:]
+        return finish_txt
+
     async def _initialize_progress_messages(
         self, clan_data: ClanData, lap: int
     ) -> None:
@@ -550,48 +1237,164 @@ class ClanBattle(commands.Cog):
         clan_data.initialize_boss_status_data(lap)
         SQLiteUtil.register_progress_message_id(clan_data, lap)
         SQLiteUtil.register_all_boss_status_data(clan_data, lap)
-        for i in range(5):
-            await self._send_new_progress_message(clan_data, lap, i)
+        # ボスごとに別のチャンネルなので並行して送信する
+        await asyncio.gather(*[self._send_new_progress_message(clan_data, lap, i) for i in range(5)])
 
     async def _send_new_progress_message(
         self, clan_data: ClanData, lap: int, boss_index: int
     ) -> None:
         """新しい進行メッセージを送信する"""
         guild = self.bot.get_guild(clan_data.guild_id)
+        await self._resolve_display_names(clan_data)
 
         channel = self.bot.get_channel(clan_data.boss_channel_ids[boss_index])
         progress_embed = self._create_progress_message(clan_data, lap, boss_index, guild)
-        progress_message: discord.Message = await channel.send(embed=progress_embed)
+        progress_message: discord.Message = await channel.send(
+            embed=progress_embed, view=self._get_progress_view(clan_data, lap, boss_index))
         clan_data.progress_message_ids[lap][boss_index] = progress_message.id
-        await progress_message.add_reaction(EMOJI_PHYSICS)
-        await progress_message.add_reaction(EMOJI_MAGIC)
-        await progress_message.add_reaction(EMOJI_CARRYOVER)
-        await progress_message.add_reaction(EMOJI_ATTACK)
-        await progress_message.add_reaction(EMOJI_LAST_ATTACK)
-        await progress_message.add_reaction(EMOJI_REVERSE)
+        await add_reactions(progress_message, PROGRESS_REACTIONS)
+        SQLiteUtil.update_progress_message_id(clan_data, lap)
+        await self._send_summary_message(clan_data, lap, guild)
+
+    def _get_progress_view(self, clan_data: ClanData, lap: int, boss_index: int) -> Optional[discord.ui.View]:
+        """進行用のメッセージに付けるボタン。討伐済みのボスには付けない"""
+        if clan_data.boss_status_data[lap][boss_index].beated:
+            return None
+        return self.damage_entry_view
+
+    async def _on_damage_entered(
+        self, interaction: discord.Interaction, message: discord.Message, damage: int, memo: str
+    ) -> None:
+        """進行用のメッセージのボタンから入力されたダメージを登録する"""
+        clan_data = self.clan_data[interaction.channel.category_id]
+        if clan_data is None or (boss_index := clan_data.get_boss_index_from_channel_id(interaction.channel_id)) is None:
+            await interaction.response.send_message("凸管理を行うチャンネルではありません", ephemeral=True)
+            return
+        player_data = clan_data.player_data_dict.get(interaction.user.id)
+        if player_data is None:
+            await interaction.response.send_message(
+                f"{interaction.user.display_name}さんは凸管理対象ではありません。", ephemeral=True)
+            return
+        self._remember_member(clan_data, interaction.user)
+        lap = clan_data.get_lap_from_message_id(message.id, boss_index)
+        if not await self._register_damage(clan_data, player_data, boss_index, damage, memo, lap):
+            await interaction.response.send_message("凸宣言をしてからダメージを入力してください", ephemeral=True)
+            return
+        await interaction.response.send_message(f"{'{:,}'.format(damage)}万 を登録しました", ephemeral=True)
+
+    async def _register_damage(
+        self, clan_data: ClanData, player_data: PlayerData, boss_index: int,
+        damage: int, memo: str, lap: Optional[int] = None
+    ) -> bool:
+        """凸宣言中の凸にダメージを登録する
+
+        lapの指定があればその周を優先し、なければ凸宣言をしている直近の周に登録する
+        """
+        lap_list = sorted(clan_data.progress_message_ids.keys(), reverse=True)
+        if lap in lap_list:
+            lap_list.remove(lap)
+            lap_list.insert(0, lap)
+        for lap in lap_list:
+            boss_status_data = clan_data.boss_status_data[lap][boss_index]
+            if (attack_status_index := boss_status_data.get_attack_status_index(
+                    player_data, False)) is not None:
+                attack_status = boss_status_data.attack_players[attack_status_index]
+                attack_status.damage = damage
+                attack_status.memo = memo
+                SQLiteUtil.update_attackstatus(clan_data, lap, boss_index, attack_status)
+                self._run_in_background(self._update_progress_message(clan_data, lap, boss_index))
+                return True
+        return False
+
+    async def _send_staged_progress_message(self, clan_data: ClanData, lap: int, boss_index: int) -> discord.Message:
+        """討伐前に次の周回の進行用メッセージを送信しておく。内容は討伐時に編集する"""
+        channel = self.bot.get_channel(clan_data.boss_channel_ids[boss_index])
+        staged_embed = discord.Embed(
+            title=f"[{lap}周目] {ClanBattleData.boss_names[boss_index]}",
+            description="準備中",
+            colour=BOSS_COLOURS[boss_index]
+        )
+        staged_message: discord.Message = await channel.send(embed=staged_embed, view=self.damage_entry_view)
+        await add_reactions(staged_message, PROGRESS_REACTIONS)
+        return staged_message
+
+    async def _reveal_staged_progress_message(
+        self, clan_data: ClanData, lap: int, boss_index: int, staged_message: discord.Message
+    ) -> None:
+        """準備しておいたメッセージを進行用のメッセージとして使う"""
+        guild = self.bot.get_guild(clan_data.guild_id)
+        await self._resolve_display_names(clan_data)
+        clan_data.progress_message_ids[lap][boss_index] = staged_message.id
         SQLiteUtil.update_progress_message_id(clan_data, lap)
+        await staged_message.edit(
+            embed=self._create_progress_message(clan_data, lap, boss_index, guild),
+            view=self._get_progress_view(clan_data, lap, boss_index))
+        await self._send_summary_message(clan_data, lap, guild)
 
-        # まとめ用のメッセージがなければ新しく送信する
+    def _update_prestage(self, clan_data: ClanData, lap: int, boss_index: int) -> None:
+        """討伐が近ければ次の周回のメッセージを準備し、遠ざかった場合は準備したメッセージを削除する"""
+        next_lap = lap + 1
+        key = (clan_data.category_id, next_lap, boss_index)
+        # 次の周回のメッセージが既にあれば、準備したメッセージは使われないので削除する
+        if (next_ids := clan_data.progress_message_ids.get(next_lap)) and next_ids[boss_index] != 0:
+            self.progress_stager.discard(key)
+            return
+        boss_status_data = clan_data.boss_status_data[lap][boss_index]
+        if should_prestage(boss_status_data):
+            self.progress_stager.stage(
+                key, lambda: self._send_staged_progress_message(clan_data, next_lap, boss_index))
+        elif not boss_status_data.beated:
+            self.progress_stager.discard(key)
+
+    async def _send_summary_message(self, clan_data: ClanData, lap: int, guild: discord.Guild) -> None:
+        """まとめ用のメッセージがなければ新しく送信する"""
         if lap not in clan_data.summary_message_ids:
-            clan_data.summary_message_ids[lap] = [0, 0, 0, 0, 0]
-            for i in range(5):
-                progress_embed = self._create_progress_message(clan_data, lap, i, guild)
-                summary_channel = self.bot.get_channel(clan_data.summary_channel_id)
-                sum_progress_message = await summary_channel.send(embed=progress_embed)
-                clan_data.summary_message_ids[lap][i] = sum_progress_message.id
+            clan_data.summary_message_ids[lap] = 0
+            summary_channel = self.bot.get_channel(clan_data.summary_channel_id)
+            summary_message = await summary_channel.send(embeds=self._create_summary_embeds(clan_data, lap, guild))
+            clan_data.summary_message_ids[lap] = summary_message.id
             SQLiteUtil.register_summary_message_id(clan_data, lap)
+            # 送信中に要求された更新は反映されていないため、あらためて更新する
+            if (clan_data.category_id, lap) in self.summary_updates_while_sending:
+                self.summary_updates_while_sending.discard((clan_data.category_id, lap))
+                self._request_summary_update(clan_data, lap)
+
+    def _create_summary_embeds(self, clan_data: ClanData, lap: int, guild: discord.Guild) -> List[discord.Embed]:
+        """まとめチャンネルに表示する、その周回の5体分の進行状況"""
+        return fit_embeds([self._create_progress_message(clan_data, lap, i, guild) for i in range(5)])
 
     async def _update_progress_message(self, clan_data: ClanData, lap: int, boss_idx: int) -> None:
         """進行用のメッセージを更新する"""
+        await self._resolve_display_names(clan_data)
         channel = self.bot.get_channel(clan_data.boss_channel_ids[boss_idx])
         progress_message = await channel.fetch_message(clan_data.progress_message_ids[lap][boss_idx])
         progress_embed = self._create_progress_message(clan_data, lap, boss_idx, channel.guild)
-        await progress_message.edit(embed=progress_embed)
+        await progress_message.edit(embed=progress_embed, view=self._get_progress_view(clan_data, lap, boss_idx))
+
+        self._request_summary_update(clan_data, lap)
+        self._update_prestage(clan_data, lap, boss_idx)
 
-        # まとめチャンネルの進行用メッセージを更新する
+    def _request_summary_update(self, clan_data: ClanData, lap: int) -> None:
+        # まとめチャンネルのメッセージは続けて更新されることが多いため、まとめて1回だけ編集する
+        self.summary_updater.request(
+            (clan_data.category_id, lap), lambda: self._update_summary_message(clan_data, lap))
+
+    async def _update_summary_message(self, clan_data: ClanData, lap: int) -> None:
+        """まとめチャンネルのその周回のメッセージを更新する"""
+        message_id = clan_data.summary_message_ids.get(lap)
+        if message_id is None:
+            return
+        if message_id == 0:
+            # メッセージを送信中なので、送信が終わってから更新する
+            self.summary_updates_while_sending.add((clan_data.category_id, lap))
+            return
+        guild = self.bot.get_guild(clan_data.guild_id)
         channel = self.bot.get_channel(clan_data.summary_channel_id)
-        progress_message = await channel.fetch_message(clan_data.summary_message_ids[lap][boss_idx])
-        await progress_message.edit(embed=progress_embed)
+        try:
+            await channel.get_partial_message(message_id).edit(
+                embeds=self._create_summary_embeds(clan_data, lap, guild))
+        except discord.NotFound:
+            return
 
     async def _delete_progress_message(self, clan_data: ClanData, lap: int, boss_idx: int) -> None:
         """進行用のメッセージを削除する""" 
@@ -624,7 +1427,7 @@ class ClanBattle(commands.Cog):
         if len(attack_status.player_data.carry_over_list) > 1:
             try:
                 carry_over_index = await select_from_list(
-                    self.bot,
+                    self.prompts,
                     channel,
                     user,
                     attack_status.player_data.carry_over_list,
@@ -675,6 +1478,8 @@ class ClanBattle(commands.Cog):
             attack_status.update_attack_log()
 
         attack_status.attacked = True
+        clan_data.attack_version += 1
+        self._record_damage_stat(clan_data, attack_status, lap, boss_index)
 
         SQLiteUtil.update_attackstatus(clan_data, lap, boss_index, attack_status)
         SQLiteUtil.update_playerdata(clan_data, attack_status.player_data)
@@ -735,6 +1540,8 @@ class ClanBattle(commands.Cog):
                 attack_status.player_data.carry_over_list.append(carry_over)
                 SQLiteUtil.register_carryover_data(clan_data, attack_status.player_data, carry_over)
         boss_status_data.beated = True
+        clan_data.attack_version += 1
+        self._record_damage_stat(clan_data, attack_status, lap, boss_index)
         await self._update_progress_message(clan_data, lap, boss_index)
         SQLiteUtil.update_attackstatus(clan_data, lap, boss_index, attack_status)
         SQLiteUtil.update_boss_status_data(clan_data, boss_index, boss_status_data)
@@ -747,9 +1554,13 @@ class ClanBattle(commands.Cog):
             SQLiteUtil.register_progress_message_id(clan_data, next_lap)
             SQLiteUtil.register_all_boss_status_data(clan_data, next_lap)
         
-        # 進行用のメッセージが送信されていなければ新しく送信する
+        # 進行用のメッセージが送信されていなければ、準備しておいたメッセージを使うか新しく送信する
         if clan_data.progress_message_ids[next_lap][boss_index] == 0:
-            await self._send_new_progress_message(clan_data, next_lap, boss_index)
+            staged_message = await self.progress_stager.take((clan_data.category_id, next_lap, boss_index))
+            if staged_message is None:
+                await self._send_new_progress_message(clan_data, next_lap, boss_index)
+            else:
+                await self._reveal_staged_progress_message(clan_data, next_lap, boss_index, staged_message)
         await self._update_remain_attack_message(clan_data)
         await self._delete_reserve_by_attack(clan_data, attack_status, boss_index)
 
@@ -759,10 +1570,10 @@ class ClanBattle(commands.Cog):
         reserve_message_list = []
         clan_data.reserve_list[boss_index].sort(key=lambda x: x.damage, reverse=True)
         for reserve_data in clan_data.reserve_list[boss_index]:
-            user = guild.get_member(reserve_data.player_data.user_id)
-            if user is None:
+            display_name = self._get_display_name(guild, reserve_data.player_data.user_id)
+            if display_name is None:
                 continue
-            reserve_message_list.append(reserve_data.create_reserve_txt(user.display_name))
+            reserve_message_list.append(reserve_data.create_reserve_txt(display_name))
 
         rs_embed = discord.Embed(
             title=resreve_message_title,
@@ -774,23 +1585,24 @@ class ClanBattle(commands.Cog):
     async def _initialize_reserve_message(self, clan_data: ClanData) -> None:
         """新しい予約メッセージを送信する"""
         guild = self.bot.get_guild(clan_data.guild_id)
+        await self._resolve_display_names(clan_data)
         reserve_channel = self.bot.get_channel(clan_data.reserve_channel_id)
-        async for old_message in reserve_channel.history(limit=100):
-            try:
-                await old_message.delete()
-            except Exception:
-                pass
+        await purge_channel(reserve_channel)
+        # メッセージは並び順を保つため順番に送信し、リアクションはまとめて並行に付ける
+        reserve_messages: List[discord.Message] = []
         for i in range(5):
             reserve_message_embed = self._create_reserve_message(clan_data, i, guild)
             reserve_message = await reserve_channel.send(embed=reserve_message_embed)
             clan_data.reserve_message_ids[i] = reserve_message.id
-            await reserve_message.add_reaction(EMOJI_PHYSICS)
-            await reserve_message.add_reaction(EMOJI_MAGIC)
-            await reserve_message.add_reaction(EMOJI_SETTING)
-            await reserve_message.add_reaction(EMOJI_CANCEL)
+            reserve_messages.append(reserve_message)
+        await asyncio.gather(*[
+            add_reactions(reserve_message, [EMOJI_PHYSICS, EMOJI_MAGIC, EMOJI_SETTING, EMOJI_CANCEL])
+            for reserve_message in reserve_messages
+        ])
 
     async def _update_reserve_message(self, clan_data: ClanData, boss_idx: int) -> None:
         """予約状況を表示するメッセージを更新する"""
+        await self._resolve_display_names(clan_data)
         channel = self.bot.get_channel(clan_data.reserve_channel_id)
         reserve_message = await channel.fetch_message(clan_data.reserve_message_ids[boss_idx])
         reserve_embed = self._create_reserve_message(clan_data, boss_idx, channel.guild)
@@ -812,10 +1624,10 @@ class ClanBattle(commands.Cog):
         sum_remain_attack = 0
         guild = self.bot.get_guild(clan_data.guild_id)
         for player_data in clan_data.player_data_dict.values():
-            user = guild.get_member(player_data.user_id)
-            if user is None:
+            display_name = self._get_display_name(guild, player_data.user_id)
+            if display_name is None:
                 continue
-            txt = "- " + player_data.create_txt(user.display_name)
+            txt = "- " + player_data.create_txt(display_name)
             sum_attack = player_data.magic_attack + player_data.physics_attack
             sum_remain_attack += 3 - sum_attack
             if player_data.carry_over_list:
@@ -859,6 +1671,7 @@ class ClanBattle(commands.Cog):
 
     async def _update_remain_attack_message(self, clan_data: ClanData) -> None:
         """残凸状況を表示するメッセージを更新する"""
+        await self._resolve_display_names(clan_data)
         remain_attack_channel = self.bot.get_channel(clan_data.remain_attack_channel_id)
         remain_attack_message = await remain_attack_channel.fetch_message(clan_data.remain_attack_message_id)
         remain_attack_embed = self._create_remain_attaack_message(clan_data)
@@ -866,6 +1679,7 @@ class ClanBattle(commands.Cog):
 
     async def _initialize_remain_attack_message(self, clan_data: ClanData) -> None:
         """残凸状況を表示するメッセージの初期化を行う"""
+        await self._resolve_display_names(clan_data)
         remain_attack_embed = self._create_remain_attaack_message(clan_data)
         remain_attack_channel = self.bot.get_channel(clan_data.remain_attack_channel_id)
         remain_attack_message = await remain_attack_channel.send(embed=remain_attack_embed)
@@ -881,51 +1695,64 @@ class ClanBattle(commands.Cog):
         clan_data.reserve_list = [
             [], [], [], [], []
         ]
+        clan_data.attack_version += 1
         SQLiteUtil.delete_all_reservedata(clan_data)
 
         if clan_data.form_data.form_url:
-            now = datetime.now(JST)
-            if ClanBattleData.start_time <= now <= ClanBattleData.end_time:
-                diff = now - ClanBattleData.start_time
-                day = diff.days + 1
+            if day := ClanBattleData.get_day(datetime.now(JST)):
                 await self._load_gss_data(clan_data, day)
 
     async def _get_reserve_info(
-        self, clan_data: ClanData, player_data: PlayerData, user: discord.User
+        self, clan_data: ClanData, player_data: PlayerData, user: discord.User, boss_index: int
     ) -> Optional[Tuple[int, str, bool]]:
         """ユーザーから予約に関する情報を取得する"""
         setting_content_damage = f"{user.mention} 想定ダメージを送信してください\nスペース後にコメントを付けられます (例: `600 60s討伐`)"
+        key = clan_data.get_damage_stat_key(player_data.user_id, boss_index, clan_data.get_latest_lap(boss_index))
+        damage_stat = clan_data.damage_stats.get(key)
+        average_txt = f"\nこれまでの平均: {'{:,}'.format(round(damage_stat.mean))}万 ({damage_stat.count}回)" if damage_stat else ""
+        setting_content_damage += average_txt
+        setting_content_damage_button = f"{user.mention} ボタンを押して想定ダメージを入力してください"
+        if average_txt:
+            setting_content_damage_button += average_txt + " を入力欄に入れてあります"
         setting_content_co = f"{user.mention} 持ち越しの予約ですか？"
         setting_message_cancel = f"{user.mention} タイムアウトのため予約設定をキャンセルしました"
         setting_content_fin = "予約設定を受け付けました"
         command_channnel = self.bot.get_channel(clan_data.command_channel_id)
-        await command_channnel.send(content=setting_content_damage)
-
-        try:
-            damage_message: discord.Message = await self.bot.wait_for(
-                'message', timeout=60.0,
-                check=lambda m: m.author == user and get_damage(m.content)
-            )
-        except asyncio.TimeoutError:
-            await command_channnel.send(setting_message_cancel)
-            return None
-
-        damage, memo = get_damage(damage_message.content)
+        if LEGACY_DAMAGE_MESSAGE:
+            await command_channnel.send(content=setting_content_damage)
+            try:
+                damage_message: discord.Message = await self.prompts.wait_message(
+                    user.id, command_channnel.id, check=lambda m: m.content.strip() and get_damage(m.content)
+                )
+            except asyncio.TimeoutError:
+                await command_channnel.send(setting_message_cancel)
+                return None
+            damage, memo = get_damage(damage_message.content)
+        else:
+            # これまでの平均を入力欄にあらかじめ入れておき、そのまま送信すれば平均で予約できるようにする
+            reserve_damage_view = ReserveDamageView(user.id, round(damage_stat.mean) if damage_stat else None)
+            setting_message = await command_channnel.send(
+                content=setting_content_damage_button, view=reserve_damage_view)
+            await reserve_damage_view.wait()
+            await setting_message.edit(view=None)
+            if reserve_damage_view.result is None:
+                await command_channnel.send(setting_message_cancel)
+                return None
+            damage, memo = reserve_damage_view.result
 
         if player_data.carry_over_list:
             setting_co_message = await command_channnel.send(content=setting_content_co)
+            selected = self.prompts.wait_reaction(user.id, setting_co_message.id, [EMOJI_YES, EMOJI_NO])
             await setting_co_message.add_reaction(EMOJI_YES)
             await setting_co_message.add_reaction(EMOJI_NO)
 
             try:
-                reaction_co, user = await self.bot.wait_for(
-                    'reaction_add', timeout=60.0, check=lambda reaction, reaction_user: reaction_user == user
-                )
+                emoji_co = await selected
             except asyncio.TimeoutError:
                 await command_channnel.send(setting_message_cancel)
                 return None
             
-            if str(reaction_co.emoji) == EMOJI_YES:
+            if emoji_co == EMOJI_YES:
                 carry_over = True
             else:
                 carry_over = False
@@ -935,41 +1762,127 @@ class ClanBattle(commands.Cog):
         return damage, memo, carry_over
 
     async def _check_date_update(self, clan_data: ClanData):
-        """日付が更新されているかどうかをチェックする"""
-        today = (datetime.now(JST) - timedelta(hours=5)).date()
-        if clan_data.date != today:
-            clan_data.date = today
+        """日付が更新されているかどうかをチェックする
+
+        5時の定期実行で更新済みであれば何もしない。同じクランの更新が実行中の場合は完了を待つ
+        """
+        today = get_today(datetime.now(JST))
+        if clan_data.date == today:
+            return
+        async with self.rollover_locks[clan_data.category_id]:
+            if clan_data.date == today:
+                return
+            started = time.perf_counter()
+            # 初期化で消える前にその日の結果を集計しておき、投稿は初期化を待たせないよう後で行う
+            report = SQLiteUtil.load_daily_report(clan_data, clan_data.date)
 
             await self.initialize_clandata(clan_data)
-            await self._initialize_reserve_message(clan_data)
-            await self._initialize_remain_attack_message(clan_data)
+            await asyncio.gather(
+                self._initialize_reserve_message(clan_data),
+                self._initialize_remain_attack_message(clan_data)
+            )
+            # 初期化が終わるまで日付を更新しないことで、ロックの外のチェックを通った呼び出しも完了を待つ
+            clan_data.date = today
             SQLiteUtil.update_clandata(clan_data)
+            self._run_in_background(self._send_daily_report(clan_data, report))
+            logger.info(f"rolled over: category_id={clan_data.category_id}, {time.perf_counter() - started:.1f}s")
+
+    def _run_in_background(self, coro) -> None:
+        """完了を待たずに実行する。例外はログに出力する"""
+        async def run():
+            try:
+                await coro
+            except Exception:
+                logger.exception("background job failed")
+
+        task = asyncio.create_task(run())
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+
+    async def _send_daily_report(self, clan_data: ClanData, report: DailyReport) -> None:
+        """1日の結果をまとめ用のチャンネルに投稿する"""
+        if report.attack_count == 0 and report.carry_over_attack_count == 0:
+            return
+        summary_channel = self.bot.get_channel(clan_data.summary_channel_id)
+        if summary_channel is None:
+            return
+        await self._resolve_display_names(clan_data)
+        await summary_channel.send(embed=self._create_daily_report_message(clan_data, report, summary_channel.guild))
+
+    def _create_daily_report_message(
+        self, clan_data: ClanData, report: DailyReport, guild: discord.Guild
+    ) -> discord.Embed:
+        """1日の結果を表示するメッセージを作成する"""
+        description = f"凸数: {report.attack_count}凸 (持ち越し{report.carry_over_attack_count}回)\n"
+        if report.beated_count:
+            description += f"討伐数: {report.beated_count}体 ({report.first_lap}周目～{report.last_lap}周目)"
+        else:
+            description += "討伐数: 0体"
+        report_embed = discord.Embed(
+            title=f"{report.date.strftime('%m月%d日')}の結果",
+            description=description,
+            colour=colour.Colour.orange()
+        )
+        report_embed.add_field(
+            name="ボスごとのダメージ",
+            value="\n".join(
+                f"{ClanBattleData.boss_names[boss_index]}: {count}回 {'{:,}'.format(total_damage)}万"
+                for boss_index, (count, total_damage) in sorted(report.boss_damages.items())
+            ) or "なし",
+            inline=False
+        )
+
+        def user_list_txt(users: List[Tuple[int, int]], unit: str) -> str:
+            txt = ", ".join(
+                f"{self._get_display_name(guild, user_id) or '???'} {count}{unit}" for user_id, count in users
+            )
+            return txt[:1024] or "なし"
+
+        report_embed.add_field(name="残凸", value=user_list_txt(report.missed_attacks, "凸"), inline=False)
+        report_embed.add_field(
+            name="使わなかった持ち越し", value=user_list_txt(report.wasted_carry_overs, "個"), inline=False)
+        return report_embed
 
     async def _load_gss_data(self, clan_data: ClanData, day: int):
-        """参戦時間を管理するスプレッドシートを読み込む"""
+        """参戦時間を管理するスプレッドシートを読み込む
+
+        前回から追加された回答だけを読み込み、指定した日の参戦可能時間を反映する
+        """
         if not clan_data.form_data.sheet_url:
             return
 
-        ws_titles = await get_worksheet_list(clan_data.form_data.sheet_url)
-        candidate_words = ["フォームの回答 1", "第 1 张表单回复", "フォームの回答"]
-        for candidate_word in candidate_words:
-            if candidate_word in ws_titles:
-                sheet_data = await get_sheet_values(
-                    clan_data.form_data.sheet_url,
-                    candidate_word
-                )
-                for row in sheet_data[1:]:
-                    player_data = clan_data.player_data_dict.get(int(row[2]))
-                    if player_data:
-                        player_data.raw_limit_time_text = row[2+day]
+        await self.form_sync.sync(clan_data)
+        if (availability := clan_data.availability.get(day)) is None:
+            return
+        clan_data.availability_day = day
+        for player_data in clan_data.player_data_dict.values():
+            player_data.set_limit_time(availability.get(player_data.user_id))
+
+    async def _on_form_synced(self, clan_data: ClanData, updated_user_ids: Set[int]) -> None:
+        """バックグラウンドで同期した回答を表示に反映する"""
+        day = clan_data.availability_day or ClanBattleData.get_day(datetime.now(JST))
+        if (availability := clan_data.availability.get(day)) is None:
+            return
+        updated = False
+        for user_id in updated_user_ids:
+            if player_data := clan_data.player_data_dict.get(user_id):
+                player_data.set_limit_time(availability.get(user_id))
+                updated = True
+        if updated:
+            await self._update_remain_attack_message(clan_data)
 
     @commands.Cog.listener()
-    async def on_message(self, message: discord.Message):
-        """凸のダメージを登録する"""
-        if not self.ready:
+    async def on_message(self, message: discord.Message, replay: bool = False):
+        """凸のダメージを登録する (テキストでダメージを入力する設定の場合のみ)"""
+        if not LEGACY_DAMAGE_MESSAGE:
             return
         if message.author.id == self.bot.user.id:
             return
+        # 再生中のイベントが応答を待っていることがあるため、応答は準備中でも先に渡す
+        if self.prompts.dispatch_message(message):
+            return
+        if not replay and self._defer_until_ready(self.on_message, message):
+            return
 
         if message.channel.category is None:
             return
@@ -986,32 +1899,22 @@ class ClanBattle(commands.Cog):
         player_data = clan_data.player_data_dict.get(message.author.id)
         if not player_data:
             return
+        self._remember_member(clan_data, message.author)
 
-        damage_data = get_damage(message.content)
-        if damage_data is None:
+        if not message.content.strip() or (damage_data := get_damage(message.content)) is None:
             return
 
-        # 凸宣言をしている直近の周でダメージを登録している
-        lap_list = list(clan_data.progress_message_ids.keys())
-        lap_list.sort(reverse=True)
-    
-        for lap in lap_list:
-            boss_status_data = clan_data.boss_status_data[lap][boss_index]
-            if (attack_status_index := boss_status_data.get_attack_status_index(
-                    player_data, False)) is not None:
-                attack_status = boss_status_data.attack_players[attack_status_index]
-                attack_status.damage = damage_data[0]
-                attack_status.memo = damage_data[1]
-                await self._update_progress_message(clan_data, lap, boss_index)
-                SQLiteUtil.update_attackstatus(clan_data, lap, boss_index, attack_status)
-                return
+        await self._register_damage(clan_data, player_data, boss_index, damage_data[0], damage_data[1])
 
     @commands.Cog.listener()
-    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
-        if not self.ready:
-            return
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent, replay: bool = False):
         if payload.user_id == self.bot.user.id:
             return
+        # 再生中のイベントが応答を待っていることがあるため、応答は準備中でも先に渡す
+        if self.prompts.dispatch_reaction(payload):
+            return
+        if not replay and self._defer_until_ready(self.on_raw_reaction_add, payload):
+            return
         
         channel = self.bot.get_channel(payload.channel_id)
 
@@ -1043,12 +1946,54 @@ class ClanBattle(commands.Cog):
 
         if player_data is None:
             return
+        # 再接続時に再送されたイベントや連打されたリアクションは、データの更新やAPIの呼び出しの前に捨てる
+        key = (payload.message_id, payload.user_id, str(payload.emoji))
+        if not self.reaction_dedupe.check(key):
+            return
+        try:
+            if not self.reaction_limiter.acquire((payload.user_id, category_channel_id)):
+                # リアクションが残っていると押しなおせないため、ゆっくり外しておく
+                self._remove_dropped_reaction(channel, payload)
+                return
+            await self._handle_reaction_add(payload, channel, clan_data, player_data, boss_index, lap, reserve_flag)
+        finally:
+            self.reaction_dedupe.done(key)
+
+    def _remove_dropped_reaction(self, channel: TextChannel, payload: discord.RawReactionActionEvent) -> None:
+        """無視したリアクションを、他の処理を邪魔しない間隔でバックグラウンドで外す"""
+        key = (payload.message_id, payload.user_id, str(payload.emoji))
+        if key in self.pending_reaction_removals:
+            return
+        self.pending_reaction_removals.add(key)
+
+        async def remove():
+            try:
+                await self.reaction_remove_limiter.wait()
+                await channel.get_partial_message(payload.message_id).remove_reaction(
+                    payload.emoji, discord.Object(payload.user_id))
+            except (discord.NotFound, discord.Forbidden):
+                pass
+            finally:
+                self.pending_reaction_removals.discard(key)
+        self._run_in_background(remove())
+
+    async def _handle_reaction_add(
+        self, payload: discord.RawReactionActionEvent,
+        channel: TextChannel,
+        clan_data: ClanData,
+        player_data: PlayerData,
+        boss_index: int,
+        lap: int,
+        reserve_flag: bool
+    ) -> None:
+        """進行用・予約用のメッセージに付けられたリアクションを処理する"""
+        self._remember_member(clan_data, payload.member)
 
         async def remove_reaction():
             message = await channel.fetch_message(payload.message_id)
             await message.remove_reaction(payload.emoji, user)
 
-        user = self.bot.get_user(payload.user_id)
+        user = payload.member or self.bot.get_user(payload.user_id)
         attack_type = ATTACK_TYPE_DICT.get(str(payload.emoji))
         if attack_type:
             await self._check_date_update(clan_data)
@@ -1095,7 +2040,7 @@ class ClanBattle(commands.Cog):
                 if len(user_reserve_data_list) > 1:
                     command_channel = self.bot.get_channel(clan_data.command_channel_id)
                     user_selected_index = await select_from_list(
-                        self.bot, command_channel, user, [rd[1] for rd in user_reserve_data_list],
+                        self.prompts, command_channel, user, [rd[1] for rd in user_reserve_data_list],
                         f"{user.mention} 予約が複数あります。以下から削除をしたい予約を選んでください。"
                     )
                     if user_selected_index is None:
@@ -1117,14 +2062,14 @@ class ClanBattle(commands.Cog):
                 if len(user_reserve_data_list) > 1:
                     command_channel = self.bot.get_channel(clan_data.command_channel_id)
                     user_selected_index = await select_from_list(
-                        self.bot, command_channel, user, user_reserve_data_list,
+                        self.prompts, command_channel, user, user_reserve_data_list,
                         f"{user.mention} 予約が複数あります。以下から予約設定をしたい予約を選んでください。"
                     )
                     if user_selected_index is None:
                         return await remove_reaction()
                     else:
                         reserve_index = user_selected_index
-                reserve_info = await self._get_reserve_info(clan_data, player_data, user)
+                reserve_info = await self._get_reserve_info(clan_data, player_data, user, boss_index)
                 if reserve_info:
                     reserve_data = user_reserve_data_list[reserve_index]
                     reserve_data.set_reserve_info(reserve_info)
@@ -1148,9 +2093,9 @@ class ClanBattle(commands.Cog):
             return await remove_reaction()
 
     @commands.Cog.listener("on_raw_reaction_add")
-    async def set_task_kill(self, payload: discord.RawReactionActionEvent):
+    async def set_task_kill(self, payload: discord.RawReactionActionEvent, replay: bool = False):
         """タスキルをした場合の設定を行う"""
-        if not self.ready:
+        if not replay and self._defer_until_ready(self.set_task_kill, payload):
             return
         if payload.user_id == self.bot.user.id:
             return
@@ -1173,14 +2118,15 @@ class ClanBattle(commands.Cog):
             return
 
         if player_data := clan_data.player_data_dict.get(payload.user_id):
+            self._remember_member(clan_data, payload.member)
             player_data.task_kill = True
             await self._update_remain_attack_message(clan_data)
             SQLiteUtil.update_playerdata(clan_data, player_data)
 
     @commands.Cog.listener("on_raw_reaction_remove")
-    async def unset_task_kill(self, payload: discord.RawReactionActionEvent):
+    async def unset_task_kill(self, payload: discord.RawReactionActionEvent, replay: bool = False):
         """タスキルをした場合の設定を行う"""
-        if not self.ready:
+        if not replay and self._defer_until_ready(self.unset_task_kill, payload):
             return
         if payload.user_id == self.bot.user.id:
             return
@@ -1209,7 +2155,7 @@ class ClanBattle(commands.Cog):
 
     async def check_command_arguments(
         self, interaction: discord.Interaction,
-        member: Optional[discord.User],
+        member: Optional[str],
         lap: Optional[int] = None,
         boss_number: Optional[int] = None
     ) -> Optional[Tuple[ClanData, Optional[PlayerData], int, int]]:
@@ -1239,10 +2185,11 @@ class ClanBattle(commands.Cog):
             return
 
         if member:
-            player_data = clan_data.player_data_dict.get(member.id)
-            if not player_data:
-                await interaction.response.send_message(f"{member.display_name}は凸管理対象ではありません。")
+            user_id = self.member_indexes.get(clan_data).find(member)
+            if user_id is None:
+                await interaction.response.send_message(f"{member}は凸管理対象ではありません。候補から選択してください。")
                 return
+            player_data = clan_data.player_data_dict[user_id]
         else:
             player_data = None
 
@@ -4,7 +4,9 @@ from logging import getLogger
 
 import discord
 from discord.ext import commands
-from setup import TOKEN
+
+from cogs.cbutil.http_client import http_client
+from setup import LEGACY_DAMAGE_MESSAGE, MEMBERS_INTENT, TOKEN
 from discord import app_commands
 
 logging.config.fileConfig('logging.conf')
@@ -20,6 +22,7 @@ class MyBot(commands.Bot):
         super().__init__(command_prefix, intents=intents, help_command=None)
 
     async def setup_hook(self):
+        await http_client.start()
         for cog in INITIAL_EXTENSIONS:
             try:
                 await self.load_extension(cog)
@@ -27,13 +30,23 @@ class MyBot(commands.Bot):
                 traceback.print_exc()
         await self.tree.sync()
 
+    async def close(self):
+        await super().close()
+        await http_client.close()
+
     async def on_ready(self):
         logger.info("Login was successful.")
         logger.info(f"bot name: {self.user.name}")
         logger.info(f"bot id: {self.user.id}")
 
 async def main():
-    intents = discord.Intents(messages=True, guilds=True, members=True, reactions=True)
+    # membersインテントは設定 (MEMBERS_INTENT) で有効にした場合のみ使う
+    # 表示名は凸管理対象のメンバーのみキャッシュする(cogs/cbutil/name_cache.py)
+    # ダメージはボタンから入力するため、メッセージの内容は読まない
+    intents = discord.Intents(guilds=True, reactions=True, members=MEMBERS_INTENT)
+    if LEGACY_DAMAGE_MESSAGE:
+        intents.messages = True
+        intents.message_content = True
     bot = MyBot('.', intents)
     await bot.start(TOKEN)
 
@@ -35,3 +35,13 @@ BASE_URL = ""
 CREATE_FORM_API = ""
 GOOGLE_JSON_PATH = ""
 TREASURE_CHEST = "https://cdn.discordapp.com/attachments/845661889161068559/876325765434712144/unknown.png"
+
+# Trueにすると、ボスのチャンネルに送信したテキストからもダメージを登録する (message_contentインテントが必要)
+LEGACY_DAMAGE_MESSAGE = False
+
+# Trueにすると、サーバーの全メンバーを取得して /add role: や /sync_role でロールの全メンバーを追加できる
+# (membersインテントが必要。大きなサーバーでは起動が遅くなりメモリも多く使う)
+MEMBERS_INTENT = False
+
+# 残りHPが最大HPのこの割合以下になったら、次の周回の進行用メッセージを前もって送信しておく
+PRESTAGE_HP_RATE = 0.3
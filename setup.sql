@@ -1,4 +1,4 @@
-create table ClanData (
+create table if not exists ClanData (
     guild_id int,
     category_id int,
     boss1_channel_id int,
@@ -18,7 +18,7 @@ create table ClanData (
     summary_channel_id int,
     day date
 );
-create table PlayerData (
+create table if not exists PlayerData (
     category_id int,
     user_id int,
     physics_attack int default 0,
@@ -26,7 +26,7 @@ create table PlayerData (
     task_kill boolean
 );
 
-create table ReserveData (
+create table if not exists ReserveData (
     category_id int,
     boss_index int,
     user_id int,
@@ -36,7 +36,7 @@ create table ReserveData (
     carry_over boolean
 );
 
-create table AttackStatus (
+create table if not exists AttackStatus (
     category_id int,
     user_id int,
     lap int,
@@ -49,14 +49,14 @@ create table AttackStatus (
     created datetime
 );
 
-create table BossStatusData (
+create table if not exists BossStatusData (
     category_id int,
     boss_index int,
     lap int,
     beated boolean
 );
 
-create table CarryOver (
+create table if not exists CarryOver (
     category_id int,
     user_id int,
     boss_index int,
@@ -65,7 +65,7 @@ create table CarryOver (
     created datetime
 );
 
-create table FormData (
+create table if not exists FormData (
     category_id int,
     form_url varchar,
     sheet_url varchar,
@@ -74,7 +74,7 @@ create table FormData (
     created datetime
 );
 
-create table ProgressMessageIdData (
+create table if not exists ProgressMessageIdData (
     category_id int,
     lap int,
     boss1 int,
@@ -84,12 +84,42 @@ create table ProgressMessageIdData (
     boss5 int
 );
 
-create table SummaryMessageIdData (
+create table if not exists SummaryMessageIdData (
     category_id int,
     lap int,
-    boss1 int,
-    boss2 int,
-    boss3 int,
-    boss4 int,
-    boss5 int
+    message_id int
+);
+
+create table if not exists DisplayNameData (
+    guild_id int,
+    user_id int,
+    display_name varchar,
+    updated datetime
 );
+create unique index if not exists DisplayNameDataIndex on DisplayNameData (guild_id, user_id);
+
+create table if not exists HpProfileData (
+    category_id int,
+    profile varchar,
+    updated datetime
+);
+create unique index if not exists HpProfileDataIndex on HpProfileData (category_id);
+
+create table if not exists DamageStats (
+    category_id int,
+    user_id int,
+    boss_index int,
+    tier int,
+    count int,
+    total int,
+    total_sq int,
+    min_damage int,
+    max_damage int
+);
+create unique index if not exists DamageStatsIndex on DamageStats (category_id, user_id, boss_index, tier);
+
+create index if not exists AttackStatusCreatedIndex on AttackStatus (category_id, created);
+create index if not exists AttackStatusBossIndex on AttackStatus (category_id, lap, boss_index);
+create index if not exists BossStatusDataIndex on BossStatusData (category_id, beated, lap);
+create index if not exists CarryOverIndex on CarryOver (category_id, user_id);
+create index if not exists PlayerDataIndex on PlayerData (category_id, user_id);
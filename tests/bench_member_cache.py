@@ -0,0 +1,72 @@
+"""membersインテントで全メンバーをキャッシュする場合と、表示名キャッシュの場合の比較
+
+実行方法: python -m tests.bench_member_cache
+ギルドの全メンバーを受け取ったときと同じようにdiscord.Guildを作り、構築にかかる時間とメモリを測る。
+Discordとの通信 (メンバーのチャンク要求の待ち時間) は含まない。時間はtracemallocで計測しているため実際より遅い。
+"""
+import time
+import tracemalloc
+from unittest.mock import MagicMock
+
+import discord
+from discord.state import ConnectionState
+
+from cogs.cbutil.name_cache import NameCache
+
+MEMBER_COUNTS = [1000, 10000, 100000]
+MANAGED_PLAYER_COUNT = 30  # 1クランの人数
+
+
+def create_member_payload(i: int) -> dict:
+    return {
+        "user": {
+            "id": str(10 ** 17 + i), "username": f"user{i}", "discriminator": "0",
+            "avatar": None, "global_name": f"ユーザー{i}"
+        },
+        "nick": None, "roles": [], "joined_at": "2024-01-01T00:00:00+00:00",
+        "deaf": False, "mute": False, "flags": 0
+    }
+
+
+def measure(func):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, current
+
+
+def bench_member_cache(member_count: int):
+    intents = discord.Intents(guilds=True, members=True)
+    state = ConnectionState(
+        dispatch=lambda *args: None, handlers={}, hooks={}, http=MagicMock(), intents=intents,
+        member_cache_flags=discord.MemberCacheFlags.from_intents(intents))
+    state.user = MagicMock(id=1)
+    payload = {
+        "id": "5", "name": "guild", "members": [create_member_payload(i) for i in range(member_count)],
+        "member_count": member_count, "roles": [], "channels": [], "emojis": [], "stickers": [], "features": []
+    }
+    return measure(lambda: discord.Guild(data=payload, state=state))
+
+
+def bench_name_cache(player_count: int):
+    def build():
+        name_cache = NameCache()
+        for i in range(player_count):
+            name_cache.display_names[(5, 10 ** 17 + i)] = f"ユーザー{i}"
+        return name_cache
+    return measure(build)
+
+
+def main():
+    for member_count in MEMBER_COUNTS:
+        _, elapsed, current = bench_member_cache(member_count)
+        print(f"members intent: {member_count} members, {elapsed:.2f}s, {current / 1024 / 1024:.1f} MiB")
+    _, elapsed, current = bench_name_cache(MANAGED_PLAYER_COUNT)
+    print(f"name cache: {MANAGED_PLAYER_COUNT} players, {elapsed * 1000:.2f}ms, {current / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
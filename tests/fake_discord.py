@@ -0,0 +1,120 @@
+"""APIの呼び出しを数えて一定の遅延を入れる、Discordの代わりのオブジェクト
+
+実際の通信の代わりに呼び出しごとに FAKE_LATENCY 秒待つため、
+並行に実行できているかどうかを経過時間で確かめられる。
+"""
+import asyncio
+import itertools
+from collections import Counter
+from typing import Dict, List, Optional
+from unittest.mock import AsyncMock, MagicMock
+
+FAKE_LATENCY = 0.02  # APIの呼び出し1回あたりの秒数
+
+
+class FakeApi():
+    def __init__(self, latency: float = FAKE_LATENCY) -> None:
+        self.latency = latency
+        self.counts: Counter = Counter()
+        self.ids = itertools.count(1000)
+
+    async def call(self, name: str) -> None:
+        self.counts[name] += 1
+        await asyncio.sleep(self.latency)
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+
+class FakeMessage():
+    def __init__(self, api: FakeApi, channel: "FakeChannel") -> None:
+        self.api = api
+        self.id = next(api.ids)
+        self.channel = channel
+        self.reactions: List[str] = []
+
+    async def add_reaction(self, emoji: str) -> None:
+        await self.api.call("add_reaction")
+        self.reactions.append(emoji)
+
+    async def edit(self, **kwargs) -> None:
+        await self.api.call("edit")
+
+    async def delete(self) -> None:
+        await self.api.call("delete")
+
+
+class FakeChannel():
+    def __init__(self, api: FakeApi, bot: "FakeBot", guild: "FakeGuild", name: str, position: int = 0) -> None:
+        self.api = api
+        self.id = next(api.ids)
+        self.guild = guild
+        self.name = name
+        self.position = position
+        self.messages: List[FakeMessage] = []
+        bot.channels[self.id] = self
+
+    async def send(self, **kwargs) -> FakeMessage:
+        await self.api.call("send")
+        message = FakeMessage(self.api, self)
+        self.messages.append(message)
+        return message
+
+    async def purge(self, limit: int = 100) -> List[FakeMessage]:
+        await self.api.call("purge")
+        deleted, self.messages = self.messages[:limit], self.messages[limit:]
+        return deleted
+
+
+class FakeCategory():
+    def __init__(self, api: FakeApi, bot: "FakeBot", guild: "FakeGuild", name: str) -> None:
+        self.api = api
+        self.bot = bot
+        self.guild = guild
+        self.id = next(api.ids)
+        self.name = name
+
+    async def create_text_channel(self, name: str, position: int = 0) -> FakeChannel:
+        await self.api.call("create_text_channel")
+        return FakeChannel(self.api, self.bot, self.guild, name, position)
+
+
+class FakeGuild():
+    def __init__(self, api: FakeApi, bot: "FakeBot") -> None:
+        self.api = api
+        self.bot = bot
+        self.id = next(api.ids)
+        self.name = "fake guild"
+
+    async def create_category(self, name: str) -> FakeCategory:
+        await self.api.call("create_category")
+        return FakeCategory(self.api, self.bot, self, name)
+
+    def get_member(self, user_id: int) -> None:
+        return None
+
+
+class FakeBot():
+    def __init__(self, api: FakeApi) -> None:
+        self.api = api
+        self.channels: Dict[int, FakeChannel] = {}
+        self.guild = FakeGuild(api, self)
+        self.user = MagicMock(id=1)
+
+    def get_channel(self, channel_id: int) -> Optional[FakeChannel]:
+        return self.channels.get(channel_id)
+
+    def get_guild(self, guild_id: int) -> Optional[FakeGuild]:
+        return self.guild if guild_id == self.guild.id else None
+
+    def add_view(self, view) -> None:
+        pass
+
+
+def create_interaction(bot: FakeBot) -> MagicMock:
+    interaction = MagicMock()
+    interaction.guild = bot.guild
+    interaction.guild_id = bot.guild.id
+    interaction.followup.send = AsyncMock()
+    return interaction
@@ -0,0 +1,95 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import discord.ext.commands  # noqa: F401  cogsより先に読み込む必要がある
+
+from cogs.clan_battle import ClanBattle
+
+
+def create_cog() -> ClanBattle:
+    bot = MagicMock()
+    bot.user.id = 1
+    return ClanBattle(bot)
+
+
+def create_payload(user_id: int) -> MagicMock:
+    payload = MagicMock()
+    payload.user_id = user_id
+    payload.emoji = "👍"
+    return payload
+
+
+def test_events_before_ready_are_replayed_once():
+    async def run():
+        cog = create_cog()
+        await cog.set_task_kill(create_payload(1))
+        await cog.unset_task_kill(create_payload(2))
+        assert len(cog.pending_events) == 2
+        replayed_count = await asyncio.wait_for(cog._replay_pending_events(), 3)
+        return cog, replayed_count
+
+    cog, replayed_count = asyncio.run(run())
+    assert replayed_count == 2
+    assert not cog.pending_events
+
+
+def test_events_during_replay_keep_order():
+    async def run():
+        cog = create_cog()
+        handled = []
+
+        async def listener(value, replay=False):
+            if not replay and cog._defer_until_ready(listener, value):
+                return
+            handled.append(value)
+            if value == 1:
+                await listener(99)  # 処理中に届いたイベント
+        for value in range(3):
+            await listener(value)
+        await asyncio.wait_for(cog._replay_pending_events(), 3)
+        return handled
+
+    assert asyncio.run(run()) == [0, 1, 2, 99]
+
+
+def test_pending_events_are_bounded(monkeypatch):
+    monkeypatch.setattr("cogs.clan_battle.PENDING_EVENT_LIMIT", 2)
+
+    async def run():
+        cog = create_cog()
+        for _ in range(3):
+            await cog.unset_task_kill(create_payload(2))
+        return cog
+
+    cog = asyncio.run(run())
+    assert len(cog.pending_events) == 2
+    assert cog.dropped_event_count == 1
+
+
+def test_prompt_reply_reaches_replayed_event():
+    async def run():
+        cog = create_cog()
+        answers = []
+
+        async def open_prompt(payload, replay=False):
+            if not replay and cog._defer_until_ready(open_prompt, payload):
+                return
+            # 予約の選択などと同じく、リアクションでの応答を待つ
+            answers.append(await cog.prompts.wait_reaction(payload.user_id, 100, ["✅"]))
+
+        await open_prompt(create_payload(2))
+        reply = create_payload(2)
+        reply.message_id = 100
+        reply.emoji = "✅"
+
+        async def send_reply():
+            await asyncio.sleep(0.01)
+            await cog.on_raw_reaction_add(reply)
+        reply_task = asyncio.create_task(send_reply())
+        await asyncio.wait_for(cog._replay_pending_events(), 1)
+        await reply_task
+        return cog, answers
+
+    cog, answers = asyncio.run(run())
+    assert answers == ["✅"]
+    assert not cog.pending_events
@@ -0,0 +1,56 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+from cogs.cbutil.damage_view import DamageModal, ReserveDamageView
+
+
+def create_interaction() -> MagicMock:
+    interaction = MagicMock()
+    interaction.response.send_message = AsyncMock()
+    return interaction
+
+
+def submit(damage: str, memo: str):
+    async def run():
+        on_damage = AsyncMock()
+        modal = DamageModal(on_damage)
+        modal.damage._value = damage
+        modal.memo._value = memo
+        interaction = create_interaction()
+        await modal.on_submit(interaction)
+        return on_damage, interaction
+    return asyncio.run(run())
+
+
+def test_modal_merges_memo_in_damage_field():
+    on_damage, _ = submit("1200 60s討伐", "物理")
+    assert on_damage.await_args.args[1:] == (1200, "60s討伐 物理")
+
+
+def test_modal_rejects_non_numeric_damage():
+    on_damage, interaction = submit("たくさん", "")
+    on_damage.assert_not_awaited()
+    interaction.response.send_message.assert_awaited_once()
+
+
+def test_reserve_view_rejects_after_timeout():
+    async def run():
+        view = ReserveDamageView(1)
+        view.stop()  # タイムアウトしたときと同じく終了させる
+        interaction = create_interaction()
+        await view._on_damage(interaction, 1200, "")
+        return view, interaction
+    view, interaction = asyncio.run(run())
+    assert view.result is None
+    assert "期限" in interaction.response.send_message.await_args.args[0]
+
+
+def test_reserve_view_prefills_default_damage():
+    async def run():
+        modal = DamageModal(AsyncMock(), 1234)
+        view = ReserveDamageView(1, 1234)
+        return modal, view
+    modal, view = asyncio.run(run())
+    assert modal.damage.default == "1234"
+    assert view.default_damage == 1234
+    assert DamageModal.damage.default is None  # 他のモーダルには影響しない
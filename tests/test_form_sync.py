@@ -0,0 +1,65 @@
+import asyncio
+from unittest.mock import MagicMock
+
+from cogs.cbutil.form_sync import FormResponseSync
+from cogs.cbutil.gss import LocalSheetBackend, SheetClient
+from cogs.cbutil.util import parse_limit_time_text
+
+SHEET_URL = "https://example.com/sheet"
+SHEET_NAME = "フォームの回答 1"
+
+
+def create_clan_data() -> MagicMock:
+    clan_data = MagicMock()
+    clan_data.category_id = 1
+    clan_data.form_data.sheet_url = SHEET_URL
+    clan_data.availability = {}
+    return clan_data
+
+
+def append_response(backend: LocalSheetBackend, user_id: str, day1: str) -> None:
+    backend.append_row(SHEET_URL, SHEET_NAME, ["2024/01/01", "名前", user_id, day1, "", "", "", ""])
+
+
+def test_sync_reads_only_new_rows():
+    backend = LocalSheetBackend()
+    backend.append_row(SHEET_URL, SHEET_NAME, ["タイムスタンプ", "名前", "Discord Id", "1日目", "2日目", "3日目", "4日目", "5日目"])
+    append_response(backend, "10", "5～6時")
+    append_response(backend, "20", "6～8時")
+    form_sync = FormResponseSync(SheetClient(backend))
+    clan_data = create_clan_data()
+
+    async def run():
+        assert await form_sync.sync(clan_data) == {10, 20}
+        assert await form_sync.sync(clan_data) == set()
+        # 同じメンバーの新しい回答が優先される
+        append_response(backend, "10", "7～9時")
+        append_response(backend, "", "5～6時")
+        assert await form_sync.sync(clan_data) == {10}
+    asyncio.run(run())
+
+    assert form_sync.states[1].last_row == 5
+    assert clan_data.availability[1].get(10) == parse_limit_time_text("7～9時")
+    assert clan_data.availability[1].get(20) == parse_limit_time_text("6～8時")
+
+
+def test_sync_without_response_sheet():
+    backend = LocalSheetBackend()
+    backend.append_row(SHEET_URL, "シート1", ["a"])
+    form_sync = FormResponseSync(SheetClient(backend))
+    assert asyncio.run(form_sync.sync(create_clan_data())) == set()
+
+
+def test_sync_restarts_when_form_is_recreated():
+    backend = LocalSheetBackend()
+    backend.append_row(SHEET_URL, SHEET_NAME, ["見出し"])
+    append_response(backend, "10", "5～6時")
+    backend.sheets["https://example.com/new"] = backend.sheets[SHEET_URL]
+    form_sync = FormResponseSync(SheetClient(backend))
+    clan_data = create_clan_data()
+
+    async def run():
+        await form_sync.sync(clan_data)
+        clan_data.form_data.sheet_url = "https://example.com/new"
+        return await form_sync.sync(clan_data)
+    assert asyncio.run(run()) == {10}
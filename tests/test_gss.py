@@ -0,0 +1,60 @@
+import asyncio
+
+from cogs.cbutil.gss import LocalSheetBackend, SheetClient, column_index, column_letter
+
+SHEET_URL = "https://example.com/sheet"
+
+
+class SlowSheetBackend(LocalSheetBackend):
+    async def batch_get(self, sheet_url, sheet_name, ranges):
+        await asyncio.sleep(0.01)
+        return await super().batch_get(sheet_url, sheet_name, ranges)
+
+
+def create_backend(backend=None) -> LocalSheetBackend:
+    backend = backend or LocalSheetBackend()
+    backend.append_row(SHEET_URL, "回答", ["タイムスタンプ", "名前", "ID"])
+    backend.append_row(SHEET_URL, "回答", ["2024/01/01", "A", "1"])
+    backend.append_row(SHEET_URL, "回答", ["2024/01/02", "", "2"])
+    return backend
+
+
+def test_column_letter():
+    for i in [0, 25, 26, 701, 702]:
+        assert column_index(column_letter(i)) == i
+    assert column_letter(27) == "AB"
+
+
+def test_get_columns_in_one_request():
+    backend = create_backend()
+    client = SheetClient(backend)
+    columns = asyncio.run(client.get_columns(SHEET_URL, "回答", [2, 1]))
+    assert columns == [["1", "A"], ["2", ""]]
+    assert backend.request_count == 1
+
+
+def test_cache_and_invalidate():
+    backend = create_backend()
+    client = SheetClient(backend)
+
+    async def run():
+        await client.get_columns(SHEET_URL, "回答", [1])
+        await client.get_columns(SHEET_URL, "回答", [1])
+        assert backend.request_count == 1
+        await client.get_columns(SHEET_URL, "回答", [1], use_cache=False)
+        assert backend.request_count == 2
+        client.invalidate(SHEET_URL)
+        await client.get_columns(SHEET_URL, "回答", [1])
+        assert backend.request_count == 3
+    asyncio.run(run())
+
+
+def test_concurrent_reads_share_request():
+    backend = create_backend(SlowSheetBackend())
+    client = SheetClient(backend)
+
+    async def run():
+        return await asyncio.gather(*[client.get_columns(SHEET_URL, "回答", [0]) for _ in range(3)])
+    results = asyncio.run(run())
+    assert results[0] == results[1] == results[2]
+    assert backend.request_count == 1
@@ -0,0 +1,64 @@
+import asyncio
+
+import aiohttp
+import pytest
+
+from cogs.cbutil.http_client import HttpClient
+from cogs.cbutil.http_stub import LocalStubServer
+
+
+def run_with_server(server: LocalStubServer, func):
+    async def run():
+        base_url = await server.start()
+        client = HttpClient()
+        try:
+            return await func(client, base_url)
+        finally:
+            await client.close()
+            await server.close()
+    return asyncio.run(run())
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr("cogs.cbutil.http_client.HTTP_BACKOFF_BASE", 0)
+
+
+def test_get_json():
+    server = LocalStubServer({"/data": {"value": 1}})
+    assert run_with_server(server, lambda client, url: client.get_json(url + "data")) == {"value": 1}
+    assert server.request_count == 1
+
+
+def test_retry_on_service_unavailable():
+    server = LocalStubServer({"/data": [1, 2]}, fail_count=2)
+    assert run_with_server(server, lambda client, url: client.get_json(url + "data")) == [1, 2]
+    assert server.request_count == 3
+
+
+def test_no_retry_on_not_found():
+    server = LocalStubServer({})
+    with pytest.raises(aiohttp.ClientResponseError):
+        run_with_server(server, lambda client, url: client.get_json(url + "missing"))
+    assert server.request_count == 1
+
+
+def test_no_retry_when_retries_is_zero():
+    server = LocalStubServer({"/form": {}}, fail_count=1)
+    with pytest.raises(aiohttp.ClientResponseError):
+        run_with_server(server, lambda client, url: client.get_json(url + "form", retries=0))
+    assert server.request_count == 1
+
+
+def test_timeout_without_retry():
+    server = LocalStubServer({"/form": {}}, delay=0.5)
+    with pytest.raises(asyncio.TimeoutError):
+        run_with_server(
+            server, lambda client, url: client.get_json(url + "form", retries=0, timeout=aiohttp.ClientTimeout(total=0.1)))
+    assert server.request_count == 1
+
+
+def test_large_response_is_decoded():
+    data = {"items": list(range(20000))}
+    server = LocalStubServer({"/large": data})
+    assert run_with_server(server, lambda client, url: client.get_json(url + "large")) == data
@@ -0,0 +1,78 @@
+import asyncio
+
+from cogs.cbutil.job_queue import JobQueue
+
+
+def test_guilds_are_served_round_robin():
+    async def run():
+        job_queue = JobQueue(workers=1)
+        order = []
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def block():
+            started.set()
+            await release.wait()
+
+        def record(name):
+            async def func():
+                order.append(name)
+            return func
+
+        # ワーカーを止めている間に登録して、取り出す順番だけを確かめる
+        await job_queue.submit(0, "block", "user", block)
+        await started.wait()
+        for name in ["a1", "a2", "a3"]:
+            await job_queue.submit(1, name, "user", record(name))
+        for name in ["b1", "b2"]:
+            await job_queue.submit(2, name, "user", record(name))
+        release.set()
+        while job_queue.pending_count or job_queue.running:
+            await asyncio.sleep(0.01)
+        job_queue.close()
+        assert order == ["a1", "b1", "a2", "b2", "a3"]
+    asyncio.run(run())
+
+
+def test_one_running_job_per_guild():
+    async def run():
+        job_queue = JobQueue(workers=3)
+        running = {1: 0, 2: 0}
+        max_running = {1: 0, 2: 0}
+
+        def work(guild_id):
+            async def func():
+                running[guild_id] += 1
+                max_running[guild_id] = max(max_running[guild_id], running[guild_id])
+                await asyncio.sleep(0.01)
+                running[guild_id] -= 1
+            return func
+
+        for _ in range(3):
+            await job_queue.submit(1, "job", "user", work(1))
+            await job_queue.submit(2, "job", "user", work(2))
+        while job_queue.pending_count or job_queue.running:
+            await asyncio.sleep(0.01)
+        job_queue.close()
+        assert max_running == {1: 1, 2: 1}
+    asyncio.run(run())
+
+
+def test_submit_is_rejected_over_pending_limit():
+    async def run():
+        job_queue = JobQueue(workers=1, max_pending=2)
+        release = asyncio.Event()
+
+        async def block():
+            await release.wait()
+
+        jobs = [await job_queue.submit(1, "job", "user", block)]
+        await asyncio.sleep(0.01)
+        jobs += [await job_queue.submit(1, "job", "user", block) for _ in range(3)]
+        # 1件目は実行中なので、実行待ちは2件まで
+        assert all(job is not None for job in jobs[:3])
+        assert jobs[3] is None
+        assert [job.job_id for job in job_queue.get_jobs(1)] == [1, 2, 3]
+        release.set()
+        job_queue.close()
+    asyncio.run(run())
@@ -0,0 +1,14 @@
+from unittest.mock import MagicMock
+
+import discord.ext.commands  # noqa: F401  cogsより先に読み込む必要がある
+
+from cogs.clan_battle import ClanBattle
+
+
+def test_staged_message_is_discarded_when_next_lap_exists():
+    cog = ClanBattle(MagicMock())
+    cog.progress_stager = MagicMock()
+    clan_data = MagicMock(category_id=1, progress_message_ids={3: [0, 456, 0, 0, 0]})
+    cog._update_prestage(clan_data, 2, 1)
+    cog.progress_stager.discard.assert_called_once_with((1, 3, 1))
+    cog.progress_stager.stage.assert_not_called()
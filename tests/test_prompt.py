@@ -0,0 +1,59 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+
+from cogs.cbutil.prompt import PromptRegistry
+
+
+def create_message(user_id: int, channel_id: int, content: str) -> MagicMock:
+    message = MagicMock(content=content)
+    message.author.id = user_id
+    message.channel.id = channel_id
+    return message
+
+
+def test_message_is_dispatched_when_check_passes():
+    async def run():
+        prompts = PromptRegistry()
+        future = prompts.wait_message(1, 10, check=lambda m: m.content.isdigit())
+        assert not prompts.dispatch_message(create_message(1, 10, "abc"))
+        assert not prompts.dispatch_message(create_message(2, 10, "600"))
+        message = create_message(1, 10, "600")
+        assert prompts.dispatch_message(message)
+        assert await future is message
+        # 応答済みのプロンプトは完了時のコールバックで取り除かれる
+        await asyncio.sleep(0)
+        assert not prompts.prompts
+        prompts.close()
+    asyncio.run(run())
+
+
+def test_prompt_expires():
+    async def run():
+        prompts = PromptRegistry()
+        slow = prompts.wait_reaction(1, 100, ["a"], timeout=1.0)
+        fast = prompts.wait_reaction(1, 101, ["a"], timeout=0.01)
+        with pytest.raises(asyncio.TimeoutError):
+            await fast
+        # 期限の遠いプロンプトはまだ待っている
+        assert not slow.done()
+        payload = MagicMock(user_id=1, message_id=100, emoji="a")
+        assert prompts.dispatch_reaction(payload)
+        assert await slow == "a"
+        prompts.close()
+    asyncio.run(run())
+
+
+def test_new_prompt_replaces_old_one():
+    async def run():
+        prompts = PromptRegistry()
+        old = prompts.wait_message(1, 10)
+        new = prompts.wait_message(1, 10)
+        with pytest.raises(asyncio.TimeoutError):
+            await old
+        message = create_message(1, 10, "600")
+        assert prompts.dispatch_message(message)
+        assert await new is message
+        prompts.close()
+    asyncio.run(run())
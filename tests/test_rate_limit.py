@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+import pytest
+
+from cogs.cbutil import rate_limit
+from cogs.cbutil.rate_limit import DedupeCache, RateLimiter, TokenBucket
+
+
+class FakeClock():
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+
+def test_token_bucket_burst_and_refill(clock):
+    bucket = TokenBucket(rate=1, capacity=3)
+    assert [bucket.acquire("a") for _ in range(4)] == [True, True, True, False]
+    assert bucket.suppressed == 1
+    # 他のキーには影響しない
+    assert bucket.acquire("b")
+    clock.now += 1
+    assert bucket.acquire("a")
+    assert not bucket.acquire("a")
+    clock.now += 10
+    assert [bucket.acquire("a") for _ in range(4)] == [True, True, True, False]
+
+
+def test_token_bucket_prunes_full_buckets(clock, monkeypatch):
+    monkeypatch.setattr(rate_limit, "BUCKET_PRUNE_SIZE", 10)
+    bucket = TokenBucket(rate=1, capacity=2)
+    for key in range(10):
+        bucket.acquire(key)
+    clock.now += 5
+    bucket.acquire("new")
+    assert list(bucket.buckets) == ["new"]
+
+
+def test_dedupe_cache_suppresses_only_in_flight():
+    cache = DedupeCache()
+    assert cache.check(("message", 1, "⚔️"))
+    assert not cache.check(("message", 1, "⚔️"))
+    assert cache.check(("message", 2, "⚔️"))
+    cache.done(("message", 1, "⚔️"))
+    # 処理が終わった後の同じリアクションは受け付ける
+    assert cache.check(("message", 1, "⚔️"))
+    assert cache.suppressed == 1
+
+
+def test_rate_limiter_spaces_starts():
+    async def run():
+        limiter = RateLimiter(50)
+        started = time.monotonic()
+        for _ in range(3):
+            await limiter.wait()
+        return time.monotonic() - started
+    assert asyncio.run(run()) >= 0.035
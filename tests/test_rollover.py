@@ -0,0 +1,40 @@
+import asyncio
+from datetime import date
+from unittest.mock import AsyncMock, MagicMock
+
+import discord.ext.commands  # noqa: F401  cogsより先に読み込む必要がある
+
+from cogs.cbutil import sqlite_util
+from cogs.clan_battle import ClanBattle
+
+
+def test_concurrent_check_waits_for_rollover(monkeypatch):
+    monkeypatch.setattr(sqlite_util.SQLiteUtil, "load_daily_report", MagicMock())
+    monkeypatch.setattr(sqlite_util.SQLiteUtil, "update_clandata", MagicMock())
+
+    async def run():
+        cog = ClanBattle(MagicMock())
+        cog._run_in_background = MagicMock(side_effect=lambda coro: coro.close())
+        cog._initialize_reserve_message = AsyncMock()
+        cog._initialize_remain_attack_message = AsyncMock()
+        initialized = asyncio.Event()
+        release = asyncio.Event()
+
+        async def initialize_clandata(clan_data):
+            initialized.set()
+            await release.wait()
+        cog.initialize_clandata = initialize_clandata
+        clan_data = MagicMock(category_id=1, date=date(2000, 1, 1))
+
+        first = asyncio.create_task(cog._check_date_update(clan_data))
+        await initialized.wait()
+        second = asyncio.create_task(cog._check_date_update(clan_data))
+        await asyncio.sleep(0.01)
+        # 初期化中は日付が変わらず、後から来た呼び出しも完了を待つ
+        assert clan_data.date == date(2000, 1, 1)
+        assert not second.done()
+        release.set()
+        await asyncio.gather(first, second)
+        assert clan_data.date != date(2000, 1, 1)
+        sqlite_util.SQLiteUtil.update_clandata.assert_called_once_with(clan_data)
+    asyncio.run(run())
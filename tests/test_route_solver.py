@@ -0,0 +1,53 @@
+from unittest.mock import MagicMock
+
+from cogs.cbutil.finishing_blow import plan_finishing_blow
+from cogs.cbutil.player_data import PlayerData
+from cogs.cbutil.route_solver import solve_route
+
+
+def create_clan_data(boss_hp: int, damages: list) -> MagicMock:
+    clan_data = MagicMock()
+    hp_profile = clan_data.get_hp_profile.return_value
+    hp_profile.get_tier.return_value = 0
+    hp_profile.get_hp.return_value = 10 ** 9
+    clan_data.get_boss_progress.return_value = [(1, boss_hp, set())] + [(1, 10 ** 9, set())] * 4
+    clan_data.player_data_dict = {}
+    reserve_list = []
+    for user_id, damage in enumerate(damages, 1):
+        player_data = PlayerData(user_id)
+        player_data.physics_attack = 2  # 残り1凸
+        clan_data.player_data_dict[user_id] = player_data
+        reserve_data = MagicMock(player_data=player_data, damage=damage, carry_over=False)
+        reserve_list.append(reserve_data)
+    clan_data.reserve_list = [reserve_list, [], [], [], []]
+    return clan_data
+
+
+def test_exact_hp_is_beaten():
+    steps, _ = solve_route(create_clan_data(1200, [600, 600]))
+    assert steps[0].beated
+    assert [damage for _, damage in steps[0].attacks] == [600, 600]
+    assert steps[0].carry_over_time > 0
+
+
+
+def test_exact_kill_is_planned():
+    plan = plan_finishing_blow(1200, [600, 600])
+    assert plan.order == [1, 0]
+    assert plan.remain_hp == 600
+    assert plan.carry_over_time == 20
+
+
+def test_finisher_keeps_longest_carry_over():
+    plan = plan_finishing_blow(1000, [300, 800, 500])
+    assert plan.order == [2, 0, 1]
+    assert plan.remain_hp == 200
+    assert plan.carry_over_time == 88
+
+
+def test_unbeatable_boss_is_only_damaged():
+    steps, remaining = solve_route(create_clan_data(2000, [300, 800, 500]))
+    assert len(steps) == 1
+    assert not steps[0].beated
+    assert [damage for _, damage in steps[0].attacks] == [800, 500, 300]
+    assert remaining == []
@@ -0,0 +1,77 @@
+"""偽のDiscordで /setup の処理を実行して、経過時間とAPIの呼び出し回数を確かめる
+
+python -m pytest -s tests/test_setup_timing.py で結果を表示する
+"""
+import asyncio
+import time
+from collections import defaultdict
+
+import discord.ext.commands  # noqa: F401  cogsより先に読み込む必要がある
+import pytest
+
+from cogs.cbutil import sqlite_util
+from cogs.cbutil.sqlite_util import SQLiteUtil
+from cogs.clan_battle import ClanBattle
+from tests.fake_discord import FakeApi, FakeBot, create_interaction
+
+
+@pytest.fixture(autouse=True)
+def database(tmp_path, monkeypatch):
+    monkeypatch.setattr(sqlite_util, "DB_NAME", str(tmp_path / "test.db"))
+    SQLiteUtil.setup_database()
+
+
+def create_cog(api: FakeApi) -> ClanBattle:
+    bot = FakeBot(api)
+    cog = ClanBattle(bot)
+    cog.clan_data = defaultdict(lambda: None)
+    return cog
+
+
+def test_setup_job():
+    api = FakeApi()
+    cog = create_cog(api)
+    interaction = create_interaction(cog.bot)
+
+    async def run():
+        started = time.perf_counter()
+        await cog._setup_job(interaction, "クランバトル")
+        elapsed = time.perf_counter() - started
+        cog.summary_updater.close()
+        return elapsed
+    elapsed = asyncio.run(run())
+
+    sequential = api.total * api.latency
+    print(f"\nsetup: {elapsed:.2f}s (sequential: {sequential:.2f}s), calls: {dict(api.counts)}")
+    interaction.followup.send.assert_awaited_with("セットアップが完了しました")
+    assert api.counts["create_category"] == 1
+    assert api.counts["create_text_channel"] == 9
+    # 進行用5件、まとめ1件、予約5件、残凸1件
+    assert api.counts["send"] == 12
+    # 進行用6個×5件、予約4個×5件、残凸1個
+    assert api.counts["add_reaction"] == 51
+    assert api.counts["purge"] == 1
+    assert elapsed < sequential / 2
+
+
+def test_initialize_progress_messages():
+    api = FakeApi()
+    cog = create_cog(api)
+
+    async def run():
+        await cog._setup_job(create_interaction(cog.bot), "クランバトル")
+        clan_data = next(iter(cog.clan_data.values()))
+        api.counts.clear()
+        started = time.perf_counter()
+        await cog._initialize_progress_messages(clan_data, 2)
+        elapsed = time.perf_counter() - started
+        cog.summary_updater.close()
+        return clan_data, elapsed
+    clan_data, elapsed = asyncio.run(run())
+
+    sequential = api.total * api.latency
+    print(f"\nprogress messages: {elapsed:.2f}s (sequential: {sequential:.2f}s), calls: {dict(api.counts)}")
+    assert all(clan_data.progress_message_ids[2])
+    assert clan_data.summary_message_ids[2]
+    assert api.counts["send"] == 6
+    assert elapsed < sequential / 2
@@ -0,0 +1,45 @@
+import sqlite3
+
+import pytest
+
+from cogs.cbutil import sqlite_util
+from cogs.cbutil.sqlite_util import SQLiteUtil
+
+OLD_SUMMARY_TABLE = """create table SummaryMessageIdData (
+    category_id int, lap int, boss1 int, boss2 int, boss3 int, boss4 int, boss5 int
+)"""
+
+
+@pytest.fixture
+def old_database(tmp_path, monkeypatch):
+    db_name = str(tmp_path / "test.db")
+    monkeypatch.setattr(sqlite_util, "DB_NAME", db_name)
+    con = sqlite3.connect(db_name)
+    con.execute(OLD_SUMMARY_TABLE)
+    con.execute("insert into SummaryMessageIdData values (1, 3, 11, 12, 13, 14, 15)")
+    con.commit()
+    con.close()
+    return db_name
+
+
+def test_migrate_summary_message_data(old_database):
+    assert sorted(SQLiteUtil.setup_database()) == [(1, 12), (1, 13), (1, 14), (1, 15)]
+    con = sqlite3.connect(old_database)
+    assert con.execute("select * from SummaryMessageIdData").fetchall() == [(1, 3, 11)]
+    con.close()
+    # 変換済みであれば何もしない
+    assert SQLiteUtil.setup_database() == []
+
+
+def test_failed_migration_is_rolled_back(old_database, monkeypatch):
+    monkeypatch.setattr(
+        sqlite_util, "MIGRATE_SUMMARY_MESSAGE_DATA",
+        sqlite_util.MIGRATE_SUMMARY_MESSAGE_DATA.replace("alter table", "alter tabel"))
+    with pytest.raises(sqlite3.Error):
+        SQLiteUtil.setup_database()
+    con = sqlite3.connect(old_database)
+    columns = [row[1] for row in con.execute("pragma table_info(SummaryMessageIdData)")]
+    tables = [row[0] for row in con.execute("select name from sqlite_master where type='table'")]
+    con.close()
+    assert "boss5" in columns
+    assert "SummaryMessageIdDataNew" not in tables
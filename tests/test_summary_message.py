@@ -0,0 +1,41 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import discord.ext.commands  # noqa: F401  cogsより先に読み込む必要がある
+
+from cogs.cbutil import sqlite_util
+from cogs.cbutil.summary_board import CoalescedUpdater
+from cogs.clan_battle import ClanBattle
+
+
+def test_update_during_send_is_applied(monkeypatch):
+    monkeypatch.setattr(sqlite_util.SQLiteUtil, "register_summary_message_id", lambda clan_data, lap: None)
+
+    async def run():
+        bot = MagicMock()
+        cog = ClanBattle(bot)
+        cog.summary_updater = CoalescedUpdater(delay=0)
+        cog._create_summary_embeds = MagicMock(return_value=[])
+        clan_data = MagicMock(category_id=1, summary_message_ids={})
+        channel = bot.get_channel.return_value
+        sent = asyncio.Event()
+
+        async def send(**kwargs):
+            await sent.wait()
+            return MagicMock(id=123)
+        channel.send = send
+        edit = channel.get_partial_message.return_value.edit = AsyncMock()
+
+        send_task = asyncio.create_task(cog._send_summary_message(clan_data, 3, MagicMock()))
+        await asyncio.sleep(0)
+        # 送信中に要求された更新
+        cog._request_summary_update(clan_data, 3)
+        await asyncio.sleep(0.01)
+        edit.assert_not_awaited()
+        sent.set()
+        await send_task
+        await asyncio.sleep(0.01)
+        channel.get_partial_message.assert_called_with(123)
+        edit.assert_awaited_once()
+        cog.summary_updater.close()
+    asyncio.run(run())